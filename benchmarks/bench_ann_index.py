@@ -0,0 +1,67 @@
+"""
+Recall@k and per-query latency of the IVF approximate index against the exact
+brute-force cosine search, for a range of nprobe values.
+
+Without --emb-file a clustered synthetic vocabulary is used; uniformly random
+vectors have no neighbourhood structure and are a worst case for any ANN index.
+
+Usage:
+    python benchmarks/bench_ann_index.py
+    python benchmarks/bench_ann_index.py --emb-file vectors.npy --n-lists 2048 --nprobe 1 4 16 64
+"""
+import argparse
+import time
+import numpy as np
+from matstract.models.ann_index import IVFIndex
+from matstract.models.word_embeddings import normalize_rows, top_k_indices
+
+
+def synthetic_vocabulary(vocab_size, dim, n_topics=2000, seed=0):
+    rng = np.random.RandomState(seed)
+    topics = rng.standard_normal((n_topics, dim))
+    vectors = topics[rng.randint(0, n_topics, vocab_size)] + 1.2 * rng.standard_normal((vocab_size, dim))
+    return vectors.astype(np.float16)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--emb-file", default=None, help="word embeddings .npy, synthetic if not given")
+    parser.add_argument("--vocab-size", type=int, default=300000, help="rows of the synthetic matrix")
+    parser.add_argument("--dim", type=int, default=200, help="columns of the synthetic matrix")
+    parser.add_argument("--n-lists", type=int, default=None)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument("--top-k", type=int, default=8)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    if args.emb_file is not None:
+        embeddings = np.load(args.emb_file, mmap_mode="r")
+    else:
+        embeddings = synthetic_vocabulary(args.vocab_size, args.dim)
+    normalized = normalize_rows(embeddings)
+    queries = normalized[np.random.RandomState(1).randint(0, normalized.shape[0], args.queries)]
+
+    start = time.perf_counter()
+    index = IVFIndex.build(normalized, n_lists=args.n_lists)
+    print("vocabulary {} x {}, {} lists, built in {:.1f}s".format(
+        normalized.shape[0], normalized.shape[1], index.n_lists, time.perf_counter() - start))
+
+    start = time.perf_counter()
+    exact = []
+    for query in queries:
+        exact.append(top_k_indices(np.dot(normalized, query)[np.newaxis, :], args.top_k)[0])
+    exact_latency = 1000 * (time.perf_counter() - start) / len(queries)
+    print("{:<10}{:>14}{:>14}".format("nprobe", "recall@{}".format(args.top_k), "latency (ms)"))
+    print("{:<10}{:>14.3f}{:>14.2f}".format("exact", 1.0, exact_latency))
+
+    for nprobe in args.nprobe:
+        start = time.perf_counter()
+        approx = [index.search(query[np.newaxis, :], normalized, args.top_k, nprobe=nprobe)[0][0]
+                  for query in queries]
+        latency = 1000 * (time.perf_counter() - start) / len(queries)
+        recall = np.mean([len(np.intersect1d(a, e)) / float(len(e)) for a, e in zip(approx, exact)])
+        print("{:<10}{:>14.3f}{:>14.2f}".format(nprobe, recall, latency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Compares the startup time and memory of N worker processes that each load the
+mat2vec embedding matrices, with and without memory-mapping.
+
+Every worker is started with the "spawn" method (like separate gunicorn workers
+that were not forked after loading), loads the matrices, runs one similarity
+query so that all pages are touched and reports its RSS and PSS. PSS splits
+shared pages between the processes that map them, so its sum over the workers
+is the real memory cost of the whole pool.
+
+Usage:
+    python benchmarks/bench_engine_memory.py --workers 4
+    python benchmarks/bench_engine_memory.py --workers 4 --emb-file vectors.npy --out-emb-file syn1neg.npy
+    python benchmarks/bench_engine_memory.py --workers 4 --engine  # full EmbeddingEngine, downloads from S3
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+import numpy as np
+
+
+def _memory_kb():
+    """Returns (rss, pss) of the current process in kB, pss is None if not available"""
+    rss, pss = None, None
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                rss = int(line.split()[1])
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    pss = int(line.split()[1])
+    except IOError:
+        pass
+    return rss, pss
+
+
+def _worker(args):
+    emb_file, out_emb_file, mmap_mode, use_engine, barrier = args
+    start = time.perf_counter()
+    if use_engine:
+        from matstract.models.word_embeddings import EmbeddingEngine
+        ee = EmbeddingEngine(mmap_mode=mmap_mode)
+        embeddings, norm = ee.embeddings, ee.norm
+    else:
+        embeddings = np.load(emb_file, mmap_mode=mmap_mode)
+        np.load(out_emb_file, mmap_mode=mmap_mode)
+        norm = np.sqrt(np.sum(np.square(embeddings, dtype=np.float32), 1, keepdims=True))
+    load_time = time.perf_counter() - start
+
+    # a single query touches every row of the matrix
+    query = np.asarray(embeddings[0], dtype=np.float32)
+    np.dot(embeddings, query) / norm[:, 0]
+
+    # measure only once all the workers are alive, so shared pages are split between all of them
+    barrier.wait()
+    rss, pss = _memory_kb()
+    barrier.wait()
+    return load_time, rss, pss
+
+
+def run(workers, emb_file, out_emb_file, mmap_mode, use_engine):
+    ctx = multiprocessing.get_context("spawn")
+    manager = ctx.Manager()
+    barrier = manager.Barrier(workers)
+    with ctx.Pool(workers) as pool:
+        results = pool.map(_worker, [(emb_file, out_emb_file, mmap_mode, use_engine, barrier)] * workers)
+    manager.shutdown()
+    return results
+
+
+def report(label, results):
+    load_times, rss, pss = zip(*results)
+    print("{}:".format(label))
+    print("  load time per worker: mean {:.3f}s, max {:.3f}s".format(np.mean(load_times), np.max(load_times)))
+    print("  RSS per worker: {:.1f} MB, total {:.1f} MB".format(np.mean(rss) / 1024, np.sum(rss) / 1024))
+    if all(p is not None for p in pss):
+        print("  PSS per worker: {:.1f} MB, total {:.1f} MB".format(np.mean(pss) / 1024, np.sum(pss) / 1024))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--emb-file", default=None, help="word embeddings .npy, synthetic if not given")
+    parser.add_argument("--out-emb-file", default=None, help="output embeddings .npy, synthetic if not given")
+    parser.add_argument("--vocab-size", type=int, default=500000, help="rows of the synthetic matrices")
+    parser.add_argument("--dim", type=int, default=200, help="columns of the synthetic matrices")
+    parser.add_argument("--engine", action="store_true", help="load the full EmbeddingEngine instead")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        emb_file, out_emb_file = args.emb_file, args.out_emb_file
+        if not args.engine and (emb_file is None or out_emb_file is None):
+            rng = np.random.RandomState(0)
+            emb_file = os.path.join(tmp, "embeddings.npy")
+            out_emb_file = os.path.join(tmp, "out_embeddings.npy")
+            for f in (emb_file, out_emb_file):
+                np.save(f, rng.standard_normal((args.vocab_size, args.dim)).astype(np.float16))
+        print("{} workers".format(args.workers))
+        report("np.load (before)", run(args.workers, emb_file, out_emb_file, None, args.engine))
+        report("np.load(mmap_mode='r') (after)", run(args.workers, emb_file, out_emb_file, "r", args.engine))
+
+
+if __name__ == "__main__":
+    main()
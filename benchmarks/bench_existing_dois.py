@@ -0,0 +1,94 @@
+"""
+Cost of skipping already tokenized abstracts in DataPreparation.tokenize_abstracts, with synthetic
+DOIs: half of the raw abstracts are already tokenized. Compares the old list membership (measured on
+a sample of lookups and extrapolated, a full run is quadratic) with a set built from a DOI-only cursor.
+
+With --mongo-uri, the same data is written to a scratch database on that server (dropped afterwards)
+and the two server-side strategies are timed end to end: projected DOI cursor into a set while
+streaming the raw abstracts, and the $lookup anti-join that only streams untokenized abstracts.
+
+Usage:
+    python benchmarks/bench_existing_dois.py
+    python benchmarks/bench_existing_dois.py --sizes 100000 1000000
+    python benchmarks/bench_existing_dois.py --sizes 100000 --mongo-uri mongodb://localhost:27017
+"""
+import argparse
+import random
+import time
+
+
+def synthetic_dois(n, seed=0):
+    rng = random.Random(seed)
+    return ["10.{}/j.{}.{}".format(rng.randint(1000, 9999), rng.randint(2000, 2018), i) for i in range(n)]
+
+
+def in_memory(n, n_list_lookups=200):
+    raw = synthetic_dois(n)
+    tokenized_docs = [{"doi": doi} for doi in raw[::2]]
+
+    start = time.perf_counter()
+    existing_list = [doc["doi"] for doc in tokenized_docs]
+    queries = random.Random(1).sample(raw, n_list_lookups)
+    for doi in queries:
+        doi not in existing_list
+    list_time = (time.perf_counter() - start) * n / n_list_lookups
+
+    start = time.perf_counter()
+    existing_set = set(doc["doi"] for doc in tokenized_docs)
+    to_tokenize = sum(1 for doi in raw if doi not in existing_set)
+    set_time = time.perf_counter() - start
+    assert to_tokenize == n // 2
+    return list_time, set_time
+
+
+def on_server(uri, n, batch_size=10000):
+    import pymongo
+    from matstract.nlp.data_preparation import DataPreparation
+    client = pymongo.MongoClient(uri)
+    db = client["matstract_bench_existing_dois"]
+    try:
+        raw = synthetic_dois(n)
+        for i in range(0, n, batch_size):
+            db[DataPreparation.RAW_ABSTRACT_COL].insert_many(
+                [{"doi": doi, "title": "title", "abstract": "abstract"} for doi in raw[i:i + batch_size]])
+            db[DataPreparation.TOK_ABSTRACT_COL].insert_many(
+                [{"doi": doi, "title": [], "abstract": []} for doi in raw[i:i + batch_size:2]])
+        db[DataPreparation.TOK_ABSTRACT_COL].create_index("doi", unique=True)
+
+        dp = DataPreparation.__new__(DataPreparation)
+        dp._db = db
+
+        start = time.perf_counter()
+        existing = dp._tokenized_dois()
+        streamed = sum(1 for a in dp._get_abstracts(sample=False) if a["doi"] not in existing)
+        set_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        streamed_lookup = sum(1 for _ in dp._get_abstracts(sample=False, only_untokenized=True))
+        lookup_time = time.perf_counter() - start
+        assert streamed == streamed_lookup == n - len(raw[::2])
+        return set_time, lookup_time
+    finally:
+        client.drop_database(db.name)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--sizes", type=int, nargs="+", default=[100000, 1000000], help="numbers of raw abstracts")
+    arg_parser.add_argument("--mongo-uri", default=None, help="MongoDB server for the end to end comparison")
+    args = arg_parser.parse_args()
+
+    print("{:>10}{:>22}{:>16}".format("abstracts", "list (extrapolated)", "set"))
+    for n in args.sizes:
+        list_time, set_time = in_memory(n)
+        print("{:>10}{:>21.0f}s{:>15.3f}s".format(n, list_time, set_time))
+
+    if args.mongo_uri is not None:
+        print("\n{:>10}{:>22}{:>16}".format("abstracts", "projected set", "$lookup"))
+        for n in args.sizes:
+            set_time, lookup_time = on_server(args.mongo_uri, n)
+            print("{:>10}{:>21.2f}s{:>15.2f}s".format(n, set_time, lookup_time))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Formulas per second through MaterialParser without the formula cache, so that every formula
+goes through the bracket and element tokenizers. The synthetic formulas only have numeric
+amounts (no sympy), with brackets nested up to three levels.
+
+Usage:
+    python benchmarks/bench_formula_throughput.py
+    python benchmarks/bench_formula_throughput.py --n 20000 --formulas-file formulas.txt
+"""
+import argparse
+import random
+import time
+from matstract.extract.parsing import MaterialParser
+
+ELEMENTS = ["Li", "Fe", "P", "O", "Sr", "Ti", "Zr", "Ba", "Co", "Ni", "Mn", "La", "C", "N", "H", "S", "Ca", "Cu"]
+AMOUNTS = ["", "", "2", "3", "4", "0.5", "0.25", "1.5", "0.1", "12", "1/3"]
+
+
+def synthetic_formulas(n, seed=0):
+    rng = random.Random(seed)
+
+    def unit(length):
+        return "".join(rng.choice(ELEMENTS) + rng.choice(AMOUNTS) for _ in range(length))
+
+    def group(depth):
+        if depth == 0:
+            return unit(rng.randint(1, 3))
+        return unit(rng.randint(0, 2)) + "(" + group(depth - 1) + ")" + rng.choice(AMOUNTS[2:]) + unit(rng.randint(0, 2))
+
+    return [group(rng.choice([0, 0, 1, 1, 2, 3])) for _ in range(n)]
+
+
+def formulas_per_second(func, formulas):
+    start = time.perf_counter()
+    for formula in formulas:
+        func(formula)
+    return len(formulas) / (time.perf_counter() - start)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--formulas-file", default=None, help="one formula per line, synthetic if not given")
+    arg_parser.add_argument("--n", type=int, default=5000, help="number of synthetic formulas")
+    args = arg_parser.parse_args()
+
+    if args.formulas_file is not None:
+        with open(args.formulas_file, encoding="utf-8") as f:
+            formulas = [line.strip() for line in f if line.strip()]
+    else:
+        formulas = synthetic_formulas(args.n)
+    parser = MaterialParser(cache_size=0)
+    print("{} formulas, e.g. {}".format(len(formulas), ", ".join(formulas[:3])))
+    print("{:<28}{:>14}".format("", "formulas/s"))
+    print("{:<28}{:>14.0f}".format("parse_formula", formulas_per_second(parser.parse_formula, formulas)))
+    print("{:<28}{:>14.0f}".format("get_structure_by_formula",
+                                   formulas_per_second(parser.get_structure_by_formula, formulas)))
+
+
+if __name__ == "__main__":
+    main()
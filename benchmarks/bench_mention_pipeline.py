@@ -0,0 +1,33 @@
+"""
+Documents per second and per-stage timings of the streaming mention extraction pipeline
+(ChemDataExtractor + SimpleParser) over a JSONL file of abstracts, written to a scratch
+directory so that every run starts from scratch.
+
+Usage:
+    python benchmarks/bench_mention_pipeline.py abstracts.jsonl
+    python benchmarks/bench_mention_pipeline.py abstracts.jsonl --workers 8 --batch-size 200
+"""
+import argparse
+import tempfile
+from matstract.extract.mention_pipeline import extract_mentions, STAGES
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("abstracts_file", help="one {doi, title, abstract} document per line")
+    arg_parser.add_argument("--workers", type=int, default=None, help="number of processes, all CPUs by default")
+    arg_parser.add_argument("--batch-size", type=int, default=500, help="abstracts per worker batch")
+    args = arg_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        stats = extract_mentions(args.abstracts_file, output_dir, batch_size=args.batch_size,
+                                 workers=args.workers, resume=False)
+    print("{} docs, {} rows, {} parts in {:.1f} s: {:.1f} docs/s".format(
+        stats["docs"], stats["rows"], stats["parts"], stats["seconds"], stats["docs_per_second"]))
+    for stage in STAGES:
+        print("{:<12}{:>10.2f} s".format(stage, stats[stage]))
+    print("(cde and normalize are summed over the workers)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Evaluating mixture compositions over a grid of x values: substituting into the get_mixture
+strings with sympy (one substitution per component, element and x) against building a
+MixtureForm once and evaluating it with array arithmetic. The grid covers 0 <= x <= 1
+(and 0 <= δ <= 0.1 where present).
+
+Usage:
+    python benchmarks/bench_mixture_form.py
+    python benchmarks/bench_mixture_form.py --points 1001
+"""
+import argparse
+import time
+import numpy as np
+import sympy
+from matstract.extract.parsing import MaterialParser, MixtureForm, _SYMPY_NAMESPACE
+
+MIXTURES = [
+    "(1-x)BaTiO3-xSrTiO3", "(1-x)Pb(Zr0.52Ti0.48)O3-xBiScO3", "(1-x)(0.5BaTiO3-0.5CaTiO3)-x(Bi0.5Na0.5)TiO3",
+    "(1-x)ZrO2-xY2O3-δ", "(1-x)Cu2-xSe-xZnS", "(1-x)KNbO3-xNaNbO3", "(1-x)BiFeO3-xBaTiO3",
+    "(1-x)Na0.5Bi0.5TiO3-xBaTiO3", "(1-x)LaMnO3-xSrMnO3", "(1-x)PbTiO3-xBi(Mg0.5Ti0.5)O3",
+]
+
+
+def sympy_compositions(mixture, grid):
+    variables = sorted(grid)
+    amounts = []
+    for values in zip(*[grid[v] for v in variables]):
+        substitutions = {sympy.Symbol(v): value for v, value in zip(variables, values)}
+        composition = {}
+        for part in mixture.values():
+            for el, amt in part["composition"].items():
+                expression = sympy.sympify("({})*({})".format(part["fraction"], amt), _SYMPY_NAMESPACE)
+                composition[el] = composition.get(el, 0) + float(expression.subs(substitutions))
+        amounts.append(composition)
+    return amounts
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--points", type=int, default=101, help="number of x values")
+    args = arg_parser.parse_args()
+
+    parser = MaterialParser()
+    mixtures = [parser.get_mixture(name) for name in MIXTURES]
+    grid = {"x": np.linspace(0, 1, args.points), "δ": np.linspace(0, 0.1, args.points)}
+    n_evaluations = len(mixtures) * args.points
+
+    start = time.perf_counter()
+    for mixture in mixtures:
+        sympy_compositions(mixture, grid)
+    sympy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    forms = [MixtureForm.from_mixture(mixture) for mixture in mixtures]
+    build_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for form in forms:
+        form.compositions({v: grid[v] for v in form.variables})
+    array_time = time.perf_counter() - start
+
+    elements = sorted(set(el for form in forms for el in form.elements))
+    start = time.perf_counter()
+    stacked = np.stack([form.compositions({v: grid[v] for v in form.variables}, elements=elements)
+                        for form in forms])
+    distances = np.abs(stacked[:, None] - stacked[None, :]).sum(axis=-1)
+    compare_time = time.perf_counter() - start
+
+    print("{} mixtures x {} points".format(len(mixtures), args.points))
+    print("{:<36}{:>14}".format("", "compositions/s"))
+    print("{:<36}{:>14.0f}".format("sympy substitution", n_evaluations / sympy_time))
+    print("{:<36}{:>14.0f}".format("MixtureForm, including build", n_evaluations / (build_time + array_time)))
+    print("{:<36}{:>14.0f}".format("MixtureForm, evaluation only", n_evaluations / array_time))
+    print("pairwise L1 distances over the grid ({}): {:.4f} s".format("x".join(map(str, distances.shape)),
+                                                                      compare_time))
+
+
+if __name__ == "__main__":
+    main()
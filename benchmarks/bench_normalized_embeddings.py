@@ -0,0 +1,71 @@
+"""
+Per-query latency and peak allocation of a close-words style query, comparing the
+old per-call `embeddings / norm` with the precomputed normalized matrix.
+
+Usage:
+    python benchmarks/bench_normalized_embeddings.py
+    python benchmarks/bench_normalized_embeddings.py --emb-file vectors.npy --queries 20
+"""
+import argparse
+import time
+import tracemalloc
+import numpy as np
+from matstract.models.word_embeddings import normalize_rows
+
+
+def query_before(embeddings, norm, index):
+    normalized_embeddings = embeddings / norm
+    word_embedding = normalized_embeddings[index, :]
+    return np.dot([word_embedding], normalized_embeddings.T)
+
+
+def query_after(normalized_embeddings, index):
+    word_embedding = normalized_embeddings[index, :]
+    return np.dot([word_embedding], normalized_embeddings.T)
+
+
+def measure(func, args_list):
+    """Returns the mean latency in ms and the peak traced allocation in MB"""
+    latencies = []
+    peak = 0
+    for args in args_list:
+        tracemalloc.start()
+        start = time.perf_counter()
+        func(*args)
+        latencies.append(time.perf_counter() - start)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return 1000 * np.mean(latencies), peak / 1024 ** 2
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--emb-file", default=None, help="word embeddings .npy, synthetic if not given")
+    parser.add_argument("--vocab-size", type=int, default=500000, help="rows of the synthetic matrix")
+    parser.add_argument("--dim", type=int, default=200, help="columns of the synthetic matrix")
+    parser.add_argument("--queries", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.emb_file is not None:
+        embeddings = np.load(args.emb_file, mmap_mode="r")
+    else:
+        embeddings = np.random.RandomState(0).standard_normal((args.vocab_size, args.dim)).astype(np.float16)
+    norm = np.sqrt(np.sum(np.square(embeddings), 1, keepdims=True))
+    indices = np.random.RandomState(1).randint(0, embeddings.shape[0], args.queries)
+    print("vocabulary: {} x {} {}".format(embeddings.shape[0], embeddings.shape[1], embeddings.dtype))
+
+    print("{:<28}{:>14}{:>18}".format("", "latency (ms)", "peak alloc (MB)"))
+    latency, peak = measure(query_before, [(embeddings, norm, i) for i in indices])
+    print("{:<28}{:>14.2f}{:>18.1f}".format("embeddings / norm per call", latency, peak))
+    for dtype in (np.float32, np.float16):
+        start = time.perf_counter()
+        normalized = normalize_rows(embeddings, dtype=dtype)
+        build_time = time.perf_counter() - start
+        latency, peak = measure(query_after, [(normalized, i) for i in indices])
+        label = "precomputed {}".format(np.dtype(dtype).name)
+        print("{:<28}{:>14.2f}{:>18.1f}   (built once in {:.2f}s, {:.1f} MB)".format(
+            label, latency, peak, build_time, normalized.nbytes / 1024 ** 2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Throughput of MaterialParser.parse_formula on a stream of material mentions: with sympy for
+every amount (the old behaviour), with the numeric fast path, and with the fast path and the
+formula cache. Mentions repeat with a Zipf-like distribution, as they do in abstracts.
+
+Usage:
+    python benchmarks/bench_parse_formula.py
+    python benchmarks/bench_parse_formula.py --mentions-file mentions.txt --n 20000
+"""
+import argparse
+import random
+import time
+from matstract.extract import parsing
+from matstract.extract.parsing import MaterialParser
+
+MENTIONS = [
+    "LiFePO4", "Li2(FePO4)2", "Sr(Zr0.5Ti0.5)O3", "Fe2O3", "TiO2", "ZnO", "BaTiO3", "LiCoO2", "LiMn2O4",
+    "Li4Ti5O12", "LiNi0.8Co0.15Al0.05O2", "LiNi1/3Mn1/3Co1/3O2", "Ba0.5Sr0.5Co0.8Fe0.2O3-δ", "YBa2Cu3O7-δ",
+    "CH3NH3PbI3", "Cu2ZnSnS4", "CdTe", "CdS", "GaN", "GaAs", "MoS2", "WSe2", "Bi2Te3", "PbTe", "SnSe",
+    "Pb(Zr0.52Ti0.48)O3", "(Bi0.5Na0.5)TiO3", "Ca10(PO4)6(OH)2", "Li7La3Zr2O12", "NaxCoO2", "TiO2-x",
+    "La1-xSrxMnO3", "Mg2Si", "CoFe2O4", "NiFe2O4", "Fe3O4", "Al2O3", "SiO2", "ZrO2", "CeO2", "In2O3",
+    "SrTiO3", "LaAlO3", "KNbO3", "Na0.5K0.5NbO3", "Cu(In,Ga)Se2", "Zn1-xMgxO", "Ti3C2", "Si3N4", "BN",
+]
+
+
+def mention_stream(mentions, n, seed=0):
+    rng = random.Random(seed)
+    weights = [1.0 / (rank + 1) for rank in range(len(mentions))]
+    return rng.choices(mentions, weights=weights, k=n)
+
+
+def throughput(parser, stream):
+    start = time.perf_counter()
+    for mention in stream:
+        try:
+            parser.parse_formula(mention)
+        except Exception:
+            pass
+    return len(stream) / (time.perf_counter() - start)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--mentions-file", default=None, help="one mention per line, built-in list if not given")
+    arg_parser.add_argument("--n", type=int, default=5000, help="length of the mention stream")
+    args = arg_parser.parse_args()
+
+    if args.mentions_file is not None:
+        with open(args.mentions_file, encoding="utf-8") as f:
+            mentions = [line.strip() for line in f if line.strip()]
+    else:
+        mentions = MENTIONS
+    stream = mention_stream(mentions, args.n)
+    print("{} mentions, {} distinct".format(len(stream), len(set(stream))))
+
+    simplify_numeric = parsing._simplify_numeric
+    parsing._simplify_numeric = lambda value: None
+    try:
+        sympy_only = throughput(MaterialParser(cache_size=0), stream)
+    finally:
+        parsing._simplify_numeric = simplify_numeric
+    fast_path = throughput(MaterialParser(cache_size=0), stream)
+    cached_parser = MaterialParser()
+    cached = throughput(cached_parser, stream)
+
+    print("{:<24}{:>14}".format("", "mentions/s"))
+    print("{:<24}{:>14.0f}".format("sympy for every amount", sympy_only))
+    print("{:<24}{:>14.0f}".format("numeric fast path", fast_path))
+    print("{:<24}{:>14.0f}".format("fast path + cache", cached))
+    print(cached_parser.cache_info())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""
+Throughput and regression benchmark of the three formula parsers in matstract.extract.parsing
+(MaterialParser.parse_formula without its cache, SimplifiedMaterialParser.parse_formula and
+SimpleParser.parse with an empty memo) over the fixed corpus of real formulas (plus
+non-formula tokens) in benchmarks/data/formulas.tsv.
+
+Reports per parser and input category: formulas/s, p50/p99 latency, acceptance rate, the peak
+memory allocated during a pass over the corpus, and how often the parsers agree. MaterialParser
+and SimpleParser agree on a formula if both reject it or both give the same canonical composition;
+SimplifiedMaterialParser returns nothing, so only acceptance (no exception) is compared.
+
+--save stores the numbers and a digest of every parser's outputs; --baseline compares a run with a
+saved one and exits with status 1 if any parser's outputs changed or it got slower than the tolerance.
+
+Usage:
+    python benchmarks/bench_parsers.py
+    python benchmarks/bench_parsers.py --save baseline.json
+    python benchmarks/bench_parsers.py --baseline baseline.json --tolerance 0.2 --no-memory
+    python benchmarks/bench_parsers.py --corpus my_formulas.tsv --parsers MaterialParser SimpleParser
+"""
+import argparse
+import collections
+import contextlib
+import hashlib
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+import warnings
+import numpy as np
+from matstract.extract import parsing
+from matstract.extract.parsing import MaterialParser, SimplifiedMaterialParser, SimpleParser
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "formulas.tsv")
+
+
+def load_corpus(path):
+    corpus = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("#") or not line.strip("\n"):
+                continue
+            category, formula = line.rstrip("\n").split("\t", 1)
+            corpus.append((category, formula))
+    return corpus
+
+
+def canonical_from_composition(composition):
+    """Canonical form of a MaterialParser composition, None if an amount is not a number"""
+    try:
+        amounts = {el: float(amt) for el, amt in composition.items()}
+    except ValueError:
+        return None
+    if not amounts or any(amt <= 0 for amt in amounts.values()):
+        return None
+    return parsing._matgen_normalize("".join("{}{}".format(el, amt) for el, amt in sorted(amounts.items()))) or None
+
+
+def material_parser():
+    parser = MaterialParser(cache_size=0)
+
+    def parse(formula):
+        composition = parser.parse_formula(formula)
+        return sorted(composition.items()) if composition else None
+    return parse
+
+
+def simplified_material_parser():
+    parser = SimplifiedMaterialParser()
+
+    def parse(formula):
+        parser.parse_formula(formula)
+        return True
+    return parse
+
+
+def simple_parser():
+    parsing._normalized_formulas.cache_clear()
+    return SimpleParser().parse
+
+
+PARSERS = collections.OrderedDict([
+    ("MaterialParser", material_parser),
+    ("SimplifiedMaterialParser", simplified_material_parser),
+    ("SimpleParser", simple_parser),
+])
+
+
+def run(make_parser, formulas):
+    """
+    :return: (outputs, per-call latencies in seconds); the output is None for rejected formulas
+    """
+    parse = make_parser()
+    outputs = []
+    latencies = np.empty(len(formulas))
+    for i, formula in enumerate(formulas):
+        start = time.perf_counter()
+        try:
+            output = parse(formula)
+        except Exception:
+            output = None
+        latencies[i] = time.perf_counter() - start
+        outputs.append(output or None)
+    return outputs, latencies
+
+
+def peak_memory(make_parser, formulas):
+    tracemalloc.start()
+    try:
+        run(make_parser, formulas)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def digest(outputs):
+    return hashlib.sha1(json.dumps(outputs, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--corpus", default=CORPUS, help="<category>\\t<formula> lines")
+    arg_parser.add_argument("--parsers", nargs="+", choices=list(PARSERS), default=list(PARSERS))
+    arg_parser.add_argument("--no-memory", action="store_true",
+                            help="skip the memory pass, which is slow for MaterialParser")
+    arg_parser.add_argument("--save", default=None, help="write the results to this .json file")
+    arg_parser.add_argument("--baseline", default=None, help="compare with the results saved in this .json file")
+    arg_parser.add_argument("--tolerance", type=float, default=0.2,
+                            help="allowed relative slowdown against the baseline")
+    args = arg_parser.parse_args()
+    warnings.filterwarnings("ignore")
+
+    corpus = load_corpus(args.corpus)
+    categories = sorted(set(category for category, _ in corpus))
+    formulas = [formula for _, formula in corpus]
+    by_category = {c: np.array([category == c for category, _ in corpus]) for c in categories}
+    print("{} formulas: {}".format(len(corpus), ", ".join("{} {}".format(c, by_category[c].sum())
+                                                           for c in categories)))
+
+    results = collections.OrderedDict()
+    outputs = dict()
+    print("\n{:<26}{:<12}{:>12}{:>10}{:>10}{:>10}".format("parser", "category", "formulas/s", "p50 us",
+                                                          "p99 us", "accepted"))
+    for name in args.parsers:
+        # the old parsers print as they go
+        with contextlib.redirect_stdout(io.StringIO()):
+            outputs[name], latencies = run(PARSERS[name], formulas)
+            memory = None if args.no_memory else peak_memory(PARSERS[name], formulas)
+        accepted = np.array([output is not None for output in outputs[name]])
+        results[name] = dict(formulas_per_second=len(formulas) / latencies.sum(),
+                             p50_us=np.percentile(latencies, 50) * 1e6,
+                             p99_us=np.percentile(latencies, 99) * 1e6,
+                             peak_kib=None if memory is None else memory / 1024,
+                             outputs=digest(outputs[name]))
+        for category in categories + ["all"]:
+            mask = by_category[category] if category != "all" else np.ones(len(formulas), dtype=bool)
+            print("{:<26}{:<12}{:>12.0f}{:>10.1f}{:>10.1f}{:>10.1%}".format(
+                name, category, mask.sum() / latencies[mask].sum(), np.percentile(latencies[mask], 50) * 1e6,
+                np.percentile(latencies[mask], 99) * 1e6, accepted[mask].mean()))
+        if memory is not None:
+            print("{:<26}peak memory {:.0f} KiB".format(name, memory / 1024))
+
+    print("\nagreement")
+    canonical = dict()
+    if "MaterialParser" in outputs:
+        canonical["MaterialParser"] = [canonical_from_composition(dict(output)) if output else None
+                                       for output in outputs["MaterialParser"]]
+    if "SimpleParser" in outputs:
+        canonical["SimpleParser"] = outputs["SimpleParser"]
+    names = list(outputs)
+    for i, first in enumerate(names):
+        for second in names[i + 1:]:
+            if first in canonical and second in canonical:
+                same = np.array([a == b for a, b in zip(canonical[first], canonical[second])])
+                kind = "same canonical composition"
+            else:
+                same = np.array([(a is None) == (b is None) for a, b in zip(outputs[first], outputs[second])])
+                kind = "same acceptance"
+            print("{} / {} ({}): {}".format(first, second, kind, ", ".join(
+                "{} {:.1%}".format(c, same[by_category[c]].mean()) for c in categories)))
+
+    if args.save is not None:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(dict(corpus=digest(formulas), parsers=results), f, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline["corpus"] != digest(formulas):
+            print("\nthe baseline was measured on a different corpus")
+            sys.exit(1)
+        regressions = []
+        print("\n{:<26}{:>16}{:>16}".format("against baseline", "speed", "outputs"))
+        for name, result in results.items():
+            if name not in baseline["parsers"]:
+                continue
+            ratio = result["formulas_per_second"] / baseline["parsers"][name]["formulas_per_second"]
+            same = result["outputs"] == baseline["parsers"][name]["outputs"]
+            print("{:<26}{:>15.2f}x{:>16}".format(name, ratio, "same" if same else "CHANGED"))
+            if not same or ratio < 1 - args.tolerance:
+                regressions.append(name)
+        if regressions:
+            print("regressions: {}".format(", ".join(regressions)))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Construction time and throughput (tokens/second) of PhraseTokenizer, and of the
+gensim Phraser that EmbeddingEngine used to build from the vocabulary (only with
+gensim 3.x, whose Phrases vocab could be filled in directly). With gensim 3.x it
+also checks that both produce identical output.
+
+Usage:
+    python benchmarks/bench_phrases.py
+    python benchmarks/bench_phrases.py --vocab-file bundle/vocabulary.txt
+"""
+import argparse
+import random
+import time
+from collections import defaultdict
+from matstract.nlp.phrases import PhraseTokenizer
+
+
+def synthetic_vocabulary(n_words=300000, n_phrases=200000, seed=0):
+    rng = random.Random(seed)
+    words = ["w{}".format(i) for i in range(n_words)]
+    common_words = words[:n_words // 10]
+    phrases = set()
+    while len(phrases) < n_phrases:
+        phrases.add("_".join(rng.choice(common_words) for _ in range(rng.choice([2, 2, 2, 3]))))
+    return words + sorted(phrases)
+
+
+def sample_sentences(vocabulary, n_sentences, length=25, seed=1):
+    """Sentences of single words, with phrases split back into their words"""
+    rng = random.Random(seed)
+    sentences = []
+    for _ in range(n_sentences):
+        sentence = []
+        while len(sentence) < length:
+            sentence.extend(rng.choice(vocabulary).split("_"))
+        sentences.append(sentence)
+    return sentences
+
+
+def gensim_phraser(vocabulary):
+    """The construction previously used in EmbeddingEngine.__init__"""
+    import gensim
+    if int(gensim.__version__.split(".")[0]) >= 4:
+        return None
+    from gensim.models.phrases import Phraser, Phrases
+    phrases = Phrases(threshold=0.0001, min_count=1)
+    vocab = defaultdict(int)
+    for word in vocabulary:
+        vocab[str.encode(word)] = 100 if "_" in word else 1
+    phrases.vocab = vocab
+    return Phraser(phrases)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vocab-file", default=None, help="vocabulary, one word per line; synthetic if not given")
+    parser.add_argument("--sentences", type=int, default=20000)
+    args = parser.parse_args()
+
+    if args.vocab_file is not None:
+        with open(args.vocab_file, encoding="utf-8") as f:
+            vocabulary = f.read().split("\n")
+    else:
+        vocabulary = synthetic_vocabulary()
+    word2index = {word: i for i, word in enumerate(vocabulary)}
+    sentences = sample_sentences(vocabulary, args.sentences)
+    n_tokens = sum(len(s) for s in sentences)
+    print("vocabulary: {} entries, {} phrases; corpus: {} tokens".format(
+        len(vocabulary), sum("_" in w for w in vocabulary), n_tokens))
+
+    start = time.perf_counter()
+    tokenizer = PhraseTokenizer(word2index)
+    construction = time.perf_counter() - start
+    start = time.perf_counter()
+    phrased = tokenizer.phrase_sentences(sentences)
+    elapsed = time.perf_counter() - start
+    print("PhraseTokenizer: built in {:.2f}s, {:.0f} tokens/s".format(construction, n_tokens / elapsed))
+
+    try:
+        start = time.perf_counter()
+        phraser = gensim_phraser(vocabulary)
+        construction = time.perf_counter() - start
+    except ImportError:
+        phraser = None
+    if phraser is None:
+        print("gensim Phraser: skipped, needs gensim 3.x")
+        return
+    start = time.perf_counter()
+    gensim_phrased = [phraser[s] for s in sentences]
+    elapsed = time.perf_counter() - start
+    print("gensim Phraser: built in {:.2f}s, {:.0f} tokens/s".format(construction, n_tokens / elapsed))
+    print("identical output: {}".format(phrased == gensim_phrased))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Throughput of DataPreparation.process_sentence in tokens/s on tokenized abstracts: without the
+token cache (every token goes through the regexes and formula parsers), with an empty cache (the
+first pass over a corpus) and with a warm cache (e.g. a second pass, or queries in the web app).
+
+The abstracts are read from a JSONL file with the "title" and "abstract" fields of the tokenized
+collection (lists of sentences, each a list of tokens), or sampled from the tokenized collection
+itself. DataPreparation needs the database settings in either case (see AtlasConnection).
+
+Usage:
+    python benchmarks/bench_process_sentence.py --limit 2000
+    python benchmarks/bench_process_sentence.py --abstracts tokenized.jsonl --cache-size 100000
+"""
+import argparse
+import json
+import time
+from matstract.nlp.data_preparation import DataPreparation
+
+
+def load_sentences(path, limit=None):
+    sentences = []
+    with open(path, encoding="utf-8") as f:
+        for i, line in enumerate(f):
+            if limit is not None and i >= limit:
+                break
+            if line.strip():
+                abstract = json.loads(line)
+                sentences.extend((abstract.get("title") or []) + (abstract.get("abstract") or []))
+    return sentences
+
+
+def sample_sentences(dp, limit):
+    sentences = []
+    for abstract in dp._get_abstracts(limit=limit, sample=True, col=dp.TOK_ABSTRACT_COL):
+        sentences.extend((abstract.get(dp.TTL_FILED) or []) + (abstract.get(dp.ABS_FIELD) or []))
+    return sentences
+
+
+def throughput(dp, sentences):
+    n_tokens = sum(len(sentence) for sentence in sentences)
+    start = time.perf_counter()
+    outputs = [dp.process_sentence(sentence, collect_materials=True) for sentence in sentences]
+    return n_tokens / (time.perf_counter() - start), outputs
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--abstracts", default=None, help="JSONL file of tokenized abstracts")
+    arg_parser.add_argument("--limit", type=int, default=2000, help="number of abstracts")
+    arg_parser.add_argument("--cache-size", type=int, default=100000, help="token_cache_size of the cached runs")
+    args = arg_parser.parse_args()
+
+    uncached = DataPreparation(token_cache_size=0)
+    if args.abstracts is not None:
+        sentences = load_sentences(args.abstracts, args.limit)
+    else:
+        sentences = sample_sentences(uncached, args.limit)
+    tokens = [tok for sentence in sentences for tok in sentence]
+    print("{} sentences, {} tokens, {} distinct".format(len(sentences), len(tokens), len(set(tokens))))
+
+    no_cache, expected = throughput(uncached, sentences)
+    cached = DataPreparation(token_cache_size=args.cache_size)
+    cold, cold_outputs = throughput(cached, sentences)
+    warm, warm_outputs = throughput(cached, sentences)
+    assert cold_outputs == warm_outputs == expected
+    assert cached.mat_list == uncached.mat_list * 2
+
+    print("{:<12}{:>14}{:>10}".format("cache", "tokens/s", "speedup"))
+    for name, tokens_per_second in (("none", no_cache), ("cold", cold), ("warm", warm)):
+        print("{:<12}{:>14.0f}{:>9.1f}x".format(name, tokens_per_second, tokens_per_second / no_cache))
+    print("cached tokens: {}".format(len(cached._token_cache)))
+
+
+if __name__ == "__main__":
+    main()
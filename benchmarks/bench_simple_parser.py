@@ -0,0 +1,86 @@
+"""
+Tokens per second of SimpleParser.matgen_parser over tokenized abstracts, called three times
+per token as in ner_features.is_material_features (word, previous and next word), without
+and with the shared memo table, and the cost of the element check alone.
+
+Usage:
+    python benchmarks/bench_simple_parser.py
+    python benchmarks/bench_simple_parser.py --abstracts-file abstracts.txt
+"""
+import argparse
+import random
+import time
+import warnings
+from pymatgen.core.periodic_table import Element
+from matstract.extract import parsing
+from matstract.extract.parsing import SimpleParser
+
+WORDS = ("the of and in a to was were with for by is on as at from that this which films thin high temperature "
+         "phase structure properties electrochemical performance cathode anode band gap solar cell doped "
+         "nanoparticles synthesized annealing XRD TEM SEM DFT K eV nm In As At I Co No").split()
+MATERIALS = ["LiFePO4", "Fe2O3", "TiO2", "ZnO", "BaTiO3", "LiCoO2", "GaN", "CdTe", "MoS2", "SrTiO3", "Si", "Cu",
+             "Al2O3", "CeO2", "Li4Ti5O12", "CH3NH3PbI3", "Bi2Te3", "NiO", "Co3O4", "graphene", "SnO2", "Ag", "Au"]
+
+
+def synthetic_abstracts(n_abstracts=200, length=150, seed=0):
+    rng = random.Random(seed)
+    return [[rng.choice(MATERIALS) if rng.random() < 0.1 else rng.choice(WORDS) for _ in range(length)]
+            for _ in range(n_abstracts)]
+
+
+def tokens_per_second(parse, abstracts):
+    n_tokens = 0
+    start = time.perf_counter()
+    for tokens in abstracts:
+        for i, word in enumerate(tokens):
+            previous_word = tokens[i - 1] if i > 0 else ""
+            next_word = tokens[i + 1] if i < len(tokens) - 1 else ""
+            parse(word), parse(previous_word), parse(next_word)
+            n_tokens += 1
+    return n_tokens / (time.perf_counter() - start)
+
+
+def old_is_element(element):
+    try:
+        Element(element)
+        return True
+    except:
+        return False
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--abstracts-file", default=None,
+                            help="one abstract per line, split on whitespace; synthetic if not given")
+    args = arg_parser.parse_args()
+    warnings.filterwarnings("ignore")
+
+    if args.abstracts_file is not None:
+        with open(args.abstracts_file, encoding="utf-8") as f:
+            abstracts = [line.split() for line in f if line.strip()]
+    else:
+        abstracts = synthetic_abstracts()
+    tokens = [token for abstract in abstracts for token in abstract]
+    print("{} abstracts, {} tokens, {} distinct".format(len(abstracts), len(tokens), len(set(tokens))))
+
+    print("{:<32}{:>14}".format("", "tokens/s"))
+    print("{:<32}{:>14.0f}".format("matgen_parser, no memo", tokens_per_second(parsing._matgen_normalize, abstracts)))
+    parser = SimpleParser()
+    print("{:<32}{:>14.0f}".format("matgen_parser, shared memo", tokens_per_second(parser.matgen_parser, abstracts)))
+    info = SimpleParser.cache_info()
+    print("memo: {} hits, {} misses, hit rate {:.1%}".format(info.hits, info.misses,
+                                                              info.hits / max(1, info.hits + info.misses)))
+
+    start = time.perf_counter()
+    for token in tokens:
+        old_is_element(token)
+    old = len(tokens) / (time.perf_counter() - start)
+    start = time.perf_counter()
+    for token in tokens:
+        parser.is_element(token)
+    new = len(tokens) / (time.perf_counter() - start)
+    print("is_element: {:.0f} -> {:.0f} tokens/s".format(old, new))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+import itertools
+import json
+import os
+import time
+from multiprocessing import Pool
+import numpy as np
+from matstract.extract.parsing import TextParser, SimpleParser, _composition_key, _composition_hash
+
+CHECKPOINT_FILE = "checkpoint.json"
+PART_FILE = "part-{:05d}.npz"
+STAGES = ("read", "cde", "normalize", "write")
+
+
+def _read_jsonl(path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _timed_batches(docs, batch_size, stats):
+    docs = iter(docs)
+    while True:
+        start = time.perf_counter()
+        batch = [{"doi": doc.get("doi"), "text": " ".join(doc.get(field) or "" for field in ("title", "abstract"))}
+                 for doc in itertools.islice(docs, batch_size)]
+        stats["read"] += time.perf_counter() - start
+        if not batch:
+            return
+        yield batch
+
+
+def _extract_batch(batch):
+    """
+    Runs ChemDataExtractor and SimpleParser over a batch of documents
+    :param batch: list of {"doi": ..., "text": ...} dicts
+    :return: (list of (doi, mention, canonical) rows, number of documents, seconds in CDE,
+    seconds in normalization)
+    """
+    text_parser = TextParser()
+    simple_parser = SimpleParser()
+    start = time.perf_counter()
+    names = text_parser.extract_chemdata_many([doc["text"] for doc in batch])
+    cde = time.perf_counter() - start
+
+    start = time.perf_counter()
+    rows = []
+    for doc, records in zip(batch, names):
+        mentions = dict.fromkeys(name for record in records for name in record)
+        for mention in mentions:
+            rows.append((doc["doi"] or "", mention, simple_parser.parse(mention) or ""))
+    return rows, len(batch), cde, time.perf_counter() - start
+
+
+def _write_part(path, rows):
+    """
+    Writes rows as a dictionary-encoded column part: the distinct dois and mentions are stored
+    once, the rows as two int32 index columns, and the canonical forms and their composition
+    hashes (0 if there is no canonical form) aligned with the mentions.
+    """
+    dois = {}
+    mentions = {}
+    canonical = []
+    doi_idx = np.empty(len(rows), dtype=np.int32)
+    mention_idx = np.empty(len(rows), dtype=np.int32)
+    for i, (doi, mention, canonical_form) in enumerate(rows):
+        doi_idx[i] = dois.setdefault(doi, len(dois))
+        if mention not in mentions:
+            mentions[mention] = len(mentions)
+            canonical.append(canonical_form)
+        mention_idx[i] = mentions[mention]
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez_compressed(f,
+                            dois=np.array(list(dois), dtype=str),
+                            mentions=np.array(list(mentions), dtype=str),
+                            canonical=np.array(canonical, dtype=str),
+                            canonical_hash=np.array([_composition_hash(_composition_key(form)) or 0
+                                                     for form in canonical], dtype=np.int64),
+                            doi_idx=doi_idx,
+                            mention_idx=mention_idx)
+    os.replace(tmp_path, path)
+
+
+def _load_checkpoint(output_dir):
+    path = os.path.join(output_dir, CHECKPOINT_FILE)
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    return {"docs": 0, "rows": 0, "parts": 0}
+
+
+def _save_checkpoint(output_dir, checkpoint):
+    path = os.path.join(output_dir, CHECKPOINT_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f)
+    os.replace(path + ".tmp", path)
+
+
+def _flush(output_dir, checkpoint, stats, rows, n_docs):
+    start = time.perf_counter()
+    _write_part(os.path.join(output_dir, PART_FILE.format(checkpoint["parts"])), rows)
+    checkpoint["parts"] += 1
+    checkpoint["docs"] += n_docs
+    checkpoint["rows"] += len(rows)
+    _save_checkpoint(output_dir, checkpoint)
+    stats["parts"] += 1
+    stats["docs"] += n_docs
+    stats["rows"] += len(rows)
+    stats["write"] += time.perf_counter() - start
+
+
+def extract_mentions(abstracts, output_dir, batch_size=500, workers=None, batches_per_part=20, resume=True):
+    """
+    Extracts the material mentions of a corpus of abstracts and writes (doi, mention, canonical)
+    rows to compressed column parts in output_dir. Every part is followed by a checkpoint, so an
+    interrupted run resumes after the last part written; the abstracts must then come in the same
+    order, e.g. a MongoDB cursor sorted on _id or the same JSONL file.
+
+    Example usage:
+    >>> stats = extract_mentions("abstracts.jsonl", "mentions", workers=8)
+    >>> print(stats["docs_per_second"], stats["seconds"])
+    >>> for doi, mention, canonical in read_mentions("mentions"): ...
+
+    :param abstracts: iterable of documents with "doi", "title" and "abstract" fields (e.g. a MongoDB
+    cursor), or the path of a JSONL file with one such document per line
+    :param output_dir: directory of the parts and the checkpoint, created if it does not exist
+    :param batch_size: number of abstracts sent to a worker at a time
+    :param workers: number of processes, all CPUs if None; 1 runs in the calling process
+    :param batches_per_part: number of batches written to one part
+    :param resume: if False, any previous output in output_dir is ignored and overwritten
+    :return: dict of run statistics: "docs", "rows" and "parts" written by this run, "seconds",
+    "docs_per_second" and the seconds spent in each of the "read", "cde", "normalize" and "write"
+    stages. The cde and normalize times are summed over the workers.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    checkpoint = _load_checkpoint(output_dir) if resume else {"docs": 0, "rows": 0, "parts": 0}
+    if isinstance(abstracts, str):
+        abstracts = _read_jsonl(abstracts)
+    abstracts = itertools.islice(abstracts, checkpoint["docs"], None)
+
+    stats = dict.fromkeys(STAGES, 0.0)
+    stats.update(docs=0, rows=0, parts=0)
+    batches = _timed_batches(abstracts, batch_size, stats)
+    start = time.perf_counter()
+    pool = None
+    if workers == 1:
+        results = map(_extract_batch, batches)
+    else:
+        pool = Pool(processes=workers)
+        results = pool.imap(_extract_batch, batches)
+    try:
+        part_rows = []
+        part_docs = 0
+        for n, (rows, n_docs, cde, normalize) in enumerate(results, 1):
+            stats["cde"] += cde
+            stats["normalize"] += normalize
+            part_rows.extend(rows)
+            part_docs += n_docs
+            if n % batches_per_part == 0:
+                _flush(output_dir, checkpoint, stats, part_rows, part_docs)
+                part_rows, part_docs = [], 0
+        if part_docs:
+            _flush(output_dir, checkpoint, stats, part_rows, part_docs)
+    finally:
+        if pool is not None:
+            pool.terminate()
+    stats["seconds"] = time.perf_counter() - start
+    stats["docs_per_second"] = stats["docs"] / stats["seconds"] if stats["seconds"] else 0.0
+    return stats
+
+
+def read_mentions(output_dir, with_hash=False):
+    """
+    Reads back the output of extract_mentions
+    :param output_dir: the output directory of extract_mentions
+    :param with_hash: if True, the composition hash of the canonical form (see
+    SimpleParser.composition_hash) is appended to every row, 0 if there is no canonical form
+    :return: generator of (doi, mention, canonical) tuples; canonical is "" for mentions
+    that SimpleParser cannot parse
+    """
+    checkpoint = _load_checkpoint(output_dir)
+    for i in range(checkpoint["parts"]):
+        with np.load(os.path.join(output_dir, PART_FILE.format(i))) as part:
+            dois, mentions, canonical = part["dois"], part["mentions"], part["canonical"]
+            hashes = part["canonical_hash"]
+            for d, m in zip(part["doi_idx"], part["mention_idx"]):
+                if with_hash:
+                    yield str(dois[d]), str(mentions[m]), str(canonical[m]), int(hashes[m])
+                else:
+                    yield str(dois[d]), str(mentions[m]), str(canonical[m])
@@ -1,26 +1,249 @@
 import re
+import ast
 import collections
+import functools
+import hashlib
+import json
+import operator
+import os
+import struct
+import threading
+from multiprocessing import Pool
+from fractions import Fraction
+import numpy as np
 import sympy
 from sympy.abc import _clash
 from chemdataextractor.doc import Document
 from pymatgen.core.periodic_table import Element
 from pymatgen.core.composition import Composition, CompositionError
 import pubchempy as pcp
+from matstract.extract.pubchem_cache import PubChemCache
+
+
+_ELEMENTS_1 = ['H', 'B', 'C', 'N', 'O', 'F', 'P', 'S', 'K', 'V', 'Y', 'I', 'W', 'U']
+_ELEMENTS_2 = ['He', 'Li', 'Be', 'Ne', 'Na', 'Mg', 'Al', 'Si', 'Cl', 'Ar', 'Ca', 'Sc', 'Ti', 'Cr',
+               'Mn', 'Fe', 'Co', 'Ni', 'Cu', 'Zn', 'Ga', 'Ge', 'As', 'Se', 'Br', 'Kr', 'Rb', 'Sr',
+               'Zr', 'Nb', 'Mo', 'Tc', 'Ru', 'Rh', 'Pd', 'Ag', 'Cd', 'In', 'Sn', 'Sb', 'Te', 'Xe',
+               'Cs', 'Ba', 'La', 'Ce', 'Pr', 'Nd', 'Pm', 'Sm', 'Eu', 'Gd', 'Tb', 'Dy', 'Ho', 'Er',
+               'Tm', 'Yb', 'Lu', 'Hf', 'Ta', 'Re', 'Os', 'Ir', 'Pt', 'Au', 'Hg', 'Tl', 'Pb', 'Bi',
+               'Po', 'At', 'Rn', 'Fr', 'Ra', 'Ac', 'Th', 'Pa', 'Np', 'Pu', 'Am', 'Cm', 'Bk', 'Cf',
+               'Es', 'Fm', 'Md', 'No', 'Lr', 'Rf', 'Db', 'Sg', 'Bh', 'Hs', 'Mt', 'Ds', 'Rg', 'Cn',
+               'Fl', 'Lv']
+_GREEK_LETTERS = ['α', 'δ', 'χ']
+
+_ELEMENTS = frozenset(_ELEMENTS_1 + _ELEMENTS_2)
+# element symbols and the placeholders accepted as elements in formulas
+_FORMULA_SYMBOLS = _ELEMENTS | {'Ln', 'M'}
+
+_AMOUNT_CHARS = r"-*\.\da-z" + ''.join(_GREEK_LETTERS) + r"\+/"
+# an element symbol with its amount, e.g. "Fe2" or "O3-δ"
+_ELEMENT_AMOUNT_RE = re.compile(r"([A-Z]{1}[a-z]{0,1})\s*([" + _AMOUNT_CHARS + "]*)")
+# an innermost bracket group with its factor, e.g. "(PO4)3"
+_BRACKET_RE = re.compile(r"\(([^\(\)]+)\)\s*([" + _AMOUNT_CHARS + "]*)")
+_BRACKET_NO_GREEK_RE = re.compile(r"\(([^\(\)]+)\)\s*([-*\.\da-z\+/]*)")
+# a variable directly after a number, e.g. the x in "2x"
+_NUMBER_VARIABLE_RE = re.compile("(?<=[0-9])([a-z" + ''.join(_GREEK_LETTERS) + "])")
+_VARIABLE_RE = re.compile("[a-z" + ''.join(_GREEK_LETTERS) + "]")
+_WORD_RE = re.compile("[A-Za-z]+")
+# mixtures such as "(1-x)BaTiO3-xSrTiO3", their parts and the fraction of each part
+_BINARY_MIXTURE_RE = re.compile(r"\(1-x\)(.*)-\({0,1}x\){0,1}(.*)")
+_MIXTURE_PART_RE = re.compile(r"[-+]{1}([\d\.]*[A-Z][^-+]*)")
+_FRACTION_NAME_RE = re.compile(r"([\d\.]*)([A-Z].*)")
+_HYDRATE_RE = re.compile("[∙⋅](.*)")
+
+# names for sympify, without modifying the _clash dict shared with other sympy users
+_SYMPY_NAMESPACE = dict(_clash)
+for _letter in _GREEK_LETTERS:
+    _SYMPY_NAMESPACE[_letter] = sympy.Symbol(_letter)
+
+# characters and operators allowed in purely numeric stoichiometry such as "(0)+(0.5)*(2)"
+_NUMERIC_CHARS = frozenset("0123456789.+-*/() ")
+_NUMERIC_OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.USub: operator.neg,
+    ast.UAdd: operator.pos,
+}
+
+
+def _numeric_value(node):
+    """
+    Evaluates a numeric expression the way sympy does: integers are exact (Fraction) until
+    they meet a float, then the arithmetic is done in floats, and a float result of zero
+    becomes the exact 0 again
+    :param node: ast node of the expression
+    :return: Fraction or float, None if the expression contains anything else (e.g. variables)
+    """
+    if isinstance(node, ast.Constant):
+        if isinstance(node.value, bool):
+            return None
+        if isinstance(node.value, int):
+            return Fraction(node.value)
+        if isinstance(node.value, float):
+            return node.value
+        return None
+    if isinstance(node, ast.BinOp) and type(node.op) in _NUMERIC_OPERATORS:
+        left = _numeric_value(node.left)
+        right = _numeric_value(node.right) if left is not None else None
+        if right is None:
+            return None
+        result = _NUMERIC_OPERATORS[type(node.op)](left, right)
+        return Fraction(0) if result == 0 else result
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _NUMERIC_OPERATORS:
+        operand = _numeric_value(node.operand)
+        if operand is None:
+            return None
+        # a negated literal 0.0 stays the float 0.0, there is no negative zero in sympy
+        return operand if operand == 0 else _NUMERIC_OPERATORS[type(node.op)](operand)
+    return None
+
+
+def _simplify_numeric(value):
+    """
+    Fast path of MaterialParser.__simplify for stoichiometry without variables. Gives the same string
+    as simplifying the expression with sympy.
+    :param value: string
+    :return: string, or None if sympy is needed
+    """
+    # letters (exponents such as 1e2, prefixes such as 0x1 or 0o7) and underscores are Python number
+    # syntax that sympy reads differently
+    if not _NUMERIC_CHARS.issuperset(value):
+        return None
+    # literals with more digits than a double would be parsed by sympy with a higher precision
+    if '.' in value and sum(c.isdigit() for c in value) > 15:
+        return None
+    try:
+        number = _numeric_value(ast.parse(value, mode='eval').body)
+    except (SyntaxError, ValueError, ZeroDivisionError, OverflowError, RecursionError):
+        return None
+    if number is None:
+        return None
+    if isinstance(number, float):
+        return str(round(number, 3))
+    return str(number)
+
+
+def _to_sympy(value):
+    return sympy.sympify(_NUMBER_VARIABLE_RE.sub(r'*\1', value), _SYMPY_NAMESPACE)
+
+
+def _monomial_powers(monomial, symbols):
+    """
+    Exponents of a sympy monomial, e.g. x**2*δ -> (2, 1) for the symbols (x, δ)
+    """
+    powers = monomial.as_powers_dict()
+    if any(base not in symbols or not (power.is_Integer and power > 0) for base, power in powers.items()
+           if base != 1):
+        raise ValueError("{} is not a polynomial term".format(monomial))
+    return tuple(int(powers.get(symbol, 0)) for symbol in symbols)
+
+
+class MixtureForm:
+    """
+    Compact form of the overall stoichiometry of a mixture: every element amount is a polynomial
+    in the stoichiometric variables, stored as a coefficient array over (term, element) with the
+    exponents of the variables in every term. Compositions for many values of the variables are
+    then array arithmetic instead of sympy substitutions.
+
+    Example usage:
+    >>> form = MaterialParser().get_mixture_form("(1-x)BaTiO3-xSrTiO3")
+    >>> form.elements, form.variables
+    (('Ba', 'O', 'Sr', 'Ti'), ('x',))
+    >>> form.compositions({"x": [0, 0.25, 1]})
+    array([[1.  , 3.  , 0.  , 1.  ],
+           [0.75, 3.  , 0.25, 1.  ],
+           [0.  , 3.  , 1.  , 1.  ]])
+    """
+
+    def __init__(self, elements, variables, exponents, coefficients, components=()):
+        """
+        :param elements: tuple of element symbols, the columns of coefficients
+        :param variables: tuple of variable names, the columns of exponents
+        :param exponents: int array (n_terms, n_variables) of the powers of the variables in every term
+        :param coefficients: float array (n_terms, n_elements)
+        :param components: names of the mixture components
+        """
+        self.elements = tuple(elements)
+        self.variables = tuple(variables)
+        self.coefficients = np.asarray(coefficients, dtype=np.float64).reshape(-1, len(self.elements))
+        self.exponents = np.asarray(exponents, dtype=np.int64).reshape(len(self.coefficients), len(self.variables))
+        self.components = tuple(components)
+
+    @classmethod
+    def from_mixture(cls, mixture):
+        """
+        Builds the form from the output of MaterialParser.get_mixture
+        :param mixture: dict {component: {"fraction": str, "composition": {element: str}}}
+        :return: MixtureForm
+        :raises ValueError: if an amount is not a polynomial in the variables
+        """
+        amounts = []
+        for part in mixture.values():
+            fraction = _to_sympy(part["fraction"])
+            for el, amt in part["composition"].items():
+                if amt != '':
+                    amounts.append((el, sympy.expand(fraction * _to_sympy(amt))))
+        symbols = sorted(set().union(*[amt.free_symbols for _, amt in amounts]), key=str)
+        elements = sorted(set(el for el, _ in amounts))
+
+        terms = collections.OrderedDict()
+        for el, amt in amounts:
+            for monomial, coefficient in amt.as_coefficients_dict().items():
+                if not coefficient.is_Number:
+                    raise ValueError("{} is not a polynomial".format(amt))
+                row = terms.setdefault(_monomial_powers(monomial, symbols), np.zeros(len(elements)))
+                row[elements.index(el)] += float(coefficient)
+        return cls(elements, [str(symbol) for symbol in symbols], list(terms.keys()),
+                   list(terms.values()), mixture.keys())
+
+    def compositions(self, values=None, elements=None):
+        """
+        Evaluates the element amounts
+        :param values: dict {variable: number or 1-d array}; arrays are evaluated element-wise
+        :param elements: optional element order of the result columns, e.g. to compare several
+        mixtures; elements not in the mixture are 0
+        :return: float array (n_values, n_elements)
+        :raises KeyError: if a variable has no value
+        """
+        values = values or {}
+        columns = [np.atleast_1d(np.asarray(values[variable], dtype=np.float64)) for variable in self.variables]
+        n = max([len(column) for column in columns] + [1])
+        monomials = np.ones((n, len(self.exponents)))
+        for column, powers in zip(columns, self.exponents.T):
+            monomials *= column[:, None] ** powers
+        amounts = monomials.dot(self.coefficients)
+        if elements is None:
+            return amounts
+        result = np.zeros((n, len(elements)))
+        for j, el in enumerate(elements):
+            if el in self.elements:
+                result[:, j] = amounts[:, self.elements.index(el)]
+        return result
+
+    def composition(self, values=None):
+        """
+        Element amounts for a single value of every variable
+        :param values: dict {variable: number}
+        :return: dict {element: float}
+        """
+        return dict(zip(self.elements, self.compositions(values)[0].tolist()))
 
 
 class MaterialParser:
-    def __init__(self):
-        self.__list_of_elements_1 = ['H', 'B', 'C', 'N', 'O', 'F', 'P', 'S', 'K', 'V', 'Y', 'I', 'W', 'U']
-        self.__list_of_elements_2 = ['He', 'Li', 'Be', 'Ne', 'Na', 'Mg', 'Al', 'Si', 'Cl', 'Ar', 'Ca', 'Sc', 'Ti', 'Cr',
-                                     'Mn', 'Fe', 'Co', 'Ni', 'Cu', 'Zn', 'Ga', 'Ge', 'As', 'Se', 'Br', 'Kr', 'Rb', 'Sr',
-                                     'Zr', 'Nb', 'Mo', 'Tc', 'Ru', 'Rh', 'Pd', 'Ag', 'Cd', 'In', 'Sn', 'Sb', 'Te', 'Xe',
-                                     'Cs', 'Ba', 'La', 'Ce', 'Pr', 'Nd', 'Pm', 'Sm', 'Eu', 'Gd', 'Tb', 'Dy', 'Ho', 'Er',
-                                     'Tm', 'Yb', 'Lu', 'Hf', 'Ta', 'Re', 'Os', 'Ir', 'Pt', 'Au', 'Hg', 'Tl', 'Pb', 'Bi',
-                                     'Po', 'At', 'Rn', 'Fr', 'Ra', 'Ac', 'Th', 'Pa', 'Np', 'Pu', 'Am', 'Cm', 'Bk', 'Cf',
-                                     'Es', 'Fm', 'Md', 'No', 'Lr', 'Rf', 'Db', 'Sg', 'Bh', 'Hs', 'Mt', 'Ds', 'Rg', 'Cn',
-                                     'Fl', 'Lv']
+    def __init__(self, cache_size=100000, pubchem_cache=None, pubchem_online=True):
+        """
+        :param cache_size: maximum number of formulas whose parse_formula results are kept
+        :param pubchem_cache: PubChemCache (or the path of its SQLite file) consulted before PubChem
+        for names that are not formulas
+        :param pubchem_online: if False, PubChem is never queried and only the cache is used
+        """
+        self.pubchem_cache = PubChemCache(pubchem_cache) if isinstance(pubchem_cache, str) else pubchem_cache
+        self.pubchem_online = pubchem_online
         self.__list_of_trash_words = ['bulk', 'coated', 'rare', 'earth', 'ceramics', 'undoped']
-        self.__greek_letters = ['α', 'δ', 'χ']
+
+        self.__parse_formula_cached = functools.lru_cache(maxsize=cache_size)(self.__parse_formula)
 
     ###################################################################################################################
     ### Methods to build chemical structure
@@ -34,13 +257,12 @@ class MaterialParser:
         :return: string
         """
 
-        for l in self.__greek_letters:
-            _clash[l] = sympy.Symbol(l)
+        simplified = _simplify_numeric(value)
+        if simplified is not None:
+            return simplified
 
-        new_value = value
-        for i, m in enumerate(re.finditer('(?<=[0-9])([a-z'+''.join(self.__greek_letters)+'])', new_value)):
-            new_value = new_value[0:m.start(1) + i] + '*' + new_value[m.start(1) + i:]
-        new_value = sympy.simplify(sympy.sympify(new_value, _clash))
+        new_value = _NUMBER_VARIABLE_RE.sub(r'*\1', value)
+        new_value = sympy.simplify(sympy.sympify(new_value, _SYMPY_NAMESPACE))
         if new_value.is_Float:
             new_value = round(float(new_value), 3)
 
@@ -48,18 +270,17 @@ class MaterialParser:
 
     def __get_sym_dict(self, f, factor):
         sym_dict = collections.defaultdict(str)
-        r = "([A-Z]{1}[a-z]{0,1})\s*([-*\.\da-z"+''.join(self.__greek_letters)+"\+/]*)"
+        leftover = []
+        position = 0
 
-        for m in re.finditer(r, f):
+        for m in _ELEMENT_AMOUNT_RE.finditer(f):
             """
             checking for correct elements names
             """
-            el_bin = "{0}{1}".format(str(int(m.group(1)[0] in self.__list_of_elements_1 + ['M'])), str(
-                int(m.group(1) in self.__list_of_elements_1 + self.__list_of_elements_2 + ['Ln', 'M'])))
-            if el_bin in ['01', '11']:
+            if m.group(1) in _FORMULA_SYMBOLS:
                 el = m.group(1)
                 amt = m.group(2)
-            if el_bin in ['10', '00']:
+            else:
                 el = m.group(1)[0]
                 amt = m.group(1)[1:] + m.group(2)
 
@@ -68,8 +289,10 @@ class MaterialParser:
             if amt.strip() == "":
                 amt = "1"
             sym_dict[el] = '(' + sym_dict[el] + ')' + '+' + '(' + amt + ')' + '*' + '(' + str(factor) + ')'
-            f = f.replace(m.group(), "", 1)
-        if f.strip():
+            leftover.append(f[position:m.start()])
+            position = m.end()
+        leftover.append(f[position:])
+        if ''.join(leftover).strip():
             return collections.defaultdict(str)
             # print("{} is an invalid formula!".format(f))
 
@@ -87,12 +310,27 @@ class MaterialParser:
             formula (str): A string formula, e.g. Fe2O3, Li3Fe2(PO4)3
         Returns:
             Composition with that formula.
+
+        Results are cached per formula string; every call returns a new dict.
+        """
+        return collections.defaultdict(str, self.__parse_formula_cached(formula))
+
+    def cache_info(self):
         """
+        Hits, misses and size of the parse_formula cache
+        :return: functools cache info named tuple
+        """
+        return self.__parse_formula_cached.cache_info()
+
+    def __parse_formula(self, formula):
         formula_dict = collections.defaultdict(str)
-        r = "\(([^\(\)]+)\)\s*([-*\.\da-z"+''.join(self.__greek_letters)+"\+/]*)"
 
-        while len(re.findall(r, formula)) > 0:
-            for m in re.finditer(r, formula):
+        # one pass per nesting level: every innermost group is merged and removed, which exposes the next level
+        matches = list(_BRACKET_RE.finditer(formula))
+        while len(matches) > 0:
+            remaining = []
+            position = 0
+            for m in matches:
                 factor = "1"
                 if m.group(2) != "":
                     factor = m.group(2)
@@ -104,7 +342,11 @@ class MaterialParser:
                         formula_dict[el] = amt
                     else:
                         formula_dict[el] = '(' + formula_dict[el] + ')' + '+' + '(' + amt + ')'
-                formula = formula.replace('(' + m.group(1) + ')' + m.group(2), '', 1)
+                remaining.append(formula[position:m.start()])
+                position = m.end()
+            remaining.append(formula[position:])
+            formula = ''.join(remaining)
+            matches = list(_BRACKET_RE.finditer(formula))
 
         # if there is coefficient before formula, change factor
         unit_sym_dict = self.__get_sym_dict(formula, "1")
@@ -120,7 +362,7 @@ class MaterialParser:
         incorrect = []
         for el, amt in formula_dict.items():
             formula_dict[el] = self.__simplify(amt)
-            if any(len(c) > 1 for c in re.findall('[A-Za-z]+', formula_dict[el])):
+            if any(len(c) > 1 for c in _WORD_RE.findall(formula_dict[el])):
                 incorrect.append(el)
 
         for el in incorrect:
@@ -140,8 +382,7 @@ class MaterialParser:
         stoichiometry_variables = collections.defaultdict(str)
 
         # check for any weird syntax
-        r = "\(([^\(\)]+)\)\s*([-*\.\da-z\+/]*)"
-        for m in re.finditer(r, formula):
+        for m in _BRACKET_NO_GREEK_RE.finditer(formula):
             if not m.group(1).isupper() and m.group(2) == '':
                 formula = formula.replace('(' + m.group(1) + ')', m.group(1), 1)
             if ',' in m.group(1):
@@ -152,9 +393,9 @@ class MaterialParser:
 
         # looking for variables in elements and stoichiometry
         for el, amt in composition.items():
-            if el not in self.__list_of_elements_1 + self.__list_of_elements_2 + list(elements_variables.keys()):
+            if el not in _ELEMENTS and el not in elements_variables:
                 elements_variables[el] = []
-            for var in re.findall('[a-z'+''.join(self.__greek_letters)+']', amt):
+            for var in _VARIABLE_RE.findall(amt):
                 stoichiometry_variables[var] = []
 
         formula_structure = dict(
@@ -190,7 +431,7 @@ class MaterialParser:
 
         mixture = {}
 
-        for m in re.finditer('\(1-x\)(.*)-\({0,1}x\){0,1}(.*)', material_name.replace(' ', '')):
+        for m in _BINARY_MIXTURE_RE.finditer(material_name.replace(' ', '')):
             mixture[m.group(1)] = {}
             mixture[m.group(2)] = {}
             mixture[m.group(1)]['fraction'] = '1-x'
@@ -201,9 +442,9 @@ class MaterialParser:
             for i in [1, 2]:
                 if m.group(i)[0] == '(' and m.group(i)[-1] == ')':
                     line = m.group(i)[1:-1]
-                    parts = [s for s in re.split('[-+]{1}([\d\.]*[A-Z][^-+]*)', line) if s != '' and s != line]
+                    parts = [s for s in _MIXTURE_PART_RE.split(line) if s != '' and s != line]
                     for s in parts:
-                        name = re.findall('([\d\.]*)([A-Z].*)', s.strip(' -+()'))[0]
+                        name = _FRACTION_NAME_RE.findall(s.strip(' -+()'))[0]
                         mixture[name[1]] = {}
                         fraction = name[0]
                         if fraction == '': fraction = '1'
@@ -212,9 +453,9 @@ class MaterialParser:
                     del mixture[m.group(i)]
 
         if mixture == {}:
-            parts = [s for s in re.split('[-+]{1}([\d\.]*[A-Z][^-+]*)', material_name.replace(' ', '')) if s != '' and s != material_name.replace(' ', '')]
+            parts = [s for s in _MIXTURE_PART_RE.split(material_name.replace(' ', '')) if s != '' and s != material_name.replace(' ', '')]
             for s in parts:
-                name = re.findall('([\d\.]*)([A-Z].*)', s.strip(' -+()'))[0]
+                name = _FRACTION_NAME_RE.findall(s.strip(' -+()'))[0]
                 mixture[name[1]] = {}
                 fraction = name[0]
                 if fraction == '': fraction = '1'
@@ -226,6 +467,32 @@ class MaterialParser:
 
         return mixture
 
+    def get_mixture_form(self, material_name):
+        """
+        The stoichiometry of a mixture (or of a single formula) as a MixtureForm
+        :param material_name: string of material name, e.g. "(1-x)BaTiO3-xSrTiO3"
+        :return: MixtureForm
+        :raises ValueError: if an amount is not a polynomial in the variables
+        """
+        mixture = self.get_mixture(material_name)
+        if mixture == {}:
+            mixture = {material_name: dict(fraction='1',
+                                           composition=self.get_structure_by_formula(material_name)['composition'])}
+        return MixtureForm.from_mixture(mixture)
+
+    def __pubchem_formula(self, material_name):
+        """
+        Molecular formula of a compound name from the PubChem cache or PubChem
+        :param material_name: string of material name
+        :return: the formula string, or None
+        """
+        if self.pubchem_cache is not None:
+            return self.pubchem_cache.resolve(material_name, online=self.pubchem_online)
+        if not self.pubchem_online:
+            return None
+        pcp_compounds = pcp.get_compounds(material_name, 'name')
+        return pcp_compounds[0].molecular_formula if len(pcp_compounds) > 0 else None
+
     def get_chemical_structure(self, material_name):
         """
         The main function to obtain the closest chemical structure associated with a given material name
@@ -241,7 +508,7 @@ class MaterialParser:
             chemical_name=''
         )
 
-        material_name = re.sub('[∙⋅](.*)', '', material_name)
+        material_name = _HYDRATE_RE.sub('', material_name)
 
         chemical_structure['mixture'] = self.get_mixture(material_name)
 
@@ -267,10 +534,10 @@ class MaterialParser:
             # chemical_structure['stoichiometry_vars'] = collections.defaultdict(str)
             chemical_structure['elements_vars'] = collections.defaultdict(str)
 
-            pcp_compounds = pcp.get_compounds(material_name, 'name')
-            if len(pcp_compounds) > 0:
+            pubchem_formula = self.__pubchem_formula(material_name)
+            if pubchem_formula is not None:
                 try:
-                    chemical_structure['composition'] = self.get_structure_by_formula(pcp_compounds[0].molecular_formula)[
+                    chemical_structure['composition'] = self.get_structure_by_formula(pubchem_formula)[
                         'composition']
                 except:
                     chemical_structure['composition'] = collections.defaultdict(str)
@@ -336,20 +603,125 @@ class SimplifiedMaterialParser:
     #             current_element =
 
 
+# memo of ChemDataExtractor results, keyed by the sha1 of the text
+CHEMDATA_MEMO_SIZE = 100000
+_chemdata_memo = collections.OrderedDict()
+_chemdata_memo_lock = threading.Lock()
+
+
+def _text_key(text):
+    return hashlib.sha1(text.encode("utf-8")).digest()
+
+
+def _run_chemdataextractor(text):
+    """
+    Tags a text with ChemDataExtractor. The taggers are loaded on first use and then kept by
+    ChemDataExtractor for the lifetime of the process.
+    :param text: a sentence or an abstract
+    :return: (record names, CEM spans as (text, start, end) tuples)
+    """
+    doc = Document(text)
+    spans = [(cem.text, cem.start, cem.end) for cem in doc.cems]
+    names = [chem["names"] for chem in doc.records.serialize() if 'names' in chem.keys()]
+    return names, spans
+
+
+def _run_chemdataextractor_chunk(texts):
+    return [_run_chemdataextractor(text) for text in texts]
+
+
 class TextParser:
+    """
+    Extracts chemical entity mentions (CEMs) from text with ChemDataExtractor.
 
-    def __init__(self):
+    Example usage:
+    >>> parser = TextParser(workers=4)
+    >>> parser.extract_cems_many(["LiFePO4 is a cathode.", "We annealed TiO2 films."])
+    [[('LiFePO4', 0, 7)], [('TiO2', 12, 16)]]
+    >>> parser.close()
+
+    Results are memoized by the hash of the text across all parsers in the process, so a
+    sentence is only tagged once.
+    """
+
+    def __init__(self, workers=1, chunksize=64):
+        """
+        :param workers: number of processes used by the batch methods, all CPUs if None. The pool is
+        started on the first batch and kept, along with the taggers loaded in it, until close().
+        :param chunksize: number of texts sent to a worker at a time
+        """
         self.name = "Parser"
+        self.workers = workers
+        self.chunksize = chunksize
+        self._pool = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_pool"] = None
+        return state
+
+    def close(self):
+        """
+        Stops the worker processes, if any
+        """
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def _tag_many(self, texts):
+        keys = [_text_key(text) for text in texts]
+        results = dict()
+        missing = collections.OrderedDict()
+        with _chemdata_memo_lock:
+            for key, text in zip(keys, texts):
+                if key in _chemdata_memo:
+                    _chemdata_memo.move_to_end(key)
+                    results[key] = _chemdata_memo[key]
+                elif key not in missing:
+                    missing[key] = text
+        if missing:
+            unique = list(missing.values())
+            chunks = [unique[i:i + self.chunksize] for i in range(0, len(unique), self.chunksize)]
+            if self.workers == 1 or len(chunks) <= 1:
+                tagged = map(_run_chemdataextractor_chunk, chunks)
+            else:
+                if self._pool is None:
+                    self._pool = Pool(processes=self.workers)
+                tagged = self._pool.imap(_run_chemdataextractor_chunk, chunks)
+            computed = [result for chunk in tagged for result in chunk]
+            with _chemdata_memo_lock:
+                for key, result in zip(missing, computed):
+                    results[key] = result
+                    _chemdata_memo[key] = result
+                while len(_chemdata_memo) > CHEMDATA_MEMO_SIZE:
+                    _chemdata_memo.popitem(last=False)
+        return [results[key] for key in keys]
 
     def extract_chemdata(self, text):
-        doc = Document(text)
-        cems = doc.cems
-        chem_mentions = doc.records.serialize()
-        materials = []
-        for chem in chem_mentions:
-            if 'names' in chem.keys():
-                materials.append(chem["names"])
-        return materials
+        """
+        Returns the names of the chemical records in a text
+        :param text: a sentence or an abstract
+        :return: list of name lists, one per record
+        """
+        return self.extract_chemdata_many([text])[0]
+
+    def extract_chemdata_many(self, texts):
+        """
+        Batch version of extract_chemdata; repeated and previously seen texts are not tagged again
+        :param texts: list of sentences or abstracts
+        :return: list of name lists per record, for each text
+        """
+        return [[list(names) for names in names_list] for names_list, _ in self._tag_many(list(texts))]
+
+    def extract_cems_many(self, texts):
+        """
+        Returns the CEM spans of many texts; repeated and previously seen texts are not tagged again
+        :param texts: list of sentences or abstracts
+        :return: list of (text, start, end) spans, with character offsets, for each text
+        """
+        return [list(spans) for _, spans in self._tag_many(list(texts))]
+
 
 def extract_materials(text):
     P = TextParser()
@@ -407,6 +779,83 @@ def test_text_parsing():
 #if __name__ == "__main__":
 #    test_text_parsing()
 
+# symbols accepted by pymatgen's Element; member names are the symbols, including aliases such as D
+_ELEMENT_SYMBOLS = frozenset(Element.__members__)
+_ALPHABETIZE_RE = re.compile(r'[A-Z][a-z]?\d*')
+MATGEN_CACHE_SIZE = 2 ** 18
+
+
+def _is_element(element):
+    # pymatgen Elements (e.g. Composition keys) are accepted through their symbol
+    return str(element) in _ELEMENT_SYMBOLS
+
+
+def _alphabetize(formula):
+    return ''.join(sorted(_ALPHABETIZE_RE.findall(formula)))
+
+
+def _matgen_normalize(formula):
+    try:
+        integer_formula, factor = Composition(formula).get_integer_formula_and_factor()
+        composition = Composition(integer_formula)
+        if any([not _is_element(key) for key in composition.keys()]):
+            return False
+        else:
+            reduced = composition.get_reduced_formula_and_factor()[0]
+            ordered = _alphabetize(reduced)
+            return ordered
+    except:
+        return False
+
+
+# normalized formulas shared by all SimpleParser instances
+_normalized_formulas = functools.lru_cache(maxsize=MATGEN_CACHE_SIZE)(_matgen_normalize)
+
+# element index of the composition keys: the atomic number
+_ELEMENT_INDEX = {symbol: element.Z for symbol, element in Element.__members__.items()}
+_CANONICAL_RE = re.compile(r'([A-Z][a-z]?)(\d*)')
+
+
+def _composition_key(canonical):
+    """
+    Canonical composition key of a normalized formula
+    :param canonical: output of _matgen_normalize, e.g. "FeLiO4P"
+    :return: tuple of (element index, amount) sorted by element index, None if canonical is False
+    """
+    if not canonical:
+        return None
+    return tuple(sorted((_ELEMENT_INDEX[symbol], int(amount or 1))
+                        for symbol, amount in _CANONICAL_RE.findall(canonical)))
+
+
+def _composition_hash(key):
+    """
+    Stable 64-bit hash of a composition key (the same in every process and Python version,
+    unlike hash()), as a signed integer so that it fits a MongoDB int64
+    """
+    if key is None:
+        return None
+    packed = b''.join(struct.pack('<HQ', index, amount) for index, amount in key)
+    return int.from_bytes(hashlib.blake2b(packed, digest_size=8).digest(), 'little', signed=True)
+
+
+def _formula_key_and_hash(formula):
+    key = _composition_key(_normalized_formulas(formula))
+    return key, _composition_hash(key)
+
+
+# composition keys and hashes by formula, shared by all SimpleParser instances
+_formula_keys = functools.lru_cache(maxsize=MATGEN_CACHE_SIZE)(_formula_key_and_hash)
+
+
+def _lookup_key_and_hash(formula):
+    try:
+        return _formula_keys(formula)
+    except TypeError:
+        # unhashable input is not a formula
+        return None, None
+
+
 class SimpleParser:
     '''
     A parser class to identify chemical mentions, and related them
@@ -433,37 +882,56 @@ class SimpleParser:
 
     def is_element(self, element):
         '''
-        Checks if element is a chemical symbol.
+        Checks if element is a chemical symbol (or a pymatgen Element).
         '''
-        try:
-            Element(element)
-            return True
-        except:
-            return False
+        return _is_element(element)
 
     def alphabetize(self, formula):
         '''
         Take a chemical formula such as SrZrO3 and returns alphabetized version O3SrZr.
         '''
-        return ''.join(sorted(re.findall(r'[A-Z][a-z]?\d*', formula)))
+        return _alphabetize(formula)
 
     def matgen_parser(self, formula):
         '''
         Converts formula string to canonical (normalized, alphabetized) form.
         Returns defaultdict() object containing formula if successful. Returns false
         if an exception is raised.
+
+        Results are memoized in a table shared by all SimpleParser instances.
         '''
         try:
-            integer_formula, factor = Composition(formula).get_integer_formula_and_factor()
-            composition = Composition(integer_formula)
-            if any([not self.is_element(key) for key in composition.keys()]):
-                return False
-            else:
-                reduced = composition.get_reduced_formula_and_factor()[0]
-                ordered = self.alphabetize(reduced)
-                return ordered
-        except:
-            return False
+            return _normalized_formulas(formula)
+        except TypeError:
+            # unhashable input, cannot be memoized
+            return _matgen_normalize(formula)
+
+    @staticmethod
+    def cache_info():
+        '''
+        Hits, misses and size of the shared matgen_parser memo table
+        '''
+        return _normalized_formulas.cache_info()
+
+    def composition_key(self, formula):
+        '''
+        Canonical composition key of a formula: a tuple of (element index, reduced integer amount)
+        sorted by element index, where the index is the atomic number. Two formulas have the same
+        key if and only if matgen_parser gives the same canonical form. Returns None if the
+        formula cannot be parsed.
+
+        >>> parser.composition_key("Li2(FePO4)2")
+        ((3, 1), (8, 4), (15, 1), (26, 1))
+        '''
+        return _lookup_key_and_hash(formula)[0]
+
+    def composition_hash(self, formula):
+        '''
+        Stable signed 64-bit hash of the composition key, e.g. to store next to the mentions of an
+        abstract and compare or group materials as integers, or to index them. Returns None if the
+        formula cannot be parsed.
+        '''
+        return _lookup_key_and_hash(formula)[1]
 
     def regexp_parser(self, formula):
         # Will need to expand to deal with some more difficult formulae.
@@ -474,15 +942,11 @@ class SimpleParser:
         Parses and returns formula.
         '''
         parsers = [self.matgen_parser]  # , regexp_parser]
-        parsed = False
         for parser in parsers:
-            if parser(cem):
-                parsed = parser(cem)
-                break
-        if parsed:
-            return parser(cem)
-        else:
-            return False
+            parsed = parser(cem)
+            if parsed:
+                return parsed
+        return False
 
 
 def materials_extract(text):
@@ -498,3 +962,59 @@ def materials_extract(text):
             else:
                 missed.append(mention)
     return parsed, missed
+
+
+def _normalize_chunk(mentions):
+    parser = SimpleParser()
+    return [parser.parse(mention) for mention in mentions]
+
+
+def normalize_many(mentions, workers=None, chunksize=1000, mapping_file=None):
+    """
+    Converts many material mentions to their canonical form (SimpleParser.parse). The mentions are
+    deduplicated first and only the unique strings are parsed, in chunks over a process pool.
+    Results are yielded in the order of the input as soon as they are available.
+
+    Example usage:
+    >>> list(normalize_many(["LiFePO4", "Fe2O3", "LiFePO4", "the"], workers=4))
+    ['FeLiO4P', 'Fe2O3', 'FeLiO4P', False]
+
+    :param mentions: iterable of mention strings
+    :param workers: number of processes, all CPUs if None; 1 parses in the calling process
+    :param chunksize: number of unique mentions sent to a worker at a time
+    :param mapping_file: optional .json file with a {mention: canonical form} mapping. Mentions already
+    in the file are not parsed again, and the updated mapping is written back once all results are yielded.
+    :return: generator of canonical forms, False for the mentions that cannot be parsed
+    """
+    mentions = list(mentions)
+    mapping = dict()
+    if mapping_file is not None and os.path.exists(mapping_file):
+        with open(mapping_file, encoding="utf-8") as f:
+            mapping = json.load(f)
+    unique = [mention for mention in dict.fromkeys(mentions) if mention not in mapping]
+    chunks = [unique[i:i + chunksize] for i in range(0, len(unique), chunksize)]
+
+    position = 0
+    if workers == 1 or len(chunks) <= 1:
+        results = map(_normalize_chunk, chunks)
+        pool = None
+    else:
+        pool = Pool(processes=workers)
+        results = pool.imap(_normalize_chunk, chunks)
+    try:
+        for chunk, canonical in zip(chunks, results):
+            mapping.update(zip(chunk, canonical))
+            # every mention up to the first one of the next chunk is now known
+            while position < len(mentions) and mentions[position] in mapping:
+                yield mapping[mentions[position]]
+                position += 1
+        while position < len(mentions):
+            yield mapping[mentions[position]]
+            position += 1
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+    if mapping_file is not None:
+        with open(mapping_file, "w", encoding="utf-8") as f:
+            json.dump(mapping, f)
@@ -0,0 +1,134 @@
+import gzip
+import os
+import sqlite3
+import threading
+import time
+import pubchempy as pcp
+
+
+class PubChemCache:
+    """
+    Persistent name -> molecular formula store in front of PubChem name lookups, so that
+    get_chemical_structure does not need a network round-trip for names it has seen before and
+    can run offline. Names that PubChem does not know are recorded too (with no formula).
+
+    Example usage:
+    >>> cache = PubChemCache("pubchem_names.sqlite")
+    >>> cache.import_dump("CID-Synonym-Formula.tsv.gz")  # optional bulk import of name<TAB>formula lines
+    >>> cache.resolve("lithium iron phosphate", online=False)
+    'FeLiO4P'
+
+    Names are matched case-insensitively, like PubChem name searches.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: the SQLite database file, created if it does not exist
+        """
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS names "
+                               "(name TEXT PRIMARY KEY, formula TEXT, source TEXT, updated REAL)")
+
+    def _connection(self):
+        # sqlite connections cannot be shared between threads or processes
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    @staticmethod
+    def _key(name):
+        return name.strip().lower()
+
+    def __contains__(self, name):
+        try:
+            self.lookup(name)
+            return True
+        except KeyError:
+            return False
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM names").fetchone()[0]
+
+    def lookup(self, name):
+        """
+        Returns the stored formula of the name
+        :param name: a compound name
+        :return: the molecular formula, or None if the name is recorded as not found
+        :raises KeyError: if the name has never been stored
+        """
+        row = self._connection().execute("SELECT formula FROM names WHERE name = ?", (self._key(name),)).fetchone()
+        if row is None:
+            raise KeyError(name)
+        return row[0]
+
+    def set(self, name, formula, source="pubchem"):
+        """
+        Stores the formula of a name
+        :param name: a compound name
+        :param formula: the molecular formula, or None to record that the name is unknown
+        :param source: where the formula comes from
+        """
+        with self._connection() as connection:
+            connection.execute("INSERT OR REPLACE INTO names VALUES (?, ?, ?, ?)",
+                               (self._key(name), formula, source, time.time()))
+
+    def import_dump(self, path, delimiter="\t", source="dump", batch_size=100000):
+        """
+        Bulk imports name -> formula pairs, e.g. PubChem synonyms joined with their formulas.
+        Existing names are overwritten.
+        :param path: text file (optionally .gz) with one name<delimiter>formula pair per line,
+        or an iterable of (name, formula) tuples
+        :param delimiter: the separator of the name and the formula
+        :param source: recorded as the source of the imported formulas
+        :param batch_size: number of rows inserted per transaction
+        :return: the number of imported pairs
+        """
+        if isinstance(path, str):
+            opener = gzip.open if path.endswith(".gz") else open
+            with opener(path, "rt", encoding="utf-8") as f:
+                pairs = (line.rstrip("\n").rsplit(delimiter, 1) for line in f if delimiter in line)
+                return self._insert(pairs, source, batch_size)
+        return self._insert(path, source, batch_size)
+
+    def _insert(self, pairs, source, batch_size):
+        connection = self._connection()
+        now = time.time()
+        count = 0
+        batch = []
+        for name, formula in pairs:
+            batch.append((self._key(name), formula.strip() or None, source, now))
+            if len(batch) >= batch_size:
+                with connection:
+                    connection.executemany("INSERT OR REPLACE INTO names VALUES (?, ?, ?, ?)", batch)
+                count += len(batch)
+                batch = []
+        with connection:
+            connection.executemany("INSERT OR REPLACE INTO names VALUES (?, ?, ?, ?)", batch)
+        return count + len(batch)
+
+    def resolve(self, name, online=True):
+        """
+        Returns the molecular formula of a compound name, from the store or else from PubChem.
+        PubChem answers, including not found, are stored; network errors are not.
+        :param name: a compound name
+        :param online: if False, PubChem is never queried
+        :return: the molecular formula, or None if it is not known
+        """
+        try:
+            return self.lookup(name)
+        except KeyError:
+            pass
+        if not online:
+            return None
+        try:
+            compounds = pcp.get_compounds(name, 'name')
+        except (pcp.PubChemHTTPError, IOError):
+            return None
+        formula = compounds[0].molecular_formula if len(compounds) > 0 else None
+        self.set(name, formula)
+        return formula
@@ -0,0 +1,56 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+from matstract.extract import mention_pipeline
+from matstract.extract.parsing import SimpleParser
+
+
+class FakeTextParser:
+    """Stands in for ChemDataExtractor: every word with a digit is a record name"""
+    def extract_chemdata_many(self, texts):
+        return [[[word] for word in text.split() if any(c.isdigit() for c in word)] for text in texts]
+
+
+ABSTRACTS = [
+    {"doi": "10.1/a", "title": "LiFePO4 cathodes", "abstract": "We coat LiFePO4 with carbon."},
+    {"doi": "10.1/b", "title": "Thin films", "abstract": "TiO2 and Fe2O3 films on Si."},
+    {"doi": "10.1/c", "title": "Nothing", "abstract": "No materials here."},
+    {"doi": "10.1/d", "title": "Sensors", "abstract": "ZnO nanowires at 300 K."},
+    {"doi": "10.1/e", "title": "Perovskites", "abstract": "BaTiO3 ceramics."},
+]
+
+
+@mock.patch.object(mention_pipeline, "TextParser", FakeTextParser)
+class TestMentionPipeline(unittest.TestCase):
+    def test_extract_mentions(self):
+        output_dir = tempfile.mkdtemp()
+        path = os.path.join(output_dir, "abstracts.jsonl")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(json.dumps(abstract) for abstract in ABSTRACTS))
+        stats = mention_pipeline.extract_mentions(path, output_dir, batch_size=2, workers=1)
+        self.assertEqual(stats["docs"], 5)
+        self.assertEqual(stats["parts"], 1)
+        self.assertEqual(list(mention_pipeline.read_mentions(output_dir)),
+                         [("10.1/a", "LiFePO4", "FeLiO4P"), ("10.1/b", "TiO2", "O2Ti"),
+                          ("10.1/b", "Fe2O3", "Fe2O3"), ("10.1/d", "300", ""), ("10.1/e", "BaTiO3", "BaO3Ti")])
+        hashes = [row[3] for row in mention_pipeline.read_mentions(output_dir, with_hash=True)]
+        self.assertEqual(hashes[0], SimpleParser().composition_hash("LiFePO4"))
+        self.assertEqual(hashes[3], 0)
+
+    def test_resume(self):
+        output_dir = tempfile.mkdtemp()
+        stats = mention_pipeline.extract_mentions(ABSTRACTS[:3], output_dir, batch_size=2, workers=1,
+                                                  batches_per_part=1)
+        self.assertEqual((stats["docs"], stats["parts"]), (3, 2))
+        # a rerun on the full corpus only processes the remaining abstracts
+        stats = mention_pipeline.extract_mentions(ABSTRACTS, output_dir, batch_size=2, workers=1,
+                                                  batches_per_part=1)
+        self.assertEqual((stats["docs"], stats["rows"], stats["parts"]), (2, 2, 1))
+        self.assertEqual([row[1] for row in mention_pipeline.read_mentions(output_dir)],
+                         ["LiFePO4", "TiO2", "Fe2O3", "300", "BaTiO3"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,194 @@
+import collections
+import json
+import multiprocessing
+import os
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+import sympy
+from sympy.abc import _clash
+from pymatgen.core.composition import Composition
+from matstract.extract import parsing
+from matstract.extract.parsing import MaterialParser, MixtureForm, SimpleParser, TextParser, normalize_many, \
+    _simplify_numeric
+
+
+class TestMaterialParser(unittest.TestCase):
+    def __init__(self, *args, **kwargs):
+        super(TestMaterialParser, self).__init__(*args, **kwargs)
+        self.parser = MaterialParser()
+
+    def test_simplify_numeric(self):
+        """The fast path gives the same strings as sympy"""
+        expressions = ["(0)+(2)*(1)", "((0)+(0.5)*(1))*2", "(0)+(1/3)*(1)", "0.1+0.2", "0.5-0.5", "0.0",
+                       "-0.0", "2.", "4/2", "(0)+(0.0005)*(1)", "1/3*0.5", "0.0*10+1/3", "7-0.125*3"]
+        for expression in expressions:
+            expected = sympy.simplify(sympy.sympify(expression, _clash))
+            expected = str(round(float(expected), 3)) if expected.is_Float else str(expected)
+            self.assertEqual(_simplify_numeric(expression), expected, expression)
+        # variables and invalid numbers are left to sympy
+        for expression in ["1-x", "(0)+(3-δ)*(1)", "01", "1/0", "1e2", "1e-3", "0x1", "0b1", "0o7", "1_0", "1j"]:
+            self.assertIsNone(_simplify_numeric(expression))
+
+    def test_parse_formula(self):
+        self.assertEqual(dict(self.parser.parse_formula("Li2(FePO4)2")), {"Li": "2", "Fe": "2", "P": "2", "O": "8"})
+        self.assertEqual(dict(self.parser.parse_formula("Sr(Zr0.5Ti0.5)O3")),
+                         {"Sr": "1", "Zr": "0.5", "Ti": "0.5", "O": "3"})
+        self.assertEqual(dict(self.parser.parse_formula("La1-xSrxMnO3")),
+                         {"La": "1 - x", "Sr": "x", "Mn": "1", "O": "3"})
+        # Python-only number syntax is read by sympy
+        self.assertEqual(dict(self.parser.parse_formula("Fe1e2")), {"Fe": "e2"})
+        self.assertEqual(dict(self.parser.parse_formula("Co1e-3O2")), {"Co": "e - 3", "O": "2"})
+        self.assertEqual(dict(self.parser.parse_formula("Li0x1O2")), {"Li": "0", "O": "2"})
+        self.assertEqual(dict(self.parser.parse_formula("Ba0b1")), {"Ba": "0"})
+        self.assertEqual(dict(self.parser.parse_formula("LiCo0o7O2")), {"Li": "1", "Co": "0", "O": "2"})
+
+    def test_cache(self):
+        """Cached results are copies that callers can modify"""
+        parser = MaterialParser(cache_size=10)
+        first = parser.parse_formula("LiFePO4")
+        first["Li"] = "2"
+        self.assertEqual(parser.parse_formula("LiFePO4")["Li"], "1")
+        self.assertEqual(parser.cache_info().hits, 1)
+
+    def test_mixture_form(self):
+        form = self.parser.get_mixture_form("(1-x)BaTiO3-xSrTiO3")
+        self.assertEqual((form.elements, form.variables), (("Ba", "O", "Sr", "Ti"), ("x",)))
+        np.testing.assert_allclose(form.compositions({"x": [0, 0.25, 1]}),
+                                   [[1, 3, 0, 1], [0.75, 3, 0.25, 1], [0, 3, 1, 1]])
+        self.assertEqual(self.parser.get_mixture_form("LiFePO4").composition(),
+                         {"Fe": 1.0, "Li": 1.0, "O": 4.0, "P": 1.0})
+        np.testing.assert_allclose(self.parser.get_mixture_form("0.7BiFeO3-0.3BaTiO3").compositions(
+            elements=["Bi", "Ba", "Sr"]), [[0.7, 0.3, 0]])
+
+    def test_mixture_form_matches_sympy(self):
+        """Evaluating the form gives the same amounts as substituting into the get_mixture strings"""
+        names = ["(1-x)Pb(Zr0.52Ti0.48)O3-xBiScO3", "(1-x)(0.5BaTiO3-0.5CaTiO3)-x(Bi0.5Na0.5)TiO3",
+                 "(1-x)ZrO2-xY2O3-δ", "(1-x)Cu2-xSe-xZnS", "0.5Li2MnO3-0.5LiNi1/3Co1/3Mn1/3O2"]
+        values = {"x": np.array([0, 0.1, 0.5, 0.9]), "δ": np.array([0.2, 0.1, 0, 0.05])}
+        for name in names:
+            mixture = self.parser.get_mixture(name)
+            form = MixtureForm.from_mixture(mixture)
+            amounts = form.compositions({variable: values[variable] for variable in form.variables})
+            for i in range(len(values["x"])):
+                expected = dict.fromkeys(form.elements, 0)
+                for part in mixture.values():
+                    for el, amt in part["composition"].items():
+                        expression = sympy.sympify("({})*({})".format(part["fraction"], amt), _clash)
+                        expected[el] += float(expression.subs({sympy.Symbol(v): values[v][i] for v in values}))
+                np.testing.assert_allclose(amounts[min(i, len(amounts) - 1)], [expected[el] for el in form.elements],
+                                           err_msg=name)
+
+    def test_mixture_form_not_polynomial(self):
+        self.assertRaises(ValueError, MixtureForm.from_mixture,
+                          {"A": {"fraction": "1/(1+x)", "composition": {"Fe": "1"}}})
+
+
+class TestSimpleParser(unittest.TestCase):
+    def test_is_element(self):
+        parser = SimpleParser()
+        self.assertTrue(parser.is_element("Fe"))
+        self.assertFalse(parser.is_element("Fe2"))
+        self.assertFalse(parser.is_element("fe"))
+        self.assertTrue(all(parser.is_element(key) for key in Composition("LiFePO4").keys()))
+
+    def test_parse(self):
+        parser = SimpleParser()
+        self.assertEqual(parser.parse("Li2(FePO4)2"), "FeLiO4P")
+        self.assertEqual(parser.parse("Sr(Zr0.5Ti0.5)O3"), "O6Sr2TiZr")
+        self.assertFalse(parser.parse("the"))
+        hits = SimpleParser.cache_info().hits
+        self.assertEqual(SimpleParser().matgen_parser("Li2(FePO4)2"), "FeLiO4P")
+        self.assertEqual(SimpleParser.cache_info().hits, hits + 1)
+
+    def test_composition_key(self):
+        parser = SimpleParser()
+        self.assertEqual(parser.composition_key("Li2(FePO4)2"), ((3, 1), (8, 4), (15, 1), (26, 1)))
+        self.assertEqual(parser.composition_key("LiFePO4"), parser.composition_key("Li2(FePO4)2"))
+        self.assertIsNone(parser.composition_key("the"))
+        self.assertIsNone(parser.composition_hash("the"))
+        # the hash does not depend on the process (PYTHONHASHSEED)
+        self.assertEqual(parser.composition_hash("Fe2O3"), parser.composition_hash("O3Fe2"))
+        self.assertEqual(parser.composition_hash("Fe2O3"), 8812107863054706183)
+        self.assertNotEqual(parser.composition_hash("Fe2O3"), parser.composition_hash("FeO"))
+
+
+class TestNormalizeMany(unittest.TestCase):
+    def test_normalize_many(self):
+        mentions = ["LiFePO4", "Fe2O3", "the", "LiFePO4", "Sr(Zr0.5Ti0.5)O3", "Fe2O3"]
+        expected = ["FeLiO4P", "Fe2O3", False, "FeLiO4P", "O6Sr2TiZr", "Fe2O3"]
+        self.assertEqual(list(normalize_many(mentions, workers=1, chunksize=2)), expected)
+        self.assertEqual(list(normalize_many(mentions, workers=2, chunksize=1)), expected)
+
+    def test_mapping_file(self):
+        mapping_file = os.path.join(tempfile.mkdtemp(), "mapping.json")
+        self.assertEqual(list(normalize_many(["LiFePO4", "the"], workers=1, mapping_file=mapping_file)),
+                         ["FeLiO4P", False])
+        self.assertEqual(list(normalize_many(["the", "Fe2O3"], workers=1, mapping_file=mapping_file)),
+                         [False, "Fe2O3"])
+        with open(mapping_file) as f:
+            self.assertEqual(json.load(f), {"LiFePO4": "FeLiO4P", "the": False, "Fe2O3": "Fe2O3"})
+
+
+Span = collections.namedtuple("Span", ["text", "start", "end"])
+
+
+class FakeDocument:
+    """Stands in for the ChemDataExtractor Document: every word with a digit is a CEM"""
+
+    def __init__(self, text):
+        self.cems = []
+        start = 0
+        for word in text.split(" "):
+            if any(c.isdigit() for c in word):
+                self.cems.append(Span(word, start, start + len(word)))
+            start += len(word) + 1
+        self.records = mock.Mock()
+        self.records.serialize.return_value = [{"names": [cem.text]} for cem in self.cems] + [{"other": 1}]
+
+
+@mock.patch.object(parsing, "Document", FakeDocument)
+class TestTextParser(unittest.TestCase):
+    TEXTS = ["LiFePO4 is a cathode", "We annealed TiO2 films", "no materials here", "Fe2O3 and Fe3O4 nanoparticles"]
+
+    def setUp(self):
+        parsing._chemdata_memo.clear()
+
+    def tearDown(self):
+        parsing._chemdata_memo.clear()
+
+    def expected_cems(self, text):
+        return [tuple(cem) for cem in FakeDocument(text).cems]
+
+    def test_memo(self):
+        """Every distinct text is tagged once, also across calls and parsers"""
+        texts = self.TEXTS + self.TEXTS[::-1] + [self.TEXTS[0]]
+        with mock.patch.object(parsing, "_run_chemdataextractor", wraps=parsing._run_chemdataextractor) as run:
+            cems = TextParser(chunksize=3).extract_cems_many(texts)
+            self.assertEqual(run.call_count, len(self.TEXTS))
+            self.assertEqual(sorted(call[0][0] for call in run.call_args_list), sorted(self.TEXTS))
+            self.assertEqual(cems, [self.expected_cems(text) for text in texts])
+            self.assertEqual(TextParser().extract_chemdata_many(self.TEXTS[2:] + ["LiCoO2 cathode"]),
+                             [[], [["Fe2O3"], ["Fe3O4"]], [["LiCoO2"]]])
+            self.assertEqual(run.call_count, len(self.TEXTS) + 1)
+        self.assertEqual(TextParser().extract_chemdata(self.TEXTS[0]), [["LiFePO4"]])
+        self.assertEqual(len(parsing._chemdata_memo), len(self.TEXTS) + 1)
+
+    @unittest.skipUnless(multiprocessing.get_start_method() == "fork",
+                         "the workers only see the patched Document if they are forked")
+    def test_workers(self):
+        """The results are returned in the order of the texts with several workers"""
+        texts = ["sample {} has {} grains".format(i, i % 7) for i in range(40)] + self.TEXTS * 2
+        parser = TextParser(workers=2, chunksize=4)
+        try:
+            self.assertEqual(parser.extract_cems_many(texts), [self.expected_cems(text) for text in texts])
+            self.assertIsNotNone(parser._pool)
+            self.assertEqual(parser.extract_chemdata_many(texts[::-1]),
+                             [[[cem[0]] for cem in self.expected_cems(text)] for text in texts[::-1]])
+        finally:
+            parser.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import os
+import tempfile
+import unittest
+from matstract.extract.parsing import MaterialParser
+from matstract.extract.pubchem_cache import PubChemCache
+
+
+class TestPubChemCache(unittest.TestCase):
+    def __init__(self, *args, **kwargs):
+        super(TestPubChemCache, self).__init__(*args, **kwargs)
+        self.directory = tempfile.mkdtemp()
+
+    def test_lookup(self):
+        cache = PubChemCache(os.path.join(self.directory, "lookup.sqlite"))
+        cache.set("Lithium iron phosphate", "FeLiO4P")
+        cache.set("unobtainium", None)
+        self.assertEqual(cache.lookup("lithium iron phosphate "), "FeLiO4P")
+        self.assertIsNone(cache.lookup("unobtainium"))
+        self.assertRaises(KeyError, cache.lookup, "water")
+        self.assertTrue("unobtainium" in cache)
+        self.assertFalse("water" in cache)
+        # nothing is stored for names resolved offline
+        self.assertIsNone(cache.resolve("water", online=False))
+        self.assertEqual(len(cache), 2)
+
+    def test_import_dump(self):
+        dump = os.path.join(self.directory, "dump.tsv")
+        with open(dump, "w", encoding="utf-8") as f:
+            f.write("water\tH2O\nrutile\tO2Ti\nnot a compound\t\n")
+        cache = PubChemCache(os.path.join(self.directory, "dump.sqlite"))
+        self.assertEqual(cache.import_dump(dump, batch_size=2), 3)
+        self.assertEqual(cache.resolve("Rutile", online=False), "O2Ti")
+        self.assertIsNone(cache.lookup("not a compound"))
+        self.assertEqual(cache.import_dump([("quartz", "O2Si")]), 1)
+        self.assertEqual(cache.lookup("quartz"), "O2Si")
+
+    def test_material_parser(self):
+        path = os.path.join(self.directory, "parser.sqlite")
+        PubChemCache(path).set("rutile", "TiO2")
+        parser = MaterialParser(pubchem_cache=path, pubchem_online=False)
+        self.assertEqual(dict(parser.get_chemical_structure("rutile")["composition"]), {"Ti": "1", "O": "2"})
+        self.assertEqual(dict(parser.get_chemical_structure("anatase")["composition"]), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
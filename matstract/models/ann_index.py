@@ -0,0 +1,132 @@
+import numpy as np
+
+
+class IVFIndex:
+    """
+    Inverted file (IVF) index for approximate cosine nearest-neighbour search over the rows of
+    a unit-normalized matrix. A spherical k-means coarse quantizer splits the vocabulary into
+    n_lists clusters; a query is only scored exactly against the rows of its nprobe closest
+    clusters. More probes give better recall at the cost of latency.
+
+    Example usage:
+    >>> index = IVFIndex.build(normalized_embeddings, n_lists=1024)
+    >>> index.save("embeddings_ivf.npz")
+    >>> index = IVFIndex.load("embeddings_ivf.npz", nprobe=16)
+    >>> indices, scores = index.search(queries, normalized_embeddings, top_k=8)
+
+    The index only stores the centroids and the row ids of every list; the vectors themselves
+    are passed to search, so the index works on memory-mapped matrices.
+    """
+
+    def __init__(self, centroids, list_offsets, list_ids, nprobe=8):
+        """
+        :param centroids: (n_lists, dim) float32 array of unit-length cluster centroids
+        :param list_offsets: (n_lists + 1) int array, the ids of list i are list_ids[list_offsets[i]:list_offsets[i+1]]
+        :param list_ids: int array with the row ids of all lists, grouped by list
+        :param nprobe: default number of lists scanned per query
+        """
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.list_offsets = np.asarray(list_offsets, dtype=np.int64)
+        self.list_ids = np.asarray(list_ids)
+        self.nprobe = nprobe
+
+    @property
+    def n_lists(self):
+        return self.centroids.shape[0]
+
+    @classmethod
+    def build(cls, vectors, n_lists=None, n_iter=10, sample_size=None, seed=0, nprobe=8, chunk_size=65536):
+        """
+        Trains the coarse quantizer on a sample of the vectors and assigns every vector to a list
+        :param vectors: (n, dim) array of unit-normalized vectors
+        :param n_lists: number of clusters, defaults to 4 * sqrt(n)
+        :param n_iter: number of k-means iterations
+        :param sample_size: number of vectors used to train the centroids, defaults to 64 * n_lists
+        :param seed: random seed for sampling and initialization
+        :param nprobe: default number of lists scanned per query
+        :param chunk_size: number of vectors assigned at a time
+        :return: the IVFIndex
+        """
+        n = vectors.shape[0]
+        if n_lists is None:
+            n_lists = max(1, int(4 * np.sqrt(n)))
+        n_lists = min(n_lists, n)
+        if sample_size is None:
+            sample_size = 64 * n_lists
+        rng = np.random.RandomState(seed)
+        sample_ids = np.sort(rng.choice(n, min(sample_size, n), replace=False))
+        sample = np.asarray(vectors[sample_ids], dtype=np.float32)
+
+        # spherical k-means: centroids are kept at unit length and points are assigned by dot product
+        centroids = sample[rng.choice(sample.shape[0], n_lists, replace=False)]
+        for _ in range(n_iter):
+            assignment = np.argmax(np.dot(sample, centroids.T), axis=1)
+            counts = np.bincount(assignment, minlength=n_lists)
+            empty = counts == 0
+            # per-cluster sums of the sorted sample
+            order = np.argsort(assignment, kind="stable")
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+            sums = np.zeros_like(centroids)
+            sums[~empty] = np.add.reduceat(sample[order], starts[~empty], axis=0)
+            # re-seed empty clusters with random points so that all lists get used
+            sums[empty] = sample[rng.choice(sample.shape[0], np.count_nonzero(empty), replace=False)]
+            centroids = _unit_rows(sums)
+
+        assignment = np.empty(n, dtype=np.int32)
+        for start in range(0, n, chunk_size):
+            chunk = np.asarray(vectors[start:start + chunk_size], dtype=np.float32)
+            assignment[start:start + chunk_size] = np.argmax(np.dot(chunk, centroids.T), axis=1)
+        list_ids = np.argsort(assignment, kind="stable").astype(np.int32)
+        list_offsets = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=n_lists))])
+        return cls(centroids, list_offsets, list_ids, nprobe=nprobe)
+
+    def search(self, queries, vectors, top_k=8, nprobe=None):
+        """
+        Approximate top-k search by cosine similarity
+        :param queries: (n_queries, dim) array of query vectors
+        :param vectors: the (n, dim) matrix the index was built on
+        :param top_k: number of neighbours to return for each query
+        :param nprobe: number of lists to scan, defaults to self.nprobe
+        :return: a list of (indices, scores) array pairs, sorted by decreasing score, one per query
+        """
+        nprobe = min(self.nprobe if nprobe is None else nprobe, self.n_lists)
+        queries = np.asarray(queries, dtype=np.float32)
+        coarse = np.dot(queries, self.centroids.T)
+        probes = np.argpartition(-coarse, nprobe - 1, axis=1)[:, :nprobe] if nprobe < self.n_lists \
+            else np.tile(np.arange(self.n_lists), (queries.shape[0], 1))
+
+        results = []
+        for query, lists in zip(queries, probes):
+            candidates = np.concatenate(
+                [self.list_ids[self.list_offsets[l]:self.list_offsets[l + 1]] for l in lists])
+            candidates.sort()  # sequential access is much faster on memory-mapped matrices
+            scores = np.dot(np.asarray(vectors[candidates], dtype=np.float32), query)
+            k = min(top_k, len(candidates))
+            top = np.argpartition(-scores, k - 1)[:k] if k < len(candidates) else np.arange(k)
+            top = top[np.argsort(-scores[top], kind="stable")]
+            results.append((candidates[top], scores[top]))
+        return results
+
+    def save(self, path):
+        """
+        Saves the index to a single .npz file, e.g. next to the embedding .npy files
+        :param path: the file path
+        """
+        np.savez(path, centroids=self.centroids, list_offsets=self.list_offsets, list_ids=self.list_ids)
+
+    @classmethod
+    def load(cls, path, nprobe=8):
+        """
+        Loads an index saved with save()
+        :param path: the file path
+        :param nprobe: default number of lists scanned per query
+        :return: the IVFIndex
+        """
+        with np.load(path) as data:
+            return cls(data["centroids"], data["list_offsets"], data["list_ids"], nprobe=nprobe)
+
+
+def _unit_rows(matrix):
+    norm = np.sqrt(np.sum(np.square(matrix), 1, keepdims=True))
+    norm[norm == 0] = 1
+    return matrix / norm
@@ -1,7 +1,7 @@
 import datetime
 import nltk
 from nltk.chunk.util import ChunkScore
-from matstract.models.word_embeddings import EmbeddingEngine
+from matstract.models.word_embeddings import get_embedding_engine
 from matstract.nlp.data_preparation import DataPreparation
 
 class Annotation:
@@ -219,7 +219,7 @@ class TokenAnnotation(Annotation):
             return new_toks
 
         grouped_toks = self.group_and_process()
-        ee = EmbeddingEngine()
+        ee = get_embedding_engine()
         for row_idx, tokenRow in enumerate(grouped_toks):
             for idx, token in enumerate(tokenRow):
                 # processing the sentence
@@ -1,4 +1,4 @@
-from matstract.models.word_embeddings import EmbeddingEngine
+from matstract.models.word_embeddings import get_embedding_engine
 import numpy as np
 
 
@@ -12,15 +12,15 @@ class ClusterPlot:
         :param wordphrases: filter to show only the specified phrases
         """
 
-        ds = np.DataSource()
+        ds = np.lib.npyio.DataSource()
         # material_names_url = "https://s3-us-west-1.amazonaws.com/materialsintelligence/material_map_tsne_words.npy"
         material_coords_url = "https://s3-us-west-1.amazonaws.com/materialsintelligence/final_material_map_atl10_30_ee12_lr200.npy"
 
         # ds.open(material_names_url)
         ds.open(material_coords_url)
 
-        self.ee = EmbeddingEngine()
-        self.embs = self.ee.embeddings / self.ee.norm
+        self.ee = get_embedding_engine()
+        self.embs = self.ee.normalized_embeddings
         # materials_json = urlopen("https://s3-us-west-1.amazonaws.com/matstract/material_map_10_mentions.json")
         # materials_data = materials_json.read().decode("utf-8")
         # self.materials_tsne_data = json.loads(materials_data)["data"][0]
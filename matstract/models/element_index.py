@@ -0,0 +1,100 @@
+import numpy as np
+from matstract.nlp.data_preparation import DataPreparation
+
+# bit position of each element in the 128-bit masks, ELEMENTS has fewer than 128 entries
+ELEMENT_BITS = {element: i for i, element in enumerate(DataPreparation.ELEMENTS)}
+
+
+class ElementIndex:
+    """
+    Element composition index over a list of formulas. Each formula is stored as a 128-bit
+    mask of the elements it contains, split into two uint64 arrays, so that element filters
+    become vectorized bitwise operations instead of parsing every formula at request time.
+
+    Example usage:
+    >>> index = ElementIndex.build(formulas, MaterialParser())
+    >>> index.save("formula_elements.npz")
+    >>> keep = index.filter_mask(plus_elems=["Li"], minus_elems=["Co"])
+    """
+
+    def __init__(self, lo, hi):
+        """
+        :param lo: uint64 array with bits 0-63 of the element mask of every formula
+        :param hi: uint64 array with bits 64-127 of the element mask of every formula
+        """
+        self.lo = np.asarray(lo, dtype=np.uint64)
+        self.hi = np.asarray(hi, dtype=np.uint64)
+
+    def __len__(self):
+        return len(self.lo)
+
+    @classmethod
+    def build(cls, formulas, parser):
+        """
+        Parses every formula once and stores its element mask. Formulas that cannot be
+        parsed get an empty mask.
+        :param formulas: a list of formula strings
+        :param parser: the parser used for element filtering, e.g. MaterialParser
+        :return: the ElementIndex
+        """
+        lo = np.zeros(len(formulas), dtype=np.uint64)
+        hi = np.zeros(len(formulas), dtype=np.uint64)
+        for i, formula in enumerate(formulas):
+            try:
+                elements = parser.parse_formula(formula).keys()
+            except Exception:
+                elements = []
+            lo[i], hi[i] = element_mask(elements)
+        return cls(lo, hi)
+
+    def filter_mask(self, plus_elems=None, minus_elems=None):
+        """
+        Returns a boolean array, True for the formulas that contain at least one of plus_elems
+        (or plus_elems is empty) and none of minus_elems. Elements present in both lists are ignored.
+        :param plus_elems: list of element symbols
+        :param minus_elems: list of element symbols
+        :return: boolean numpy array
+        """
+        plus_elems = set(plus_elems or [])
+        minus_elems = set(minus_elems or [])
+        plus_elems, minus_elems = plus_elems - minus_elems, minus_elems - plus_elems
+
+        keep = np.ones(len(self), dtype=bool)
+        if len(plus_elems) > 0:
+            plus_lo, plus_hi = element_mask(plus_elems)
+            keep &= ((self.lo & plus_lo) | (self.hi & plus_hi)) != 0
+        if len(minus_elems) > 0:
+            minus_lo, minus_hi = element_mask(minus_elems)
+            keep &= ((self.lo & minus_lo) | (self.hi & minus_hi)) == 0
+        return keep
+
+    def save(self, path):
+        """
+        Saves the index to a single .npz file
+        :param path: the file path
+        """
+        np.savez(path, lo=self.lo, hi=self.hi)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads an index saved with save()
+        :param path: the file path
+        :return: the ElementIndex
+        """
+        with np.load(path) as data:
+            return cls(data["lo"], data["hi"])
+
+
+def element_mask(elements):
+    """
+    Returns the 128-bit mask of the elements as a (lo, hi) pair of uint64 values.
+    Symbols that are not chemical elements (e.g. the M or Ln placeholders) are ignored.
+    :param elements: iterable of element symbols
+    :return: tuple of two np.uint64
+    """
+    mask = 0
+    for element in elements:
+        if element in ELEMENT_BITS:
+            mask |= 1 << ELEMENT_BITS[element]
+    return np.uint64(mask & 0xFFFFFFFFFFFFFFFF), np.uint64(mask >> 64)
@@ -0,0 +1,131 @@
+import numpy as np
+
+
+class QuantizedMatrix:
+    """
+    int8 copy of a matrix with one float32 scale per row, a quarter of the size of the float32
+    matrix. Row i is approximately codes[i] * scales[i]. Scores are accumulated in float32 and
+    the rows are dequantized on the fly, one chunk at a time.
+
+    Example usage:
+    >>> quantized = QuantizedMatrix.quantize(normalized_embeddings)
+    >>> quantized.save("embeddings_int8.npz")
+    >>> scores = quantized.dot(queries)  # approximately np.dot(queries, normalized_embeddings.T)
+    """
+
+    def __init__(self, codes, scales, chunk_size=65536):
+        """
+        :param codes: (n, dim) int8 array
+        :param scales: (n,) float32 array with the scale of every row
+        :param chunk_size: number of rows dequantized at a time in dot
+        """
+        self.codes = np.asarray(codes, dtype=np.int8)
+        self.scales = np.asarray(scales, dtype=np.float32)
+        self.chunk_size = chunk_size
+
+    @property
+    def shape(self):
+        return self.codes.shape
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + self.scales.nbytes
+
+    def __len__(self):
+        return self.codes.shape[0]
+
+    @classmethod
+    def quantize(cls, matrix, chunk_size=65536):
+        """
+        Quantizes every row symmetrically to [-127, 127] with the scale max(|row|) / 127
+        :param matrix: 2d array (may be memory-mapped)
+        :param chunk_size: number of rows quantized at a time
+        :return: the QuantizedMatrix
+        """
+        codes = np.empty(matrix.shape, dtype=np.int8)
+        scales = np.empty(matrix.shape[0], dtype=np.float32)
+        for start in range(0, matrix.shape[0], chunk_size):
+            chunk = np.asarray(matrix[start:start + chunk_size], dtype=np.float32)
+            scale = np.max(np.abs(chunk), axis=1) / 127
+            scale[scale == 0] = 1
+            codes[start:start + chunk_size] = np.rint(chunk / scale[:, np.newaxis])
+            scales[start:start + chunk_size] = scale
+        return cls(codes, scales, chunk_size=chunk_size)
+
+    def __getitem__(self, rows):
+        """
+        Dequantized rows, e.g. quantized[5] or quantized[[1, 2, 3]]
+        """
+        codes = self.codes[rows]
+        scales = self.scales[rows]
+        return codes.astype(np.float32) * np.expand_dims(scales, -1)
+
+    def dot(self, queries):
+        """
+        Approximate scores of every row against the queries
+        :param queries: (n_queries, dim) array
+        :return: (n_queries, n) float32 array
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        scores = np.empty((queries.shape[0], len(self)), dtype=np.float32)
+        for start in range(0, len(self), self.chunk_size):
+            end = start + self.chunk_size
+            chunk = self.codes[start:end].astype(np.float32)
+            scores[:, start:end] = np.dot(queries, chunk.T) * self.scales[start:end]
+        return scores
+
+    def save(self, path):
+        """
+        Saves the matrix to a single .npz file
+        :param path: the file path
+        """
+        np.savez(path, codes=self.codes, scales=self.scales)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads a matrix saved with save()
+        :param path: the file path
+        :return: the QuantizedMatrix
+        """
+        with np.load(path) as data:
+            return cls(data["codes"], data["scales"])
+
+
+class NormalizedView:
+    """
+    Read-only view of a matrix with every row scaled to unit length, computed on the fly for the
+    rows that are accessed. Gives the same values as normalize_rows in word_embeddings without
+    keeping a float32 copy of the whole matrix.
+    """
+
+    def __init__(self, matrix, dtype=np.float32):
+        """
+        :param matrix: 2d array, e.g. the memory-mapped float16 embeddings
+        :param dtype: dtype of the returned rows
+        """
+        self.matrix = matrix
+        self.dtype = np.dtype(dtype)
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def __getitem__(self, key):
+        rows, columns = (key[0], key[1:]) if isinstance(key, tuple) else (key, ())
+        chunk = np.asarray(self.matrix[rows], dtype=np.float32)
+        single = chunk.ndim == 1
+        chunk = np.atleast_2d(chunk)
+        norm = np.sqrt(np.sum(np.square(chunk), 1, keepdims=True))
+        norm[norm == 0] = 1
+        chunk = (chunk / norm).astype(self.dtype, copy=False)
+        if single:
+            chunk = chunk[0]
+        return chunk[(Ellipsis,) + columns] if len(columns) > 0 else chunk
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self[:], dtype=dtype)
+
@@ -8,7 +8,7 @@ class SimilarMaterials:
     def __init__(self):
         #Load the similarity array
         array_url = 'https://s3-us-west-1.amazonaws.com/materialsintelligence/matminer_array.npy'
-        ds = np.DataSource()
+        ds = np.lib.npyio.DataSource()
         ds.open(array_url)
         self.matminer_array = np.load(ds.abspath(array_url))
 
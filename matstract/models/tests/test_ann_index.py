@@ -0,0 +1,73 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from matstract.models.ann_index import IVFIndex
+from matstract.models.word_embeddings import top_k_indices
+
+
+class TestIVFIndex(unittest.TestCase):
+    def __init__(self, *args, **kwargs):
+        """Creates clustered unit vectors, similar to word embeddings"""
+        super(TestIVFIndex, self).__init__(*args, **kwargs)
+        rng = np.random.RandomState(0)
+        centers = rng.standard_normal((20, 32))
+        matrix = centers[rng.randint(0, 20, 2000)] + 0.5 * rng.standard_normal((2000, 32))
+        self.matrix = (matrix / np.linalg.norm(matrix, axis=1, keepdims=True)).astype(np.float32)
+        self.queries = self.matrix[:25] + self.matrix[25:50]
+        self.index = IVFIndex.build(self.matrix, n_lists=40, seed=0, nprobe=4)
+
+    def test_lists(self):
+        """Every row is in exactly one list"""
+        self.assertEqual(self.index.n_lists, 40)
+        self.assertEqual(self.index.list_offsets[-1], len(self.matrix))
+        np.testing.assert_array_equal(np.sort(self.index.list_ids), np.arange(len(self.matrix)))
+
+    def test_full_nprobe(self):
+        """Scanning all lists gives the exact top k"""
+        expected = top_k_indices(np.dot(self.queries, self.matrix.T), 10)
+        results = self.index.search(self.queries, self.matrix, top_k=10, nprobe=self.index.n_lists)
+        for query, (indices, scores), exact in zip(self.queries, results, expected):
+            # the two rows summed into a query tie up to rounding, so their order may differ
+            self.assertEqual(set(indices), set(exact))
+            np.testing.assert_allclose(scores, np.dot(self.matrix[exact], query), rtol=1e-5)
+
+    def test_recall(self):
+        """A few probes already find most of the exact neighbours"""
+        expected = top_k_indices(np.dot(self.queries, self.matrix.T), 10)
+        results = self.index.search(self.queries, self.matrix, top_k=10)
+        recall = np.mean([len(set(indices) & set(exact)) / 10.0 for (indices, _), exact in zip(results, expected)])
+        self.assertGreater(recall, 0.8)
+
+    def test_save_load(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, "index.npz")
+            self.index.save(path)
+            loaded = IVFIndex.load(path, nprobe=6)
+            self.assertEqual(loaded.nprobe, 6)
+            np.testing.assert_array_equal(loaded.centroids, self.index.centroids)
+            np.testing.assert_array_equal(loaded.list_offsets, self.index.list_offsets)
+            np.testing.assert_array_equal(loaded.list_ids, self.index.list_ids)
+            for (indices, scores), (loaded_indices, loaded_scores) in zip(
+                    self.index.search(self.queries, self.matrix, nprobe=6),
+                    loaded.search(self.queries, self.matrix)):
+                np.testing.assert_array_equal(indices, loaded_indices)
+                np.testing.assert_array_equal(scores, loaded_scores)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_top_k_above_candidates(self):
+        """With fewer candidates than top_k, all candidates are returned, sorted by score"""
+        indices, scores = self.index.search(self.queries[:1], self.matrix, top_k=len(self.matrix), nprobe=1)[0]
+        probe = np.argmax(np.dot(self.index.centroids, self.queries[0]))
+        candidates = self.index.list_ids[self.index.list_offsets[probe]:self.index.list_offsets[probe + 1]]
+        self.assertLess(len(candidates), len(self.matrix))
+        self.assertEqual(sorted(indices), sorted(candidates))
+        np.testing.assert_allclose(scores, np.dot(self.matrix[indices], self.queries[0]), rtol=1e-5)
+        self.assertTrue(np.all(np.diff(scores) <= 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from matstract.extract.parsing import MaterialParser
+from matstract.models.element_index import ElementIndex, ELEMENT_BITS, element_mask
+
+
+class TestElementIndex(unittest.TestCase):
+    # Tb, Pb and U have bits 64 and above, in the hi word of the masks
+    FORMULAS = ["LiFePO4", "LiCoO2", "Fe2O3", "PbTiO3", "Bi2Te3", "UO2", "HgCdTe", "TbFeCo", "Au", "LiUF5",
+                "not a formula"]
+    FILTERS = [
+        (["Li"], None),
+        (None, ["O"]),
+        (["Tb"], None),
+        (["U", "Pb"], None),
+        (None, ["Tb", "Li"]),
+        (["Fe"], ["Tb"]),
+        (["Li", "Fe"], ["O", "U"]),
+        (["O"], ["O"]),
+        (None, None),
+    ]
+
+    def __init__(self, *args, **kwargs):
+        super(TestElementIndex, self).__init__(*args, **kwargs)
+        self.parser = MaterialParser()
+        self.index = ElementIndex.build(self.FORMULAS, self.parser)
+
+    def expected_mask(self, plus_elems, minus_elems):
+        """The element filter applied to every parsed formula"""
+        plus_elems, minus_elems = set(plus_elems or []), set(minus_elems or [])
+        plus_elems, minus_elems = plus_elems - minus_elems, minus_elems - plus_elems
+        keep = []
+        for formula in self.FORMULAS:
+            try:
+                elements = set(self.parser.parse_formula(formula).keys())
+            except Exception:
+                elements = set()
+            keep.append((not plus_elems or bool(elements & plus_elems)) and not elements & minus_elems)
+        return np.array(keep)
+
+    def test_element_mask(self):
+        self.assertGreaterEqual(ELEMENT_BITS["Tb"], 64)
+        self.assertEqual(element_mask(["Tb"]), (0, 1 << (ELEMENT_BITS["Tb"] - 64)))
+        self.assertEqual(element_mask(["H", "M"]), (1 << ELEMENT_BITS["H"], 0))
+
+    def test_filter_mask(self):
+        for plus_elems, minus_elems in self.FILTERS:
+            np.testing.assert_array_equal(self.index.filter_mask(plus_elems, minus_elems),
+                                          self.expected_mask(plus_elems, minus_elems),
+                                          err_msg="{} {}".format(plus_elems, minus_elems))
+        np.testing.assert_array_equal(self.index.filter_mask(["Tb"]), [f == "TbFeCo" for f in self.FORMULAS])
+        self.assertFalse(self.index.filter_mask(["O"])[-1])
+        self.assertTrue(self.index.filter_mask(minus_elems=["O"])[-1])
+
+    def test_save_load(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, "element_index.npz")
+            self.index.save(path)
+            loaded = ElementIndex.load(path)
+            self.assertEqual(len(loaded), len(self.FORMULAS))
+            np.testing.assert_array_equal(loaded.filter_mask(["U"], ["O"]), self.index.filter_mask(["U"], ["O"]))
+        finally:
+            shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import os
+import unittest
+import numpy as np
+from matstract.models.quantization import QuantizedMatrix, NormalizedView
+
+
+class TestQuantizedMatrix(unittest.TestCase):
+    def __init__(self, *args, **kwargs):
+        """Creates clustered unit vectors, similar to word embeddings"""
+        super(TestQuantizedMatrix, self).__init__(*args, **kwargs)
+        rng = np.random.RandomState(0)
+        centers = rng.standard_normal((50, 64))
+        matrix = centers[rng.randint(0, 50, 5000)] + 0.5 * rng.standard_normal((5000, 64))
+        self.matrix = (matrix / np.linalg.norm(matrix, axis=1, keepdims=True)).astype(np.float32)
+        self.quantized = QuantizedMatrix.quantize(self.matrix, chunk_size=1000)
+
+    def test_quantize(self):
+        self.assertEqual(self.quantized.codes.dtype, np.int8)
+        self.assertEqual(self.quantized.nbytes, self.matrix.size + 4 * len(self.matrix))
+        # the rounding error is at most half a step of each row
+        error = np.abs(self.quantized[:] - self.matrix)
+        self.assertTrue(np.all(error <= self.quantized.scales[:, np.newaxis] / 2 + 1e-6))
+        np.testing.assert_allclose(self.quantized[[3, 7]], self.quantized[:][[3, 7]])
+
+    def test_dot(self):
+        queries = self.matrix[:10] + self.matrix[10:20]
+        np.testing.assert_allclose(self.quantized.dot(queries), np.dot(queries, self.matrix.T), atol=0.02)
+
+    def test_normalized_view(self):
+        matrix = (3 * self.matrix).astype(np.float16)
+        view = NormalizedView(matrix)
+        np.testing.assert_allclose(view[5], self.matrix[5], atol=1e-3)
+        np.testing.assert_array_equal(view[[1, 2]], view[:][[1, 2]])
+        np.testing.assert_array_equal(view[4, :], view[4])
+        self.assertEqual(np.asarray(view).shape, matrix.shape)
+
+
+@unittest.skipUnless(os.environ.get("MATSTRACT_BUNDLE"),
+                     "set MATSTRACT_BUNDLE to an engine bundle directory to run the accuracy regression")
+class TestQuantizedAnalogies(unittest.TestCase):
+    def test_analogies(self):
+        """The quantized engine gives the same close words, in the same order, for the web app analogies"""
+        from matstract.models.word_embeddings import EmbeddingEngine
+        from matstract.web.callbacks.mat2vec_callbacks import analogies
+        exact = EmbeddingEngine.from_bundle(os.environ["MATSTRACT_BUNDLE"])
+        quantized = EmbeddingEngine.from_bundle(os.environ["MATSTRACT_BUNDLE"], quantized=True)
+        for neg_1, pos_1, pos_2, _ in analogies:
+            vectors = [exact.get_word_vector(word) for word in [pos_1, neg_1, pos_2]]
+            if any(vector is None for vector in vectors):
+                continue
+            diff_vec = vectors[0] - vectors[1] + vectors[2]
+            diff_vec = diff_vec / np.linalg.norm(diff_vec)
+            self.assertEqual(quantized.close_words(diff_vec, top_k=20, exclude_self=False)[0],
+                             exact.close_words(diff_vec, top_k=20, exclude_self=False)[0])
+            self.assertEqual(quantized.close_words(pos_1)[0], exact.close_words(pos_1)[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,163 @@
+import os
+import json
+import shutil
+import pickle
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+from matstract.nlp import data_preparation
+from matstract.models import word_embeddings
+from matstract.models.word_embeddings import EmbeddingEngine, top_k_indices
+
+
+def make_data_preparation():
+    """DataPreparation without the database and the pickled classifiers"""
+    with mock.patch.object(data_preparation, "AtlasConnection"), \
+            mock.patch.object(data_preparation.pickle, "load"), \
+            mock.patch.object(data_preparation, "open", mock.mock_open(), create=True):
+        return data_preparation.DataPreparation()
+
+
+class TestTopKIndices(unittest.TestCase):
+    def test_distinct(self):
+        scores = np.random.RandomState(0).standard_normal((5, 100))
+        for k in [1, 7, 99, 100, 250]:
+            np.testing.assert_array_equal(top_k_indices(scores, k), np.argsort(-scores, axis=1)[:, :k])
+
+    def test_ties(self):
+        """Tied scores may come in any order, but the scores are the same as with a full sort"""
+        scores = np.random.RandomState(1).randint(0, 5, (5, 40)).astype(np.float32)
+        for k in [1, 3, 10, 40, 41]:
+            top = top_k_indices(scores, k)
+            self.assertEqual(top.shape, (5, min(k, 40)))
+            for row, indices in zip(scores, top):
+                self.assertEqual(len(set(indices)), len(indices))
+                np.testing.assert_array_equal(row[indices], row[np.argsort(-row)[:k]])
+
+    def test_empty(self):
+        self.assertEqual(top_k_indices(np.ones((3, 4)), 0).shape, (3, 0))
+
+
+class TestEmbeddingEngine(unittest.TestCase):
+    """A tiny engine written to a temporary directory and loaded with the constructor"""
+    WORDS = ["iron", "oxide", "cathode", "battery", "thermoelectric", "ferroelectric", "film", "magnet"]
+    FORMULAS = ["LiFePO4", "LiCoO2", "Fe2O3", "PbTiO3", "Bi2Te3", "UO2", "HgCdTe", "TbFeCo", "Au", "Fe", "O"]
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.dp = make_data_preparation()
+        rng = np.random.RandomState(0)
+        formulas = dict()
+        for i, writing in enumerate(self.FORMULAS):
+            formulas[self.dp.process_sentence([writing])[0][0]] = {writing: 20 + i}
+        vocabulary = self.WORDS + sorted(formulas)
+        with open(os.path.join(self.tmpdir, "vocabulary.tsv"), "w", encoding="utf-8") as f:
+            f.write("\n".join(vocabulary) + "\n")
+        for name in ["embeddings", "out_embeddings"]:
+            np.save(os.path.join(self.tmpdir, name + ".npy"), rng.standard_normal((len(vocabulary), 16)))
+        with open(os.path.join(self.tmpdir, "formulas.pkl"), "wb") as f:
+            pickle.dump(formulas, f)
+
+        with mock.patch.object(word_embeddings, "DataPreparation", return_value=self.dp):
+            self.engine = EmbeddingEngine(
+                emb_file=os.path.join(self.tmpdir, "embeddings.npy"),
+                out_emb_file=os.path.join(self.tmpdir, "out_embeddings.npy"),
+                dict_url=os.path.join(self.tmpdir, "vocabulary.tsv"),
+                formulas_file=os.path.join(self.tmpdir, "formulas.pkl"))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_close_words(self):
+        """Same close words as a full sort of the cosine similarities"""
+        normalized = self.engine.embeddings / np.linalg.norm(self.engine.embeddings, axis=1, keepdims=True)
+        for word in ["iron", "battery", "Fe2O3"]:
+            scores = np.dot(normalized, normalized[self.engine.word2index[word]])
+            expected = [self.engine.reverse_dictionary[i] for i in np.argsort(-scores)]
+            close_words, close_scores = self.engine.close_words(word, top_k=4)
+            self.assertEqual(close_words, expected[1:5])
+            np.testing.assert_allclose(close_scores, np.sort(scores)[::-1][1:5], rtol=1e-5)
+            close_words, close_scores = self.engine.close_words(word, top_k=4, exclude_self=False)
+            self.assertEqual(close_words, expected[:4])
+            self.assertAlmostEqual(close_scores[0], 1, places=5)
+
+    def test_close_words_batch(self):
+        words = ["iron", "unknown", "Fe2O3", self.engine.normalized_embeddings[0]]
+        results = self.engine.close_words_batch(words, top_k=50)
+        self.assertEqual(results[1], [])
+        self.assertNotIn("iron", results[0][0])
+        self.assertEqual(len(results[0][0]), len(self.engine.reverse_dictionary) - 1)
+        close_words, scores = self.engine.close_words("iron", top_k=50)
+        self.assertEqual(results[0][0], close_words)
+        np.testing.assert_allclose(results[0][1], scores, rtol=1e-5)
+        self.assertEqual(results[3][0], results[0][0])
+
+    def test_element_filters(self):
+        """The element index gives the same materials as parsing the formulas one by one"""
+        filters = [(["Li"], None), (None, ["O"]), (["Tb", "U"], None), (["Fe"], ["Tb"]), (["Pb", "Bi"], ["Te"])]
+        formula_list = [(formula, i) for i, formula in enumerate(self.engine.formula_names)]
+        self.assertIsNone(self.engine.element_index)
+        parsed = [(self.engine.filter_by_elements(formula_list, plus, minus, max=100),
+                   self.engine.find_similar_materials(["battery"], plus_elems=plus, minus_elems=minus))
+                  for plus, minus in filters]
+        self.engine.build_element_index()
+        for (plus, minus), (filtered, similar) in zip(filters, parsed):
+            self.assertTrue(len(filtered) > 0)
+            mask = self.engine.element_index.filter_mask(plus, minus)
+            self.assertEqual(filtered, [(formula, i) for formula, i in formula_list if mask[i]])
+            self.assertEqual(self.engine.filter_by_elements(formula_list, plus, minus, max=100), filtered)
+            indexed = self.engine.find_similar_materials(["battery"], plus_elems=plus, minus_elems=minus)
+            self.assertEqual([formula for formula, _ in indexed], [formula for formula, _ in similar])
+            np.testing.assert_allclose([score for _, score in indexed], [score for _, score in similar], rtol=1e-5)
+        self.assertEqual([formula for formula, _ in self.engine.filter_by_elements(formula_list, ["Tb"])],
+                         ["CoFeTb"])
+
+    def load_bundle(self, path, **kwargs):
+        with mock.patch.object(word_embeddings, "DataPreparation", return_value=self.dp):
+            return EmbeddingEngine.from_bundle(path, **kwargs)
+
+    def test_bundle(self):
+        """An engine loaded from a bundle answers the same queries"""
+        path = os.path.join(self.tmpdir, "bundle")
+        self.engine.build_bundle(path)
+        bundle = self.load_bundle(path)
+        self.assertIsInstance(bundle.embeddings, np.memmap)
+        self.assertEqual(bundle.reverse_dictionary, self.engine.reverse_dictionary)
+        self.assertEqual(bundle.most_common_forms, self.engine.most_common_forms)
+        self.assertEqual(bundle.formulas_full, self.engine.formulas_full)
+        self.assertIsNotNone(bundle.element_index)
+        for word in ["iron", "battery", "Fe2O3"]:
+            self.assertEqual(bundle.close_words(word, top_k=5), self.engine.close_words(word, top_k=5))
+        for plus, minus in [(None, None), (["Li"], None), (["Fe", "U"], ["O"])]:
+            self.assertEqual(
+                bundle.find_similar_materials(["battery", "cathode"], plus_elems=plus, minus_elems=minus),
+                self.engine.find_similar_materials(["battery", "cathode"], plus_elems=plus, minus_elems=minus))
+        self.assertEqual(bundle.most_common_form([("FeLiO4P", 0.5)]), self.engine.most_common_form([("FeLiO4P", 0.5)]))
+
+    def test_bundle_ann_index(self):
+        """The approximate index is saved with the bundle; scanning all its lists gives the exact close words"""
+        self.engine.build_ann_index(n_lists=3)
+        path = os.path.join(self.tmpdir, "bundle")
+        self.engine.build_bundle(path, element_index=False)
+        bundle = self.load_bundle(path, nprobe=3)
+        self.assertIsNone(bundle.element_index)
+        self.assertEqual(bundle.ann_index.nprobe, 3)
+        for word in ["iron", "battery", "Fe2O3"]:
+            self.assertEqual(bundle.close_words(word, top_k=5)[0],
+                             self.engine.close_words_batch([word], top_k=5, exact=True)[0][0])
+
+    def test_bundle_version(self):
+        path = os.path.join(self.tmpdir, "bundle")
+        self.engine.build_bundle(path, element_index=False)
+        with open(os.path.join(path, "manifest.json")) as f:
+            manifest = json.load(f)
+        manifest["version"] = EmbeddingEngine.BUNDLE_VERSION + 1
+        with open(os.path.join(path, "manifest.json"), "w") as f:
+            json.dump(manifest, f)
+        with self.assertRaises(ValueError):
+            self.load_bundle(path)
+
+
+if __name__ == '__main__':
+    unittest.main()
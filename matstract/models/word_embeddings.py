@@ -1,9 +1,16 @@
 import numpy as np
 from matstract.nlp.data_preparation import DataPreparation
-from gensim.models.phrases import Phraser, Phrases
-from collections import defaultdict
+from matstract.models.ann_index import IVFIndex
+from matstract.models.element_index import ElementIndex
+from matstract.models.quantization import QuantizedMatrix, NormalizedView
+from matstract.nlp.phrases import PhraseTokenizer
 import operator
+import itertools
 import regex
+import threading
+import os
+import json
+import argparse
 
 
 class EmbeddingEngine:
@@ -15,29 +22,64 @@ class EmbeddingEngine:
                  "CPo", "LiPb17", "CsS", "EsIS", "AsCU", "CCsHS", "CsHPU", "AsOS", "AsCI", "EsF", "FV448",
                  "CNS", "CP5", "AsFP", "EsOP", "NS", "NS2", "EsI", "BH", "PPmV", "PSe", "AsN", "OPV5",
                  "NSiW"]
+    BUNDLE_VERSION = 1
 
     def __init__(
             self,
             emb_file=None,
             out_emb_file=None,
             dict_url="https://s3-us-west-1.amazonaws.com/materialsintelligence/model_rel3273k_sg_w8_n15_a001_phrtsh15_pc10_pd3_ss-4.tsv",
-            formulas_file=None):
-        ds = np.DataSource()
+            formulas_file=None,
+            mmap_mode="r",
+            normalized_dtype=np.float32,
+            norm_emb_file=None,
+            norm_out_emb_file=None,
+            ann_index_file=None,
+            nprobe=8,
+            element_index_file=None,
+            quantized=False,
+            quantized_emb_file=None,
+            rerank_candidates=64):
+        """
+        :param emb_file: local .npy file with the word embeddings, downloaded from S3 if None
+        :param out_emb_file: local .npy file with the output embeddings, downloaded from S3 if None
+        :param dict_url: url or path of the tsv dictionary
+        :param formulas_file: local .pkl file with the formula counts, downloaded from S3 if None
+        :param mmap_mode: passed to np.load; the default "r" memory-maps the embedding matrices so that
+        all processes on the host share the same pages through the OS page cache. None loads them to memory.
+        :param normalized_dtype: dtype of the unit-normalized embedding matrices used for all similarity queries
+        :param norm_emb_file: .npy file with the unit-normalized embeddings; loaded if it exists,
+        otherwise computed and saved there
+        :param norm_out_emb_file: same as norm_emb_file, for the output embeddings; only read (or computed)
+        on the first query with use_output_emb
+        :param ann_index_file: .npz file with an IVFIndex built by build_ann_index; if given,
+        close words are found approximately through the index instead of a full scan
+        :param nprobe: number of index lists scanned per query, more is slower but more accurate
+        :param element_index_file: .npz file with the element index of the formulas, see build_element_index.
+        Without an index, element filters parse the candidate formulas one by one at query time.
+        :param quantized: if True, close words are scored against an int8 copy of the normalized embeddings
+        and the best rerank_candidates are rescored exactly; the float32 normalized matrices are not kept,
+        their rows are computed from the embeddings when needed
+        :param quantized_emb_file: .npz file with the int8 embeddings; loaded if it exists, otherwise
+        computed and saved there
+        :param rerank_candidates: number of close word candidates rescored exactly when quantized
+        """
+        ds = np.lib.npyio.DataSource()
 
         # loading pre-trained embeddings and the dictionary
         if emb_file is not None:
-            self.embeddings = np.load(emb_file)
+            self.embeddings = np.load(emb_file, mmap_mode=mmap_mode)
         else:
             embeddings_url = "https://s3-us-west-1.amazonaws.com/materialsintelligence/model_rel3273k_sg_w8_n15_a001_phrtsh15_pc10_pd3_ss-4_float16.wv.vectors.npy"
             ds.open(embeddings_url)
-            self.embeddings = np.load(ds.abspath(embeddings_url))
+            self.embeddings = np.load(ds.abspath(embeddings_url), mmap_mode=mmap_mode)
 
         if out_emb_file is not None:
-            self.out_embeddings = np.load(out_emb_file)
+            self.out_embeddings = np.load(out_emb_file, mmap_mode=mmap_mode)
         else:
             out_embeddings_url = "https://s3-us-west-1.amazonaws.com/materialsintelligence/model_rel3273k_sg_w8_n15_a001_phrtsh15_pc10_pd3_ss-4_float16.trainables.syn1neg.npy"
             ds.open(out_embeddings_url)
-            self.out_embeddings = np.load(ds.abspath(out_embeddings_url))
+            self.out_embeddings = np.load(ds.abspath(out_embeddings_url), mmap_mode=mmap_mode)
 
         with ds.open(dict_url, encoding='utf-8') as f:
             self.reverse_dictionary = [x.strip('\n') for x in f.readlines()]
@@ -48,38 +90,50 @@ class EmbeddingEngine:
 
         self.norm = np.sqrt(np.sum(np.square(self.embeddings), 1, keepdims=True))
         self.out_norm = np.sqrt(np.sum(np.square(self.out_embeddings), 1, keepdims=True))
-        # self.normalized_embeddings = embeddings / self.norm
-        # del embeddings  # to free up some memory
-
-        phrases = Phrases(threshold=0.0001, min_count=1)
-        vocab = defaultdict(int)
-        for word in self.reverse_dictionary:
-            if "_" in word:
-                vocab[str.encode(word)] = 100  # phrase
-            else:
-                vocab[str.encode(word)] = 1  # single word
-        phrases.vocab = vocab
-        self.phraser = Phraser(phrases)
-        del vocab, phrases
+
+        # unit-normalized matrices, computed once and shared by all queries
+        self.rerank_candidates = rerank_candidates
+        if quantized:
+            self.normalized_embeddings = NormalizedView(self.embeddings, dtype=normalized_dtype)
+            self.normalized_out_embeddings = NormalizedView(self.out_embeddings, dtype=normalized_dtype)
+            self.quantized_embeddings = load_quantized(self.normalized_embeddings, quantized_emb_file)
+        else:
+            self.normalized_embeddings = load_normalized(
+                self.embeddings, norm_emb_file, dtype=normalized_dtype, mmap_mode=mmap_mode)
+            # only needed for use_output_emb queries, see the normalized_out_embeddings property
+            self._normalized_out_embeddings = None
+            self._norm_out_emb_args = (norm_out_emb_file, normalized_dtype, mmap_mode)
+            self.quantized_embeddings = None
+        self.ann_index = IVFIndex.load(ann_index_file, nprobe=nprobe) if ann_index_file is not None else None
+
+        self.phraser = PhraseTokenizer(self.word2index)
 
         self.dp = DataPreparation()
         # loading pre-trained embeddings and the dictionary
         if formulas_file is not None:
-            self.formulas = self.dp.load_obj(formulas_file[:-4])
-            self.formulas_full = self.dp.load_obj(formulas_file[:-4])
+            formulas_full = self.dp.load_obj(formulas_file[:-4])
         else:
             formulas_url = "https://s3-us-west-1.amazonaws.com/materialsintelligence/relevant_3273k_formula.pkl"
             ds.open(formulas_url)
-            self.formulas = self.dp.load_obj(ds.abspath(formulas_url[:-4]))
-            self.formulas_full = self.dp.load_obj(ds.abspath(formulas_url[:-4]))
-        for abbr in self.ABBR_LIST:
-            self.formulas.pop(abbr, None)
-
-        self.formula_counts = [0] * len(self.formulas)
-        for i, formula in enumerate(self.formulas):
-            for writing in self.formulas[formula]:
-                self.formula_counts[i] += self.formulas[formula][writing]
+            formulas_full = self.dp.load_obj(ds.abspath(formulas_url[:-4]))
         del ds
+        self._bundle_path = None
+        self._formulas = None
+        self._formulas_full = formulas_full
+
+        # parallel arrays over the formulas in the vocabulary, for vectorized similarity queries
+        self.formula_names = [formula for formula in self.formulas if formula in self.word2index]
+        self.formula_indices = np.array([self.word2index[formula] for formula in self.formula_names], dtype=np.int64)
+        self.formula_count_array = np.array(
+            [sum(self.formulas[formula].values()) for formula in self.formula_names], dtype=np.int64)
+        self.formula_positions = {formula: i for i, formula in enumerate(self.formula_names)}
+
+        self.element_index_file = element_index_file
+        self.element_index = None
+        if element_index_file is not None and os.path.exists(element_index_file):
+            self.element_index = ElementIndex.load(element_index_file)
+            if len(self.element_index) != len(self.formula_names):
+                self.element_index = None  # built for a different formula list
 
         self.most_common_forms = dict()
         for material in self.formulas_full:
@@ -88,6 +142,159 @@ class EmbeddingEngine:
             else:
                 self.most_common_forms[material] = max(self.formulas_full[material].items(), key=operator.itemgetter(1))[0]
 
+    @property
+    def normalized_out_embeddings(self):
+        """
+        The unit-normalized output embeddings. Unless they were memory-mapped from a bundle, they are
+        loaded from norm_out_emb_file or computed when first used, since most queries do not need them.
+        """
+        if self._normalized_out_embeddings is None:
+            with _normalized_lock:
+                if self._normalized_out_embeddings is None:
+                    norm_file, dtype, mmap_mode = self._norm_out_emb_args
+                    self._normalized_out_embeddings = load_normalized(
+                        self.out_embeddings, norm_file, dtype=dtype, mmap_mode=mmap_mode)
+        return self._normalized_out_embeddings
+
+    @normalized_out_embeddings.setter
+    def normalized_out_embeddings(self, value):
+        self._normalized_out_embeddings = value
+
+    @property
+    def formulas_full(self):
+        """
+        All formulas with the counts of their different writings, {formula: {writing: count}}.
+        Engines loaded from a bundle only read it from disk when it is first accessed.
+        """
+        if self._formulas_full is None:
+            self._formulas_full = self.dp.load_obj(os.path.join(self._bundle_path, "formulas_full"))
+        return self._formulas_full
+
+    @property
+    def formulas(self):
+        """
+        Same as formulas_full, without the abbreviations in ABBR_LIST that parse as formulas
+        """
+        if self._formulas is None:
+            abbreviations = set(self.ABBR_LIST)
+            self._formulas = {formula: writings for formula, writings in self.formulas_full.items()
+                              if formula not in abbreviations}
+        return self._formulas
+
+    def build_bundle(self, path, element_index=True):
+        """
+        Writes the engine with all its derived structures to a local directory that
+        from_bundle loads without any network access or recomputation
+        :param path: the bundle directory, created if it does not exist
+        :param element_index: if True, the element index is built (slow) and included
+        """
+        if not os.path.exists(path):
+            os.makedirs(path)
+        arrays = {
+            "embeddings": self.embeddings,
+            "out_embeddings": self.out_embeddings,
+            "norm": self.norm,
+            "out_norm": self.out_norm,
+            "normalized_embeddings": self.normalized_embeddings,
+            "normalized_out_embeddings": self.normalized_out_embeddings,
+            "formula_indices": self.formula_indices,
+            "formula_counts": self.formula_count_array,
+        }
+        for name, array in arrays.items():
+            np.save(os.path.join(path, name + ".npy"), array)
+        common_forms = list(self.most_common_forms.items())
+        lists = {
+            "vocabulary": self.reverse_dictionary,
+            "formula_names": self.formula_names,
+            "common_forms_formulas": [formula for formula, _ in common_forms],
+            "common_forms_writings": [writing for _, writing in common_forms],
+        }
+        for name, lines in lists.items():
+            _save_lines(os.path.join(path, name + ".txt"), lines)
+        self.dp.save_obj(self.formulas_full, os.path.join(path, "formulas_full"))
+
+        files = [name + ".npy" for name in arrays] + [name + ".txt" for name in lists] + ["formulas_full.pkl"]
+        if element_index:
+            self.get_element_index().save(os.path.join(path, "element_index.npz"))
+            files.append("element_index.npz")
+        if self.ann_index is not None:
+            self.ann_index.save(os.path.join(path, "ann_index.npz"))
+            files.append("ann_index.npz")
+        if self.quantized_embeddings is not None:
+            self.quantized_embeddings.save(os.path.join(path, "quantized_embeddings.npz"))
+            files.append("quantized_embeddings.npz")
+
+        manifest = {
+            "version": self.BUNDLE_VERSION,
+            "vocabulary_size": len(self.reverse_dictionary),
+            "dimensions": int(self.embeddings.shape[1]),
+            "normalized_dtype": np.dtype(self.normalized_embeddings.dtype).name,
+            "files": files,
+        }
+        with open(os.path.join(path, "manifest.json"), "w") as f:
+            json.dump(manifest, f, indent=2)
+
+    @classmethod
+    def from_bundle(cls, path, mmap_mode="r", nprobe=8, quantized=False, rerank_candidates=64):
+        """
+        Loads an engine from a directory written by build_bundle. All matrices are memory-mapped
+        and nothing is downloaded or recomputed.
+        :param path: the bundle directory
+        :param mmap_mode: passed to np.load for all the matrices
+        :param nprobe: number of lists scanned per query if the bundle has an approximate index
+        :param quantized: if True, use int8 embeddings for close words, see the constructor
+        :param rerank_candidates: number of close word candidates rescored exactly when quantized
+        :return: the EmbeddingEngine
+        """
+        with open(os.path.join(path, "manifest.json")) as f:
+            manifest = json.load(f)
+        if manifest["version"] != cls.BUNDLE_VERSION:
+            raise ValueError("Bundle version {} is not supported, expected {}. Please rebuild the bundle.".format(
+                manifest["version"], cls.BUNDLE_VERSION))
+
+        def load(name):
+            return np.load(os.path.join(path, name + ".npy"), mmap_mode=mmap_mode)
+
+        engine = cls.__new__(cls)
+        engine.embeddings = load("embeddings")
+        engine.out_embeddings = load("out_embeddings")
+        engine.norm = load("norm")
+        engine.out_norm = load("out_norm")
+        files = set(manifest["files"])
+        engine.rerank_candidates = rerank_candidates
+        if quantized:
+            normalized_dtype = np.dtype(manifest["normalized_dtype"])
+            engine.normalized_embeddings = NormalizedView(engine.embeddings, dtype=normalized_dtype)
+            engine.normalized_out_embeddings = NormalizedView(engine.out_embeddings, dtype=normalized_dtype)
+            engine.quantized_embeddings = QuantizedMatrix.load(os.path.join(path, "quantized_embeddings.npz")) \
+                if "quantized_embeddings.npz" in files else QuantizedMatrix.quantize(load("normalized_embeddings"))
+        else:
+            engine.normalized_embeddings = load("normalized_embeddings")
+            engine.normalized_out_embeddings = load("normalized_out_embeddings")
+            engine.quantized_embeddings = None
+        engine.reverse_dictionary = _load_lines(os.path.join(path, "vocabulary.txt"))
+        engine.word2index = {word: i for i, word in enumerate(engine.reverse_dictionary)}
+        engine.phraser = PhraseTokenizer(engine.word2index)
+        engine.dp = DataPreparation()
+
+        engine._bundle_path = path
+        engine._formulas = None
+        engine._formulas_full = None
+        engine.formula_names = _load_lines(os.path.join(path, "formula_names.txt"))
+        engine.formula_indices = np.load(os.path.join(path, "formula_indices.npy"))
+        engine.formula_count_array = np.load(os.path.join(path, "formula_counts.npy"))
+        engine.formula_positions = {formula: i for i, formula in enumerate(engine.formula_names)}
+        engine.most_common_forms = dict(zip(
+            _load_lines(os.path.join(path, "common_forms_formulas.txt")),
+            _load_lines(os.path.join(path, "common_forms_writings.txt"))))
+
+        engine.element_index_file = None
+        engine.element_index = ElementIndex.load(os.path.join(path, "element_index.npz")) \
+            if "element_index.npz" in files else None
+        engine.ann_index = IVFIndex.load(os.path.join(path, "ann_index.npz"), nprobe=nprobe) \
+            if "ann_index.npz" in files else None
+        return engine
+
     def close_words(self, word, top_k=8, exclude_self=True):
         """
         Returns a list of close words
@@ -96,23 +303,62 @@ class EmbeddingEngine:
         :param exclude_self: boolean, if the supplied word should be excluded or not
         :return:
         """
-        close_words = []
-        scores = []
-        normalized_embeddings = self.embeddings / self.norm
-        if isinstance(word, str):
-            word_embedding = self.get_word_vector(word)
-        else:
-            word_embedding = word
-
-        if word_embedding is not None:
-            sim = np.dot([word_embedding], normalized_embeddings.T)
-            nearest = (-sim[0, :]).argsort()[1:top_k + 1] if exclude_self else (-sim[0, :]).argsort()[:top_k]
-            for k in range(top_k):
-                close_words.append(self.reverse_dictionary[nearest[k]])
-                scores.append(sim[0, nearest[k]])
-            return close_words, scores
+        return self.close_words_batch([word], top_k=top_k, exclude_self=exclude_self)[0]
+
+    def close_words_batch(self, words_or_vectors, top_k=8, exclude_self=True, exact=False):
+        """
+        Returns close words for many queries at once, using a single matrix product
+        with the vocabulary and a partial sort for each query
+        :param words_or_vectors: a list of strings and/or numeric vectors
+        :param top_k: number of close words to return for each query
+        :param exclude_self: boolean, if the most similar word (the query itself) should be excluded or not
+        :param exact: if True, always scan the full vocabulary even if an approximate index is loaded
+        :return: a list with a (close_words, scores) tuple for each query, or [] for the
+        queries that are not in the vocabulary
+        """
+        vectors = []
+        for word in words_or_vectors:
+            vectors.append(self.get_word_vector(word) if isinstance(word, str) else word)
+        found = [i for i, vector in enumerate(vectors) if vector is not None]
+
+        results = [[] for _ in vectors]
+        if len(found) == 0:
+            return results
+        queries = np.array([vectors[i] for i in found], dtype=np.float32)
+        n_nearest = top_k + 1 if exclude_self else top_k
+        if self.ann_index is not None and not exact:
+            neighbours = self.ann_index.search(queries, self.normalized_embeddings, top_k=n_nearest)
+        elif self.quantized_embeddings is not None and not exact:
+            # approximate int8 scores, then the candidates are rescored exactly to restore the float32 order
+            sim = self.quantized_embeddings.dot(queries)
+            neighbours = []
+            for query, candidates in zip(queries, top_k_indices(sim, max(n_nearest, self.rerank_candidates))):
+                scores = np.dot(self.normalized_embeddings[candidates], query)
+                nearest = top_k_indices(scores[np.newaxis, :], n_nearest)[0]
+                neighbours.append((candidates[nearest], scores[nearest]))
         else:
-            return []
+            sim = np.dot(queries, np.asarray(self.normalized_embeddings).T)
+            neighbours = [(nearest, sim[row, nearest]) for row, nearest in enumerate(top_k_indices(sim, n_nearest))]
+        for (nearest, scores), i in zip(neighbours, found):
+            if exclude_self:
+                nearest, scores = nearest[1:], scores[1:]
+            results[i] = ([self.reverse_dictionary[index] for index in nearest], list(scores))
+        return results
+
+    def build_ann_index(self, ann_index_file=None, n_lists=None, nprobe=8, **kwargs):
+        """
+        Builds the approximate nearest-neighbour index over the normalized embeddings (an offline step,
+        takes minutes on the full vocabulary) and starts using it for close_words
+        :param ann_index_file: if given, the index is saved to this .npz file for the ann_index_file argument
+        :param n_lists: number of index lists, see IVFIndex.build
+        :param nprobe: number of index lists scanned per query
+        :param kwargs: other arguments for IVFIndex.build
+        :return: the IVFIndex
+        """
+        self.ann_index = IVFIndex.build(self.normalized_embeddings, n_lists=n_lists, nprobe=nprobe, **kwargs)
+        if ann_index_file is not None:
+            self.ann_index.save(ann_index_file)
+        return self.ann_index
 
     def get_word_vector(self, word):
         """
@@ -125,26 +371,30 @@ class EmbeddingEngine:
             word = self.dp.process_sentence([word])[0][0]
             # get all normalized word vectors
             try:
-                return (self.embeddings / self.norm)[self.word2index[word], :]
+                return self.normalized_embeddings[self.word2index[word], :]
             except Exception as ex:
                 print(ex)
                 return None
         else:
             return None
 
-    def find_similar_materials(self, sentence, n_sentence=None, min_count=10, use_output_emb=False, normout=True):
+    def find_similar_materials(self, sentence, n_sentence=None, min_count=10, use_output_emb=False, normout=True,
+                               top_n=None, plus_elems=None, minus_elems=None):
         """
         Finds materials that match the best with the context of the sentence
         :param sentence: a list of words
+        :param n_sentence: a list of words with negative contribution
         :param min_count: the minimum number of occurances for the formula to be considered
-        :return:
+        :param top_n: number of materials to return, all materials are returned if None
+        :param plus_elems: only return materials containing at least one of these elements
+        :param minus_elems: only return materials containing none of these elements
+        :return: a list of (formula, similarity) tuples sorted by decreasing similarity
         """
-        similarities = dict()
-        avg_embedding = np.zeros(self.embeddings.shape[1])
+        avg_embedding = np.zeros(self.embeddings.shape[1], dtype=np.float32)
         nr_words = 0
-        normalized_embeddings = self.embeddings / self.norm
+        normalized_embeddings = self.normalized_embeddings
         if normout:
-            embs = (self.out_embeddings / self.out_norm) if use_output_emb else normalized_embeddings  # the embeddings to use for similarity
+            embs = self.normalized_out_embeddings if use_output_emb else normalized_embeddings  # the embeddings to use for similarity
         else:
             embs = self.out_embeddings if use_output_emb else normalized_embeddings
         # positive contribution
@@ -158,11 +408,27 @@ class EmbeddingEngine:
                 if n_word in self.word2index:
                     avg_embedding -= normalized_embeddings[self.word2index[n_word]]
                     nr_words += 1
+        if nr_words == 0:
+            return []
         avg_embedding = avg_embedding / nr_words
-        for i, formla in enumerate(self.formulas):
-            if self.formula_counts[i] > min_count and formla in self.word2index:
-                similarities[formla] = np.dot(avg_embedding, embs[self.word2index[formla]])
-        return sorted(similarities.items(), key=lambda x: x[1], reverse=True)
+
+        candidate_mask = self.formula_count_array > min_count
+        parse_filter = bool(plus_elems or minus_elems)
+        if parse_filter and self.element_index is not None:
+            candidate_mask &= self.element_index.filter_mask(plus_elems, minus_elems)
+            parse_filter = False
+        candidates = np.flatnonzero(candidate_mask)
+        similarities = np.dot(np.asarray(embs[self.formula_indices[candidates]], dtype=np.float32), avg_embedding)
+        if parse_filter:
+            # no element index: parse the candidates from the most similar one until top_n match
+            nearest = (i for i in np.argsort(-similarities, kind="stable")
+                       if self._has_elements(self.formula_names[candidates[i]], plus_elems, minus_elems))
+            nearest = list(itertools.islice(nearest, top_n))
+        elif top_n is None:
+            nearest = np.argsort(-similarities, kind="stable")
+        else:
+            nearest = top_k_indices(similarities[np.newaxis, :], top_n)[0]
+        return [(self.formula_names[candidates[i]], similarities[i]) for i in nearest]
 
     def most_common_form(self, form_dict):
         """
@@ -172,56 +438,215 @@ class EmbeddingEngine:
         """
         common_form_score_cout = []
         for formula in form_dict:
-            if formula[0] in self.dp.ELEMENTS:
-                most_common_form = formula[0]
+            if formula[0] in self.formula_positions:
+                count = self.formula_count_array[self.formula_positions[formula[0]]]
             else:
-                most_common_form = max(self.formulas[formula[0]].items(), key=operator.itemgetter(1))[0]
+                count = sum(self.formulas[formula[0]].values())
             common_form_score_cout.append((
-                most_common_form,
+                self.most_common_forms[formula[0]],
                 formula[1],
-                sum(self.formulas[formula[0]].values()),
+                count,
                 self.norm[self.word2index[formula[0]]][0]))
         return common_form_score_cout
 
+    def build_element_index(self, element_index_file=None):
+        """
+        Builds the element index of formula_names (an offline step, parses every formula and takes
+        minutes) and starts using it for element filters
+        :param element_index_file: if given, the index is saved to this .npz file for the element_index_file argument
+        :return: the ElementIndex
+        """
+        self.element_index = ElementIndex.build(self.formula_names, self.dp.parser)
+        if element_index_file is not None:
+            self.element_index.save(element_index_file)
+        return self.element_index
+
+    def get_element_index(self):
+        """
+        Returns the element index of formula_names, building it if it was not loaded (slow, see
+        build_element_index)
+        :return: the ElementIndex
+        """
+        if self.element_index is None:
+            self.build_element_index(self.element_index_file)
+        return self.element_index
+
+    def _has_elements(self, formula, plus_elems=None, minus_elems=None):
+        """
+        Parses a single formula and checks it against the element filters, see ElementIndex.filter_mask
+        """
+        return ElementIndex.build([formula], self.dp.parser).filter_mask(plus_elems, minus_elems)[0]
+
     def filter_by_elements(self, formula_list, plus_elems=None, minus_elems=None, max=50):
-        if plus_elems is None:
-            plus_elems = []
-        if minus_elems is None:
-            minus_elems = []
-        pe = set(plus_elems) - set(minus_elems)
-        minus_elems = set(minus_elems) - set(plus_elems)
-        plus_elems = pe
-
-        def has_plus(composition, plus_elems):
-            if plus_elems is None or len(plus_elems) == 0:
-                return True
-            for elem in composition:
-                if elem in plus_elems:
-                    return True
-            return False
-
-        def has_minus(composition, minus_elems):
-            if minus_elems is None or len(minus_elems) == 0:
-                return False
-            for elem in composition:
-                if elem in minus_elems:
-                    return True
-            return False
-
-        matched = 0
+        """
+        Filters a list of (formula, score) tuples by the elements in the formulas
+        :param formula_list: list of (formula, score) tuples, e.g. from find_similar_materials
+        :param plus_elems: keep formulas containing at least one of these elements
+        :param minus_elems: keep formulas containing none of these elements
+        :param max: maximum number of formulas to return
+        :return: the first max matching tuples
+        """
+        if not plus_elems and not minus_elems:
+            return formula_list[:max]
+        keep = self.element_index.filter_mask(plus_elems, minus_elems) if self.element_index is not None else None
         matched_formula = []
         for form in formula_list:
-            composition = self.dp.parser.parse_formula(form[0])
-            if has_plus(composition, plus_elems) and not has_minus(composition, minus_elems):
+            position = self.formula_positions.get(form[0])
+            if keep is not None and position is not None:
+                matched = keep[position]
+            else:
+                matched = self._has_elements(form[0], plus_elems, minus_elems)
+            if matched:
                 matched_formula.append(form)
-                matched += 1
-            if matched >= max:
-                return matched_formula
+                if len(matched_formula) >= max:
+                    break
         return matched_formula
 
 
+def _save_lines(path, lines):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines))
+
+
+def _load_lines(path):
+    with open(path, encoding="utf-8") as f:
+        content = f.read()
+    return content.split("\n") if len(content) > 0 else []
+
+
+def top_k_indices(scores, k):
+    """
+    Returns the indices of the k largest scores in each row, sorted by decreasing score.
+    Uses np.argpartition, so only the selected k entries are sorted.
+    :param scores: 2d array of scores, one row per query
+    :param k: number of indices to return for each row
+    :return: 2d int array of shape (n_rows, min(k, n_columns))
+    """
+    k = min(k, scores.shape[1])
+    if k == 0:
+        return np.empty((scores.shape[0], 0), dtype=np.intp)
+    if k < scores.shape[1]:
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        top = np.tile(np.arange(k), (scores.shape[0], 1))
+    order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(top, order, axis=1)
+
+
+def normalize_rows(matrix, dtype=np.float32, chunk_size=65536):
+    """
+    Returns a copy of the matrix with all rows scaled to unit length. Works in chunks so
+    that no full-size float64 temporary is ever allocated.
+    :param matrix: 2d array (may be memory-mapped)
+    :param dtype: dtype of the returned matrix
+    :param chunk_size: number of rows normalized at a time
+    :return: the normalized matrix
+    """
+    normalized = np.empty(matrix.shape, dtype=dtype)
+    for start in range(0, matrix.shape[0], chunk_size):
+        chunk = np.asarray(matrix[start:start + chunk_size], dtype=np.float32)
+        norm = np.sqrt(np.sum(np.square(chunk), 1, keepdims=True))
+        norm[norm == 0] = 1
+        normalized[start:start + chunk_size] = chunk / norm
+    return normalized
+
+
+def load_normalized(matrix, norm_file=None, dtype=np.float32, mmap_mode=None):
+    """
+    Loads the unit-normalized version of the matrix from norm_file, or computes it
+    and saves it to norm_file (if given) for the next start
+    :param matrix: the original 2d array
+    :param norm_file: .npy path of the persisted normalized matrix, or None
+    :param dtype: dtype of the normalized matrix
+    :param mmap_mode: passed to np.load when reading norm_file
+    :return: the normalized matrix
+    """
+    if norm_file is not None and os.path.exists(norm_file):
+        normalized = np.load(norm_file, mmap_mode=mmap_mode)
+        if normalized.shape == matrix.shape and normalized.dtype == dtype:
+            return normalized
+    normalized = normalize_rows(matrix, dtype=dtype)
+    if norm_file is not None:
+        np.save(norm_file, normalized)
+    return normalized
+
+
+def load_quantized(matrix, quantized_file=None):
+    """
+    Loads the int8 version of the matrix from quantized_file, or computes it and saves it
+    to quantized_file (if given) for the next start
+    :param matrix: the 2d array to quantize, e.g. the normalized embeddings
+    :param quantized_file: .npz path of the persisted QuantizedMatrix, or None
+    :return: the QuantizedMatrix
+    """
+    if quantized_file is not None and os.path.exists(quantized_file):
+        quantized = QuantizedMatrix.load(quantized_file)
+        if quantized.shape == matrix.shape:
+            return quantized
+    quantized = QuantizedMatrix.quantize(matrix)
+    if quantized_file is not None:
+        quantized.save(quantized_file)
+    return quantized
+
+
+_engines = dict()
+_engines_lock = threading.Lock()
+_normalized_lock = threading.Lock()
+
+
+def get_embedding_engine(**kwargs):
+    """
+    Returns the EmbeddingEngine shared by the whole process, creating it on the first call.
+    Engines are cached per set of constructor arguments, so callbacks can call this on
+    every request instead of constructing a new EmbeddingEngine.
+    Without arguments, the engine is loaded with from_bundle from the directory in the
+    MATSTRACT_EMBEDDING_BUNDLE environment variable if it is set (see build_bundle and main), so that
+    the workers memory-map the normalized matrices and the element index instead of computing them.
+    :param kwargs: keyword arguments for the EmbeddingEngine constructor
+    :return: the shared EmbeddingEngine instance
+    """
+    key = tuple(sorted(kwargs.items()))
+    engine = _engines.get(key)
+    if engine is None:
+        with _engines_lock:
+            # another thread may have loaded it while we were waiting
+            engine = _engines.get(key)
+            if engine is None:
+                bundle = os.environ.get("MATSTRACT_EMBEDDING_BUNDLE") if not kwargs else None
+                engine = EmbeddingEngine.from_bundle(bundle) if bundle else EmbeddingEngine(**kwargs)
+                _engines[key] = engine
+    return engine
+
+
 def number_to_substring(text, latex=False):
     if not latex:
         return regex.sub("(\d*\.?\d+)", r'<sub>\1</sub>', text)
     else:
         return regex.sub("(\d*\.?\d+)", r'_\1', text)
+
+
+def main():
+    """
+    Builds an engine bundle for the web app, the offline step before deployment.
+
+    Usage:
+        python -m matstract.models.word_embeddings /srv/matstract/embeddings
+        MATSTRACT_EMBEDDING_BUNDLE=/srv/matstract/embeddings gunicorn ...
+    """
+    arg_parser = argparse.ArgumentParser(description=main.__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("path", help="the bundle directory")
+    arg_parser.add_argument("--emb-file", default=None, help="local .npy file with the word embeddings")
+    arg_parser.add_argument("--out-emb-file", default=None, help="local .npy file with the output embeddings")
+    arg_parser.add_argument("--formulas-file", default=None, help="local .pkl file with the formula counts")
+    arg_parser.add_argument("--no-element-index", action="store_true", help="leave out the element index")
+    arg_parser.add_argument("--ann-index", action="store_true", help="also build the approximate index")
+    args = arg_parser.parse_args()
+
+    engine = EmbeddingEngine(emb_file=args.emb_file, out_emb_file=args.out_emb_file, formulas_file=args.formulas_file)
+    if args.ann_index:
+        engine.build_ann_index()
+    engine.build_bundle(args.path, element_index=not args.no_element_index)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,14 +4,89 @@ from gensim.utils import deaccent
 from matstract.extract import parsing
 from tqdm import tqdm
 import zipfile
+import gzip
+import io
+import contextlib
+import time
 import os
 import regex
 import string
 import pickle
+import random
+import threading
 from pymatgen.core.composition import Composition
 from monty.fractions import gcd_float
 from multiprocessing import Pool
+import collections
 import pymongo
+from pymongo.errors import BulkWriteError
+
+
+
+def _tokenize(text):
+    """
+    Returns a 1d list of tokens using chemdataextractor tokenizer. Removes all punctuation but
+    keeps the structure of sentences.
+    """
+    cde_p = Paragraph(text)
+    tokens = cde_p.tokens
+    toks = []
+    for sentence in tokens:
+        toks.append([])
+        for tok in sentence:
+            toks[-1].append(tok.text)
+    return toks
+
+
+def _tokenize_abstract(a, fields):
+    """
+    Tokenized version of a raw abstract
+    :param a: the raw abstract document
+    :param fields: names of the (doi, title, abstract) fields
+    :return: the document for the tokenized abstracts collection
+    """
+    doi_field, ttl_field, abs_field = fields
+    try:
+        return {
+            doi_field: a[doi_field],
+            ttl_field: _tokenize(a[ttl_field]),
+            abs_field: _tokenize(a[abs_field]),
+            "abstract_id": a["_id"],
+        }
+    except Exception as e:
+        print("Exception type: %s, doi: %s" % (type(e).__name__, a[doi_field]))
+        return {
+            doi_field: a[doi_field],
+            ttl_field: None,
+            abs_field: None,
+            "abstract_id": a["_id"],
+            "error": "%s: %s " % (type(e).__name__, str(e))
+        }
+
+
+def _tokenize_batch(abstracts, fields):
+    return [_tokenize_abstract(a, fields) for a in abstracts]
+
+
+def _open_corpus_file(filename, compression, buffer_size, exit_stack):
+    """
+    Opens a buffered binary writer for a corpus file, closed with exit_stack
+    :param filename: the output file, without the .gz or .zip extension
+    :param compression: None to append to filename, "gzip" to append a gzip member to filename.gz,
+    or "zip" to write filename.zip with a single filename entry
+    :param buffer_size: size of the write buffer in bytes
+    :return: the writer
+    """
+    if compression is None:
+        return exit_stack.enter_context(open(filename, "ab", buffering=buffer_size))
+    if compression == "gzip":
+        raw = exit_stack.enter_context(gzip.open(filename + ".gz", "ab"))
+    elif compression == "zip":
+        archive = exit_stack.enter_context(zipfile.ZipFile(filename + ".zip", "w", zipfile.ZIP_DEFLATED))
+        raw = exit_stack.enter_context(archive.open(os.path.basename(filename), "w", force_zip64=True))
+    else:
+        raise ValueError("compression must be None, 'gzip' or 'zip', not {}".format(compression))
+    return exit_stack.enter_context(io.BufferedWriter(raw, buffer_size=buffer_size))
 
 
 class DataPreparation:
@@ -82,14 +157,28 @@ class DataPreparation:
 
     PUNCT = list(string.punctuation) + ['"', '“', '”', '≥', '≤', '×']
 
+    # constant time membership for process_sentence
+    _UNIT_SET = frozenset(UNITS)
+    _ELEMENT_SET = frozenset(ELEMENTS)
+    _ELEMENT_AND_NAME_SET = frozenset(ELEMENTS_AND_NAMES)
+    _PUNCT_SET = frozenset(PUNCT)
+    _DIATOMIC = frozenset(["O2", "N2", "Cl2", "F2", "H2"])
+
     # ROMAN_NR_PR = regex.compile(r'\((IV|V?I{0,3})\)')
 
-    def __init__(self, db_name="matstract_db", local=True):
+    def __init__(self, db_name="matstract_db", local=True, token_cache_size=100000):
+        """
+        :param token_cache_size: maximum number of distinct tokens whose process_sentence output is kept
+        """
         db = "production" if db_name == "matstract_db" else "testing"
         self._db = AtlasConnection(local=local, db=db).db
         self.parser = parsing.MaterialParser()
         self.simple_parser = parsing.SimpleParser()
         self.mat_list = []
+        self.token_cache_size = token_cache_size
+        self._token_cache = collections.OrderedDict()
+        # the engine shared by the web callback threads calls process_sentence concurrently
+        self._token_cache_lock = threading.Lock()
         self.elem_name_dict = dict()
         for i, elem in enumerate(self.ELEMENTS):
             self.elem_name_dict[self.ELEMENT_NAMES[i]] = elem
@@ -109,21 +198,31 @@ class DataPreparation:
     format for machine learning tasks
     """
     def to_word2vec_zip(self, filename="abstracts", limit=None, newlines=False, line_per_abstract=True, doi=None,
-                        only_relevant=False, exclude_punct=False, year_max=None, split_years=False):
+                        only_relevant=False, exclude_punct=False, year_max=None, split_years=False, strategy=None,
+                        seed=None, compression=None, buffer_size=1 << 20):
         """
         Coverts the tokenized abstracts in the database to a zip file with a single vocabulary line.
         :param limit: number of abstracts to use. If not specified, all data will be considered
-        :return: a 2d list of words from the abstract / titles, with each abstract on a separate line
+        :param strategy: how the abstracts are read, see _get_abstracts. By default a random sample of limit
+        abstracts if limit is set, otherwise all of them in natural order. With only_relevant, the abstracts
+        are streamed in natural order by default until limit relevant ones are written.
+        :param seed: random seed of the "reservoir" strategy
+        :param compression: None to append plain text to filename (and filename_<year> with split_years),
+        "gzip" to append to filename.gz, or "zip" to write filename.zip with a single text file inside
+        :param buffer_size: write buffer of every output file in bytes; each file is opened once
+        :return: dict with the number of "abstracts" and uncompressed "bytes" written, "seconds" and
+        "bytes_per_second"
         """
-        if limit:
-            sample = True
-        else:
-            sample = False
+        # irrelevant abstracts are skipped below, so only limit the reading if a sample is asked for
+        read_limit = limit if not only_relevant or strategy in ("sample", "reservoir") else None
         abstracts = self._get_abstracts(
-            sample=sample,
+            limit=read_limit,
+            sample=bool(read_limit),
             col=self.TOK_ABSTRACT_COL,
             doi=doi,
-            year_max=year_max)
+            year_max=year_max,
+            strategy=strategy,
+            seed=seed)
 
         if line_per_abstract:
             nl_tok = ""
@@ -137,104 +236,186 @@ class DataPreparation:
         else:
             total = limit
         i = 0
+        n_bytes = 0
+        start = time.perf_counter()
         pbar = tqdm(total=total)
-        for abstract in abstracts:
-            if split_years and abstract["year"]:
-                writefile = filename+"_"+str(abstract["year"])
-            else:
-                writefile = filename
-            with open(writefile, "a+") as abstract_file:
-                if i < total:
-                    # processesed_abs = {"doi": abstract["doi"], "title": [], "abstract": []}
-                    abs_txt = ""
-                    ttl = abstract[self.TTL_FILED]
-                    abs = abstract[self.ABS_FIELD]
-                    if not only_relevant or self.is_relevant(abs):
-                        if ttl:
-                            for sentence in ttl:
-                                abs_txt += " ".join(self.process_sentence(sentence, exclude_punct)[0] + [nl_tok])
-                                # processesed_abs["title"].append(self.process_sentence(sentence, exclude_punct)[0])
-                        if abs:
-                            for sentence in abs:
-                                abs_txt += " ".join(self.process_sentence(sentence, exclude_punct)[0] + [nl_tok])
-                                # processesed_abs["abstract"].append(self.process_sentence(sentence, exclude_punct)[0])
-                        if line_per_abstract:
-                            abs_txt += "\n"
-                        abstract_file.write(abs_txt)
-                        # getattr(self._db, self.TOK_ABSTRACT_COL+"_processed").insert_one(processesed_abs)
-                        i += 1
-                        pbar.update(1)
-                else:
+        with contextlib.ExitStack() as exit_stack:
+            writers = dict()
+            for abstract in abstracts:
+                if i >= total:
                     break
+                if split_years and abstract["year"]:
+                    writefile = filename+"_"+str(abstract["year"])
+                else:
+                    writefile = filename
+                ttl = abstract[self.TTL_FILED]
+                abs = abstract[self.ABS_FIELD]
+                if not only_relevant or self.is_relevant(abs):
+                    # every sentence is followed by a space and nl_tok
+                    parts = []
+                    for sentence in (ttl or []) + (abs or []):
+                        parts.append(" ".join(self.process_sentence(sentence, exclude_punct, collect_materials=True)[0] + [nl_tok]))
+                    if line_per_abstract:
+                        parts.append("\n")
+                    if writefile not in writers:
+                        writers[writefile] = _open_corpus_file(writefile, compression, buffer_size, exit_stack)
+                    n_bytes += writers[writefile].write("".join(parts).encode("utf-8"))
+                    i += 1
+                    pbar.update(1)
         pbar.close()
+        seconds = time.perf_counter() - start
         DataPreparation.save_obj(self.material_counts(), filename+"_formula")
+        return {"abstracts": i, "bytes": n_bytes, "seconds": seconds,
+                "bytes_per_second": n_bytes / seconds if seconds else 0.0}
 
-    def tokenize_abstracts(self, limit=None, override=False, sample=False):
-        def tokenize(text):
-            """
-            Returns a 1d list of tokens using chemdataextractor tokenizer. Removes all punctuation but
-            keeps the structure of sentences.
-            """
-            cde_p = Paragraph(text)
-            tokens = cde_p.tokens
-            toks = []
-            for sentence in tokens:
-                toks.append([])
-                for tok in sentence:
-                    toks[-1].append(tok.text)
-            return toks
-
+    def tokenize_abstracts(self, limit=None, override=False, sample=False, workers=1, batch_size=1000,
+                           existing_check="set"):
+        """
+        Tokenizes the raw abstracts with ChemDataExtractor into the tokenized abstracts collection.
+        :param limit: number of abstracts to tokenize, all if None
+        :param override: if True, abstracts that are already tokenized are tokenized again and replaced
+        :param sample: if True and limit is set, a random sample of limit abstracts is taken
+        :param workers: number of processes, all CPUs if None. With more than one, the abstracts are
+        tokenized in batches in the worker processes and written with one unordered bulk write per batch.
+        Either way, a restarted run skips the abstracts that are already tokenized (see existing_check).
+        :param batch_size: number of abstracts per batch and bulk write
+        :param existing_check: how already tokenized abstracts are skipped (without override). "set" loads
+        the tokenized DOIs into a set; "lookup" leaves them out on the server with a $lookup anti-join, so
+        that only abstracts still to be tokenized are read. With "lookup", limit counts only those.
+        """
+        if existing_check not in ("set", "lookup"):
+            raise ValueError("existing_check must be 'set' or 'lookup', not {}".format(existing_check))
+        lookup = existing_check == "lookup" and not override
         # get the abstracts
-        abstracts = self._get_abstracts(limit=limit, sample=sample)
-        existing_dois = [abstr[self.DOI_FIELD] for abstr in self._get_abstracts(col=self.TOK_ABSTRACT_COL)]
+        abstracts = self._get_abstracts(limit=limit, sample=sample, only_untokenized=lookup)
+        existing_dois = self._tokenized_dois() if not override and not lookup else set()
 
-        count = abstracts.count() if limit is None else limit
+        if limit is not None:
+            count = limit
+        else:
+            count = None if lookup else getattr(self._db, self.RAW_ABSTRACT_COL).find().count()
+        collection = getattr(self._db, self.TOK_ABSTRACT_COL)
+        fields = (self.DOI_FIELD, self.TTL_FILED, self.ABS_FIELD)
+
+        def to_tokenize(a):
+            # saving time by not tokenizing the text if abstract already exists
+            return override or a[self.DOI_FIELD] not in existing_dois
+
+        if workers == 1:
+            # tokenize and insert into the new collection (doi as unique key)
+            for abstract in tqdm(abstracts, total=count):
+                if to_tokenize(abstract):
+                    abs_tokens = _tokenize_abstract(abstract, fields)
+                    if override:
+                        collection.replace_one({"doi": abstract[self.DOI_FIELD]}, abs_tokens, upsert=True)
+                    else:
+                        try:
+                            # we have already filtered so there should not be doi overlap
+                            collection.insert_one(abs_tokens)
+                        except Exception as e:
+                            print("Exception type: %s, doi: %s" % (type(e).__name__, abstract[self.DOI_FIELD]))
+            return
+
+        def batches():
+            batch = []
+            n_read = 0
+            for abstract in abstracts:
+                n_read += 1
+                if to_tokenize(abstract):
+                    # missing fields are left out, _tokenize_abstract then records the error
+                    batch.append({key: abstract[key] for key in fields + ("_id",) if key in abstract})
+                    if len(batch) == batch_size:
+                        yield batch, n_read
+                        batch, n_read = [], 0
+            if n_read:
+                yield batch, n_read
+
+        def write(abs_tokens):
+            if not abs_tokens:
+                return
+            if override:
+                requests = [pymongo.ReplaceOne({"doi": a[self.DOI_FIELD]}, a, upsert=True) for a in abs_tokens]
+            else:
+                requests = [pymongo.InsertOne(a) for a in abs_tokens]
+            try:
+                collection.bulk_write(requests, ordered=False)
+            except BulkWriteError as e:
+                for error in e.details["writeErrors"]:
+                    print("Exception: %s, doi: %s" % (error["errmsg"], abs_tokens[error["index"]][self.DOI_FIELD]))
+
+        # a few batches per worker in flight, so that the abstracts are not all read into memory
+        max_pending = 2 * (workers or os.cpu_count())
+        pending = collections.deque()
+        with tqdm(total=count) as pbar, Pool(processes=workers) as pool:
+            for batch, n_read in batches():
+                pending.append((pool.apply_async(_tokenize_batch, (batch, fields)), n_read))
+                if len(pending) >= max_pending:
+                    result, n_done = pending.popleft()
+                    write(result.get())
+                    pbar.update(n_done)
+            while pending:
+                result, n_done = pending.popleft()
+                write(result.get())
+                pbar.update(n_done)
+
+    def _tokenized_dois(self):
+        """
+        DOIs of the tokenized abstracts, read with a DOI-only projection
+        :return: set of DOIs
+        """
+        cursor = getattr(self._db, self.TOK_ABSTRACT_COL).find({}, {self.DOI_FIELD: 1, "_id": 0})
+        return set(abstr.get(self.DOI_FIELD) for abstr in cursor)
 
-        def insert_abstract(a):
-            if override or (not override and a[self.DOI_FIELD] not in existing_dois):
-                # saving time by not tokenizing the text if abstract already exists
-                try:
-                    abs_tokens = {
-                        self.DOI_FIELD: a[self.DOI_FIELD],
-                        self.TTL_FILED: tokenize(a[self.TTL_FILED]),
-                        self.ABS_FIELD: tokenize(a[self.ABS_FIELD]),
-                        "abstract_id": a["_id"],
-                    }
-                except Exception as e:
-                    print("Exception type: %s, doi: %s" % (type(e).__name__, a[self.DOI_FIELD]))
-                    abs_tokens = {
-                        self.DOI_FIELD: a[self.DOI_FIELD],
-                        self.TTL_FILED: None,
-                        self.ABS_FIELD: None,
-                        "abstract_id": a["_id"],
-                        "error": "%s: %s " % (type(e).__name__, str(e))
-                    }
-                if override:
-                    # getattr(self._db, self.TOK_ABSTRACT_COL).insert_one(abs_tokens)
-                    getattr(self._db, self.TOK_ABSTRACT_COL).replace_one({
-                        "doi": a[self.DOI_FIELD]},
-                        abs_tokens,
-                        upsert=True)
-                else:
-                    try:
-                        # we have already filtered so there should not be doi overlap
-                        getattr(self._db, self.TOK_ABSTRACT_COL).insert_one(abs_tokens)
-                    except Exception as e:
-                        print("Exception type: %s, doi: %s" % (type(e).__name__, a[self.DOI_FIELD]))
-
-        # tokenize and insert into the new collection (doi as unique key)
-        for abstract in tqdm(abstracts, total=count):
-            insert_abstract(abstract)
-        #
-        # with Pool() as p:
-        #     list(tqdm(p.imap(insert_abstract, abstracts), total=count))
-
-    def _get_abstracts(self, limit=None, col=None, doi=None, year_max=None, sample=True):
+    def _untokenized_stages(self):
+        """
+        Aggregation stages that keep only the abstracts whose DOI is not in the tokenized collection
+        (an anti-join; the tokenized collection should have an index on doi). The equality form of
+        $lookup is used, as the let/pipeline form cannot use that index before MongoDB 5.0.
+        """
+        return [
+            {"$lookup": {
+                "from": self.TOK_ABSTRACT_COL,
+                "localField": self.DOI_FIELD,
+                "foreignField": self.DOI_FIELD,
+                "as": "_tokenized"}},
+            {"$match": {"_tokenized": {"$size": 0}}},
+            {"$project": {"_tokenized": 0}},
+        ]
+
+    def _get_abstracts(self, limit=None, col=None, doi=None, year_max=None, sample=False, only_untokenized=False,
+                       strategy=None, seed=None, partition=None):
         """
         Returns a cursor of abstracts form mongodb
-        :param limit:
-        :return:
+        :param limit: maximum number of abstracts, all if None
+        :param only_untokenized: if True, abstracts whose DOI is in the tokenized collection are left out
+        :param strategy: the order in which the abstracts are read:
+            "natural": as stored, streaming from the first document (the default)
+            "partition": natural order within one of n ranges of _id, for parallel readers (see partition)
+            "sample": a random sample of limit abstracts drawn by the server with $sample
+            "reservoir": a seeded random sample of limit abstracts drawn on the client while streaming
+            all of them; reproducible, returned in natural order as a list
+        :param sample: if True and limit is set, the "sample" strategy is used when no strategy is given
+        :param seed: random seed of the "reservoir" strategy
+        :param partition: (index, n) for the "partition" strategy (implied if strategy is None), e.g. (0, 8)
+        is the first of 8 _id ranges
+        :return: cursor (or list) of abstracts
         """
+        if strategy is None:
+            if partition is not None:
+                strategy = "partition"
+            else:
+                strategy = "sample" if sample and limit is not None else "natural"
+        if strategy not in ("natural", "partition", "sample", "reservoir"):
+            raise ValueError("unknown strategy {}".format(strategy))
+        if strategy in ("sample", "reservoir") and limit is None:
+            raise ValueError("the {} strategy needs a limit".format(strategy))
+        if strategy == "partition":
+            if partition is None or len(partition) != 2 or not 0 <= partition[0] < partition[1]:
+                raise ValueError("the partition strategy needs partition=(index, n) with 0 <= index < n, "
+                                 "not {}".format(partition))
+        elif partition is not None:
+            raise ValueError("partition is only used by the partition strategy, not {}".format(strategy))
+
         conditions = dict()
         if doi is not None:
             conditions["doi"] = {"$in": doi}
@@ -242,6 +423,8 @@ class DataPreparation:
             conditions["year"] = {"$lt": year_max + 1}
         if col is None:
             col = self.RAW_ABSTRACT_COL
+        if strategy == "partition":
+            conditions["_id"] = self._id_range(*partition, col=col, conditions=conditions)
 
         # pipeline = []
         # if only_relevant:
@@ -258,36 +441,89 @@ class DataPreparation:
         # if limit is not None:
         #     pipeline.append({"$sample": {"size": limit}})
         # return getattr(self._db, col).aggregate(pipeline, allowDiskUse=True)
-        if limit is not None:
-            if sample:
-                pipeline = [
-                    {"$match": conditions},
-                    {"$sample": {"size": limit}}
-                ]
-                abstracts = getattr(self._db, col).aggregate(pipeline, allowDiskUse=True)
-            else:
-                abstracts = getattr(self._db, col).find(conditions).limit(limit)
-        else:
-            if sample:
-                size = getattr(self._db, col).find(conditions).count()
-                pipeline = [
-                    {"$match": conditions},
-                    {"$sample": {"size": size}}
-                ]
-                abstracts = getattr(self._db, col).aggregate(pipeline, allowDiskUse=True)
+        collection = getattr(self._db, col)
+        if strategy == "reservoir":
+            if only_untokenized:
+                abstracts = collection.aggregate([{"$match": conditions}] + self._untokenized_stages(),
+                                                 allowDiskUse=True)
             else:
-                abstracts = getattr(self._db, col).find(conditions)
+                abstracts = collection.find(conditions)
+            return self._reservoir_sample(abstracts, limit, seed)
+
+        if only_untokenized or strategy == "sample":
+            pipeline = [{"$match": conditions}]
+            if only_untokenized:
+                pipeline += self._untokenized_stages()
+            if strategy == "sample":
+                pipeline.append({"$sample": {"size": limit}})
+            elif limit is not None:
+                pipeline.append({"$limit": limit})
+            return collection.aggregate(pipeline, allowDiskUse=True)
+
+        abstracts = collection.find(conditions)
+        if limit is not None:
+            abstracts = abstracts.limit(limit)
         return abstracts
 
+    def _id_range(self, index, n, col=None, conditions=None):
+        """
+        Range of _id of one of n partitions of about the same number of abstracts
+        :param index: the partition, from 0 to n - 1
+        :param n: number of partitions
+        :param col: the collection, raw abstracts by default
+        :param conditions: query the partitions are computed for
+        :return: a query condition on _id
+        """
+        if col is None:
+            col = self.RAW_ABSTRACT_COL
+        buckets = list(getattr(self._db, col).aggregate([
+            {"$match": conditions or {}},
+            {"$bucketAuto": {"groupBy": "$_id", "buckets": n}}], allowDiskUse=True))
+        if index >= len(buckets):
+            # fewer abstracts than partitions
+            return {"$in": []}
+        bounds = buckets[index]["_id"]
+        if index == len(buckets) - 1:
+            return {"$gte": bounds["min"], "$lte": bounds["max"]}
+        return {"$gte": bounds["min"], "$lt": bounds["max"]}
+
+    @staticmethod
+    def _reservoir_sample(abstracts, k, seed=None):
+        """
+        Uniform random sample of k abstracts from a stream in one pass (reservoir sampling)
+        :param abstracts: iterable of abstracts
+        :param k: sample size
+        :param seed: random seed
+        :return: list of at most k abstracts, in the order of the stream
+        """
+        rng = random.Random(seed)
+        reservoir = []
+        for i, abstract in enumerate(abstracts):
+            if i < k:
+                reservoir.append((i, abstract))
+            else:
+                j = rng.randint(0, i)
+                if j < k:
+                    reservoir[j] = (i, abstract)
+        return [abstract for _, abstract in sorted(reservoir, key=lambda item: item[0])]
+
     def is_number(self, t):
         return self.NR_BASIC.match(t.replace(',', '')) is not None
 
     # @staticmethod
-    def process_sentence(self, s, exclude_punct=False):
+    def process_sentence(self, s, exclude_punct=False, collect_materials=False):
+        """
+        Processes a tokenized sentence for word2vec
+        :param s: list of tokens
+        :param exclude_punct: leave out the punctuation
+        :param collect_materials: append the material mentions to mat_list, e.g. for material_counts; off by
+        default so that long-lived instances (the web app) don't accumulate them
+        :return: (list of output tokens, indices of the input tokens that were split)
+        """
         st = []
         split_indices = []
         for i, tok in enumerate(s):
-            if exclude_punct and tok in self.PUNCT:
+            if exclude_punct and tok in self._PUNCT_SET:
                 continue
             elif self.is_number(tok):
                 try:
@@ -297,53 +533,74 @@ class DataPreparation:
                         tok = "<nUm>"
                 except:
                     tok = "<nUm>"  # replace all numbers with a string <nUm>
+                st.append(tok)
             else:
-                elem_with_valence = self.ELEMENT_VALENCE_IN_PAR.match(tok)
-                if elem_with_valence is not None:
-                    # change element name to symbol
-                    elem_mention = elem_with_valence.group(1)
-                    try:
-                        formula = self.elem_name_dict[elem_mention.lower()]
-                        matmention = elem_mention.lower()
-                    except:
-                        formula = elem_mention  # this was already the symbol
-                        matmention = elem_mention
-                    self.mat_list.append((matmention, formula))  # exclude the valence state from name
+                # apart from numbers, the output only depends on the token itself
+                with self._token_cache_lock:
+                    processed = self._token_cache.get(tok)
+                    if processed is not None:
+                        self._token_cache.move_to_end(tok)
+                if processed is None:
+                    processed = self._process_token(tok)
+                    if self.token_cache_size:
+                        with self._token_cache_lock:
+                            self._token_cache[tok] = processed
+                            if len(self._token_cache) > self.token_cache_size:
+                                self._token_cache.popitem(last=False)
+                tokens, mat = processed
+                if collect_materials and mat is not None:
+                    self.mat_list.append(mat)
+                if len(tokens) > 1:
                     # split this for word2vec
-                    st.append(matmention)
                     split_indices.append(i)
-                    tok = elem_with_valence.group(2)
-                elif tok in self.ELEMENTS_AND_NAMES:  # add element names to formulae
-                    try:
-                        formula = self.elem_name_dict[tok.lower()]
-                        matmention = tok.lower()
-                        tok = matmention
-                    except:
-                        formula = tok  # this was already the symbol
-                        matmention = tok
-                    self.mat_list.append((matmention, formula))
-                elif self.is_simple_formula(tok):
-                    formula = self.get_norm_formula(tok)
-                    self.mat_list.append((tok, formula))
-                    tok = formula
-                elif (len(tok) == 1 or (len(tok) > 1 and tok[0].isupper() and tok[1:].islower())) \
-                        and tok not in self.ELEMENTS and tok not in self.UNITS \
-                        and self.ELEMENT_DIRECTION_IN_PAR.match(tok) is None:
-                    # to lowercase if only first letter is uppercase (chemical elements already covered above)
-                    tok = deaccent(tok.lower())
-                else:
-                    # splitting units from numbers (e.g. you can get 2mol., 3V, etc..)
-                    nr_unit = self.NR_AND_UNIT.match(tok)
-                    if nr_unit is None or nr_unit.group(2) not in self.UNITS:
-                        tok = deaccent(tok)  # matches the pattern but not in the list of units
-                    else:
-                        # splitting the unit from number
-                        st.append("<nUm>")
-                        split_indices.append(i)
-                        tok = nr_unit.group(2)  # the unit
-            st.append(tok)
+                st.extend(tokens)
         return st, split_indices
 
+    def _process_token(self, tok):
+        """
+        Processes a token that is not a number
+        :param tok: the token
+        :return: (tuple of output tokens, (material mention, formula) or None); a token is split into two
+        output tokens if it is an element with its valence or a number with its unit
+        """
+        # the element regexes are long alternations, only tried if the token can match
+        elem_with_valence = self.ELEMENT_VALENCE_IN_PAR.match(tok) if ")" in tok else None
+        if elem_with_valence is not None:
+            # change element name to symbol
+            elem_mention = elem_with_valence.group(1)
+            try:
+                formula = self.elem_name_dict[elem_mention.lower()]
+                matmention = elem_mention.lower()
+            except:
+                formula = elem_mention  # this was already the symbol
+                matmention = elem_mention
+            # exclude the valence state from name
+            return (matmention, elem_with_valence.group(2)), (matmention, formula)
+        elif tok in self._ELEMENT_AND_NAME_SET:  # add element names to formulae
+            try:
+                formula = self.elem_name_dict[tok.lower()]
+                matmention = tok.lower()
+                tok = matmention
+            except:
+                formula = tok  # this was already the symbol
+                matmention = tok
+            return (tok,), (matmention, formula)
+        elif self.is_simple_formula(tok):
+            formula = self.get_norm_formula(tok)
+            return (formula,), (tok, formula)
+        elif (len(tok) == 1 or (len(tok) > 1 and tok[0].isupper() and tok[1:].islower())) \
+                and tok not in self._ELEMENT_SET and tok not in self._UNIT_SET \
+                and ("(" not in tok or self.ELEMENT_DIRECTION_IN_PAR.match(tok) is None):
+            # to lowercase if only first letter is uppercase (chemical elements already covered above)
+            return (deaccent(tok.lower()),), None
+        else:
+            # splitting units from numbers (e.g. you can get 2mol., 3V, etc..)
+            nr_unit = self.NR_AND_UNIT.match(tok)
+            if nr_unit is None or nr_unit.group(2) not in self._UNIT_SET:
+                return (deaccent(tok),), None  # matches the pattern but not in the list of units
+            # splitting the unit from number
+            return ("<nUm>", nr_unit.group(2)), None
+
     def material_counts(self):
         counts = dict()
         for mat in self.mat_list:
@@ -364,7 +621,7 @@ class DataPreparation:
         elif any(char.isdigit() or char.islower() for char in text):
             # has to contain at least one lowercase letter or at least one number (to ignore abbreviations)
             try:
-                if text in ["O2", "N2", "Cl2", "F2", "H2"]:
+                if text in self._DIATOMIC:
                     # including chemical elements that are diatomic at room temperature and atm pressure,
                     # despite them having only a single element
                     return True
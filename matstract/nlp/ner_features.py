@@ -246,21 +246,27 @@ class FeatureGenerator:
         return scaled
 
 
-    def fit_transform(self, tagged_documents, include_word2vec = False):
+    def fit_transform(self, tagged_documents, include_word2vec = False, workers = 1):
         '''
         Generate an array of features representing the tagged documents
 
         :param tagged_documents: pos and NE tagged documents as a list.
+        :param workers: number of processes for ChemDataExtractor tagging of the sentences, all CPUs if None
         :return: returns a tuple (features, outcomes). Feature array as is a scipy sparse array.
         '''
         self.words_per_doc = [len([word for sent in doc for word in sent]) for doc in tagged_documents] #This is for train-test splitting
         all_features = []
         all_outcomes = []
+        # Should use raw sent not reconstruct tokenized
+        reconstructed = [' '.join([word for (word, pos), ne_tag in sent]) for doc in tagged_documents for sent in doc]
+        parser = TextParser(workers=workers)
+        try:
+            parsed_sents = iter(parser.extract_chemdata_many(reconstructed))
+        finally:
+            parser.close()
         for doc in tagged_documents:
             for sent in doc:
-                parser = TextParser()
-                reconstructed = ' '.join([word for (word, pos), ne_tag in sent])  # Should use raw sent not reconstruct tokenized
-                parsed = parser.extract_chemdata(reconstructed)
+                parsed = next(parsed_sents)
                 flatten = [cem[0].split() for cem in parsed]
                 chems_in_sent = [item for sublist in flatten for item in sublist]
                 for n, ((word, pos), NE_tag) in enumerate(sent):
@@ -321,7 +327,7 @@ class FeatureGenerator:
         parser = TextParser()
         reconstructed = ' '.join(
             [word for (word, pos) in sent])  # Should use raw sent not reconstruct tokenized
-        parsed = parser.extract_chemdata(reconstructed)
+        parsed = parser.extract_chemdata(reconstructed)  # memoized, so tagged once per sentence
         flatten = [cem[0].split() for cem in parsed]
         chems_in_sent = [item for sublist in flatten for item in sublist]
 
@@ -0,0 +1,103 @@
+class PhraseTokenizer:
+    '''
+    Joins consecutive tokens into the phrases of a word2vec vocabulary, e.g.
+    ['solar', 'cell'] -> ['solar_cell'] if 'solar', 'cell' and 'solar_cell' are all in the vocabulary.
+
+    By default the output is identical to a gensim Phraser built from the vocabulary with every
+    phrase scored above the threshold: tokens are scanned left to right and each token is joined
+    with the previous one if the pair forms a phrase, so at most two input tokens are joined.
+    With longest_match=True, the longest run of tokens (up to max_length) that forms a phrase is
+    joined instead.
+
+    Example usage:
+    >>> tokenizer = PhraseTokenizer(["solar", "cell", "solar_cell", "efficiency"])
+    >>> tokenizer[["solar", "cell", "efficiency"]]
+    ['solar_cell', 'efficiency']
+    >>> tokenizer.phrase_sentences([["solar", "cell"], ["cell"]])
+    [['solar_cell'], ['cell']]
+    '''
+
+    def __init__(self, vocabulary, delimiter="_", longest_match=False, max_length=4):
+        '''
+        :param vocabulary: the words and phrases of the model; a dict such as word2index is used as is
+        :param delimiter: the string joining the words of a phrase
+        :param longest_match: if True, join the longest matching run of tokens instead of pairs
+        :param max_length: the longest run of tokens considered for longest_match
+        '''
+        self.vocabulary = vocabulary if isinstance(vocabulary, (dict, set, frozenset)) else frozenset(vocabulary)
+        self.delimiter = delimiter
+        self.longest_match = longest_match
+        self.max_length = max_length
+
+        # every phrase prefix that ends at a delimiter, so most tokens are rejected by one lookup
+        heads = set()
+        for phrase in self.vocabulary:
+            position = phrase.find(delimiter)
+            while position != -1:
+                heads.add(phrase[:position])
+                position = phrase.find(delimiter, position + 1)
+        self.heads = frozenset(heads)
+
+    def __getitem__(self, sentence):
+        '''
+        Phrases a single sentence (list of tokens), or a list of sentences
+        '''
+        if len(sentence) > 0 and not isinstance(sentence[0], str):
+            return self.phrase_sentences(sentence)
+        return self.phrase(sentence)
+
+    def is_phrase(self, first, second):
+        '''
+        Returns True if the two tokens should be joined
+        '''
+        return first in self.heads and first in self.vocabulary and second in self.vocabulary and \
+            first + self.delimiter + second in self.vocabulary
+
+    def phrase(self, sentence):
+        '''
+        Joins the phrases in a list of tokens
+        :param sentence: list of string tokens
+        :return: list of tokens with the phrases joined by the delimiter
+        '''
+        if self.longest_match:
+            return self._phrase_longest(sentence)
+        phrased = []
+        last = None
+        for token in sentence:
+            if last and self.is_phrase(last, token):
+                phrased.append(last + self.delimiter + token)
+                last = None
+            else:
+                # like gensim, an empty token cannot start a phrase and is dropped when it would
+                if last:
+                    phrased.append(last)
+                last = token
+        if last:
+            phrased.append(last)
+        return phrased
+
+    def phrase_sentences(self, sentences):
+        '''
+        Joins the phrases in many sentences at once
+        :param sentences: iterable of lists of tokens
+        :return: list of phrased sentences
+        '''
+        phrase = self.phrase
+        return [phrase(sentence) for sentence in sentences]
+
+    def _phrase_longest(self, sentence):
+        phrased = []
+        i = 0
+        while i < len(sentence):
+            joined = sentence[i]
+            end = i + 1
+            candidate = joined
+            for j in range(i + 1, min(len(sentence), i + self.max_length)):
+                if candidate not in self.heads:
+                    break
+                candidate = candidate + self.delimiter + sentence[j]
+                if candidate in self.vocabulary:
+                    joined, end = candidate, j + 1
+            phrased.append(joined)
+            i = end
+        return phrased
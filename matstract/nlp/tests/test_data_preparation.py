@@ -0,0 +1,333 @@
+import gzip
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import unittest
+import zipfile
+from unittest import mock
+import pymongo
+from matstract.nlp import data_preparation
+from matstract.nlp.data_preparation import DataPreparation
+
+
+class FakeCursor(list):
+    def limit(self, n):
+        return FakeCursor(self[:n])
+
+    def count(self):
+        return len(self)
+
+
+class FakeCollection:
+    """The parts of a pymongo collection used by DataPreparation, on documents sorted by _id"""
+
+    def __init__(self, docs, db=None):
+        """
+        :param docs: the documents
+        :param db: the database with the other collections, for $lookup
+        """
+        self.docs = docs
+        self.db = db
+        self.pipelines = []
+        self.bulk_writes = []
+
+    @staticmethod
+    def _matches(doc, conditions):
+        id_range = conditions.get("_id", {})
+        return all([
+            "$gte" not in id_range or doc["_id"] >= id_range["$gte"],
+            "$lt" not in id_range or doc["_id"] < id_range["$lt"],
+            "$lte" not in id_range or doc["_id"] <= id_range["$lte"],
+            "$in" not in id_range or doc["_id"] in id_range["$in"]] +
+            [len(doc[field]) == condition["$size"] for field, condition in conditions.items()
+             if "$size" in condition])
+
+    def find(self, conditions=None, projection=None):
+        docs = (doc for doc in self.docs if self._matches(doc, conditions or {}))
+        if projection is not None:
+            docs = ({key: value for key, value in doc.items() if projection.get(key)} for doc in docs)
+        return FakeCursor(docs)
+
+    def insert_one(self, doc):
+        self.docs.append(doc)
+
+    def replace_one(self, conditions, doc, upsert=False):
+        self.docs = [d for d in self.docs if any(d.get(key) != value for key, value in conditions.items())]
+        self.docs.append(doc)
+
+    def bulk_write(self, requests, ordered=True):
+        self.bulk_writes.append(requests)
+        for request in requests:
+            if isinstance(request, pymongo.ReplaceOne):
+                self.replace_one(request._filter, request._doc, upsert=request._upsert)
+            else:
+                self.insert_one(request._doc)
+
+    def aggregate(self, pipeline, allowDiskUse=False):
+        self.pipelines.append(pipeline)
+        docs = self.docs
+        for stage in pipeline:
+            if "$match" in stage:
+                docs = [doc for doc in docs if self._matches(doc, stage["$match"])]
+            elif "$lookup" in stage:
+                lookup = stage["$lookup"]
+                foreign = getattr(self.db, lookup["from"]).docs
+                docs = [dict(doc, **{lookup["as"]: [f for f in foreign
+                                                    if f.get(lookup["foreignField"]) == doc[lookup["localField"]]]})
+                        for doc in docs]
+            elif "$project" in stage:
+                docs = [{key: value for key, value in doc.items() if key not in stage["$project"]} for doc in docs]
+            elif "$bucketAuto" in stage:
+                size = -(-len(docs) // stage["$bucketAuto"]["buckets"])
+                return [{"_id": {"min": docs[i]["_id"], "max": docs[min(i + size, len(docs) - 1)]["_id"]}}
+                        for i in range(0, len(docs), size)]
+            elif "$sample" in stage:
+                docs = docs[::-1][:stage["$sample"]["size"]]
+            elif "$limit" in stage:
+                docs = docs[:stage["$limit"]]
+        return FakeCursor(docs)
+
+
+def make_data_preparation(**kwargs):
+    """DataPreparation without a database connection or the relevance classifier"""
+    with mock.patch.object(data_preparation, "AtlasConnection"), \
+            mock.patch.object(data_preparation.pickle, "load"), \
+            mock.patch.object(data_preparation, "open", mock.mock_open(), create=True):
+        return DataPreparation(**kwargs)
+
+
+class TestProcessSentence(unittest.TestCase):
+    SENTENCES = [
+        "Iron(III) oxide Fe2O3 was annealed at 300K and 5 GPa .".split(),
+        "The LiFePO4 cathode had a capacity of 160mAh and a ( 3 ) step .".split(),
+        "We studied iron , Iron and Fe films on Cu(111) .".split(),
+    ]
+
+    def test_token_cache(self):
+        """Same output and material mentions with and without the token cache"""
+        uncached = make_data_preparation(token_cache_size=0)
+        cached = make_data_preparation(token_cache_size=5)
+        for sentence in self.SENTENCES * 2:
+            self.assertEqual(cached.process_sentence(sentence, collect_materials=True),
+                             uncached.process_sentence(sentence, collect_materials=True))
+        self.assertEqual(cached.mat_list, uncached.mat_list)
+        self.assertEqual(len(cached._token_cache), 5)
+        self.assertEqual(len(uncached._token_cache), 0)
+        self.assertEqual(cached.process_sentence(["Iron(III)", "160mAh"]),
+                         (["iron", "(III)", "<nUm>", "mAh"], [0, 1]))
+        self.assertIn(("Fe2O3", "Fe2O3"), cached.mat_list)
+
+    def test_collect_materials(self):
+        """Material mentions are only kept when asked for"""
+        dp = make_data_preparation()
+        for sentence in self.SENTENCES:
+            dp.process_sentence(sentence)
+        self.assertEqual(dp.mat_list, [])
+        dp.process_sentence(self.SENTENCES[0], collect_materials=True)
+        self.assertIn(("Fe2O3", "Fe2O3"), dp.mat_list)
+
+    def test_threads(self):
+        dp = make_data_preparation(token_cache_size=8)
+        expected = [make_data_preparation().process_sentence(sentence) for sentence in self.SENTENCES]
+        errors = []
+
+        def run():
+            try:
+                for _ in range(50):
+                    for sentence, output in zip(self.SENTENCES, expected):
+                        if dp.process_sentence(sentence) != output:
+                            errors.append(sentence)
+            except Exception as e:
+                errors.append(e)
+        threads = [threading.Thread(target=run) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertLessEqual(len(dp._token_cache), 8)
+
+
+class TestGetAbstracts(unittest.TestCase):
+    def setUp(self):
+        self.dp = make_data_preparation()
+        self.abstracts = FakeCollection([{"_id": i, "doi": "10.1000/{}".format(i)} for i in range(100)], self.dp._db)
+        setattr(self.dp._db, DataPreparation.RAW_ABSTRACT_COL, self.abstracts)
+        setattr(self.dp._db, DataPreparation.TOK_ABSTRACT_COL, FakeCollection([]))
+
+    def ids(self, abstracts):
+        return [abstract["_id"] for abstract in abstracts]
+
+    def test_natural(self):
+        self.assertEqual(self.ids(self.dp._get_abstracts()), list(range(100)))
+        self.assertEqual(self.ids(self.dp._get_abstracts(limit=5)), list(range(5)))
+        # no limit: nothing to sample, the whole collection is streamed without $sample
+        self.assertEqual(self.ids(self.dp._get_abstracts(sample=True)), list(range(100)))
+        self.assertEqual(self.abstracts.pipelines, [])
+
+    def test_partition(self):
+        partitions = [self.ids(self.dp._get_abstracts(strategy="partition", partition=(i, 3))) for i in range(3)]
+        self.assertEqual(sum(partitions, []), list(range(100)))
+        self.assertEqual(self.ids(self.dp._get_abstracts(partition=(2, 3))), partitions[2])
+        # more partitions than abstracts
+        self.abstracts.docs = self.abstracts.docs[:2]
+        self.assertEqual(self.ids(self.dp._get_abstracts(partition=(3, 4))), [])
+        for partition in [None, (3, 3), (-1, 2), (1,)]:
+            with self.assertRaises(ValueError):
+                self.dp._get_abstracts(strategy="partition", partition=partition)
+        with self.assertRaises(ValueError):
+            self.dp._get_abstracts(strategy="natural", partition=(0, 2))
+
+    def test_sample(self):
+        self.assertEqual(len(list(self.dp._get_abstracts(limit=10, sample=True))), 10)
+        self.assertEqual(self.abstracts.pipelines[-1][-1], {"$sample": {"size": 10}})
+        self.dp._get_abstracts(limit=10, strategy="sample", only_untokenized=True)
+        lookup = self.abstracts.pipelines[-1][1]["$lookup"]
+        self.assertEqual((lookup["localField"], lookup["foreignField"]), ("doi", "doi"))
+        with self.assertRaises(ValueError):
+            self.dp._get_abstracts(strategy="sample")
+        with self.assertRaises(ValueError):
+            self.dp._get_abstracts(limit=10, strategy="shuffle")
+
+    def test_reservoir(self):
+        sample = self.ids(self.dp._get_abstracts(limit=10, strategy="reservoir", seed=1))
+        self.assertEqual(len(sample), 10)
+        self.assertEqual(sample, sorted(set(sample)))
+        self.assertEqual(sample, self.ids(self.dp._get_abstracts(limit=10, strategy="reservoir", seed=1)))
+        self.assertNotEqual(sample, self.ids(self.dp._get_abstracts(limit=10, strategy="reservoir", seed=2)))
+        self.assertEqual(self.ids(self.dp._get_abstracts(limit=200, strategy="reservoir")), list(range(100)))
+        with self.assertRaises(ValueError):
+            self.dp._get_abstracts(strategy="reservoir")
+
+
+class TestTokenizeAbstracts(unittest.TestCase):
+    def setUp(self):
+        self.dp = make_data_preparation()
+        raw = [{"_id": i, "doi": "10.1000/{}".format(i), "title": "Title {}".format(i),
+                "abstract": "We made sample {}. It worked.".format(i)} for i in range(23)]
+        del raw[5]["abstract"]
+        # every third abstract was tokenized by an earlier run
+        self.existing = [{"doi": a["doi"], "title": [["old"]], "abstract": [["old"]], "abstract_id": a["_id"]}
+                         for a in raw[::3]]
+        self.raw = FakeCollection(raw, self.dp._db)
+        self.tokenized = FakeCollection(list(self.existing), self.dp._db)
+        setattr(self.dp._db, DataPreparation.RAW_ABSTRACT_COL, self.raw)
+        setattr(self.dp._db, DataPreparation.TOK_ABSTRACT_COL, self.tokenized)
+
+    def check_tokenized(self, override=False):
+        by_doi = {a["doi"]: a for a in self.tokenized.docs}
+        self.assertEqual(len(by_doi), len(self.tokenized.docs))
+        self.assertEqual(sorted(by_doi), sorted(a["doi"] for a in self.raw.docs))
+        for abstract in self.raw.docs:
+            tokenized = by_doi[abstract["doi"]]
+            self.assertEqual(tokenized["abstract_id"], abstract["_id"])
+            if not override and abstract["_id"] % 3 == 0:
+                self.assertEqual(tokenized["title"], [["old"]])
+            elif "abstract" not in abstract:
+                self.assertIsNone(tokenized["abstract"])
+                self.assertIn("error", tokenized)
+            else:
+                self.assertEqual(tokenized["title"], data_preparation._tokenize(abstract["title"]))
+                self.assertEqual(tokenized["abstract"], data_preparation._tokenize(abstract["abstract"]))
+
+    def test_sequential(self):
+        for existing_check in ["set", "lookup"]:
+            self.tokenized.docs = list(self.existing)
+            self.dp.tokenize_abstracts(existing_check=existing_check)
+            self.check_tokenized()
+
+    def test_parallel(self):
+        """Already tokenized DOIs are skipped, the others written in one bulk write per batch"""
+        for existing_check in ["set", "lookup"]:
+            self.tokenized.docs = list(self.existing)
+            self.tokenized.bulk_writes = []
+            self.dp.tokenize_abstracts(workers=2, batch_size=4, existing_check=existing_check)
+            self.check_tokenized()
+            self.assertEqual([len(requests) for requests in self.tokenized.bulk_writes], [4, 4, 4, 3])
+            self.assertTrue(all(isinstance(request, pymongo.InsertOne)
+                                for requests in self.tokenized.bulk_writes for request in requests))
+        self.assertEqual(self.raw.pipelines[-1][1]["$lookup"]["from"], DataPreparation.TOK_ABSTRACT_COL)
+
+    def test_parallel_override(self):
+        self.dp.tokenize_abstracts(override=True, workers=2, batch_size=10, existing_check="lookup")
+        self.check_tokenized(override=True)
+        self.assertEqual([len(requests) for requests in self.tokenized.bulk_writes], [10, 10, 3])
+        self.assertEqual(self.raw.pipelines, [])
+
+    def test_existing_check(self):
+        with self.assertRaises(ValueError):
+            self.dp.tokenize_abstracts(existing_check="query")
+
+
+class TestToWord2vecZip(unittest.TestCase):
+    def setUp(self):
+        self.dp = make_data_preparation()
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, "abstracts")
+        years = [2015, 2016, None, 2016, 2015, 2016]
+        self.abstracts = [{"_id": i, "doi": "10.1000/{}".format(i), "year": year,
+                           "title": [["Iron", "oxide", "films", str(i)]],
+                           "abstract": [["We", "annealed", "Fe2O3", "at", "300", "K", "."], ["It", "worked", "."]]}
+                          for i, year in enumerate(years)]
+        setattr(self.dp._db, DataPreparation.TOK_ABSTRACT_COL, FakeCollection(self.abstracts, self.dp._db))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def line(self, abstract):
+        dp = make_data_preparation()
+        return "".join(" ".join(dp.process_sentence(sentence)[0] + [""])
+                       for sentence in abstract["title"] + abstract["abstract"]) + "\n"
+
+    def read(self, filename, compression):
+        if compression is None:
+            with open(filename, encoding="utf-8") as f:
+                return f.read()
+        if compression == "gzip":
+            with gzip.open(filename + ".gz", "rt", encoding="utf-8") as f:
+                return f.read()
+        with zipfile.ZipFile(filename + ".zip") as archive:
+            return archive.read(os.path.basename(filename)).decode("utf-8")
+
+    def test_line(self):
+        self.assertEqual(self.line(self.abstracts[0]),
+                         "iron oxide films <nUm> we annealed Fe2O3 at <nUm> K . it worked . \n")
+
+    def test_split_years(self):
+        """Every compression writes the same text, one file per year"""
+        for compression in [None, "gzip", "zip"]:
+            filename = os.path.join(self.tmpdir, str(compression), "abstracts")
+            os.makedirs(os.path.dirname(filename))
+            stats = self.dp.to_word2vec_zip(filename=filename, split_years=True, compression=compression,
+                                            buffer_size=16)
+            self.assertEqual(sorted(stats), ["abstracts", "bytes", "bytes_per_second", "seconds"])
+            self.assertEqual(stats["abstracts"], len(self.abstracts))
+            n_bytes = 0
+            for suffix, year in [("_2015", 2015), ("_2016", 2016), ("", None)]:
+                text = self.read(filename + suffix, compression)
+                self.assertEqual(text, "".join(self.line(a) for a in self.abstracts if a["year"] == year), suffix)
+                n_bytes += len(text.encode("utf-8"))
+            self.assertEqual(stats["bytes"], n_bytes)
+            self.assertGreaterEqual(stats["bytes_per_second"], 0)
+            with open(filename + "_formula.pkl", "rb") as f:
+                self.assertEqual(pickle.load(f)["Fe2O3"], {"Fe2O3": len(self.abstracts)})
+            self.dp.mat_list = []
+
+    def test_only_relevant(self):
+        """Irrelevant abstracts are skipped until limit relevant ones are written"""
+        relevant = [False, True, False, True, True, True]
+        with mock.patch.object(self.dp, "is_relevant", side_effect=relevant) as is_relevant:
+            stats = self.dp.to_word2vec_zip(filename=self.filename, limit=3, only_relevant=True)
+        self.assertEqual(stats["abstracts"], 3)
+        self.assertEqual(is_relevant.call_count, 5)
+        self.assertEqual(self.read(self.filename, None), "".join(self.line(self.abstracts[i]) for i in [1, 3, 4]))
+
+    def test_compression(self):
+        with self.assertRaises(ValueError):
+            self.dp.to_word2vec_zip(filename=self.filename, compression="bz2")
+
+
+if __name__ == '__main__':
+    unittest.main()
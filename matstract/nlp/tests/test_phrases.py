@@ -0,0 +1,38 @@
+import unittest
+from matstract.nlp.phrases import PhraseTokenizer
+
+
+class TestPhraseTokenizer(unittest.TestCase):
+    def __init__(self, *args, **kwargs):
+        """Creates a small vocabulary with words and phrases"""
+        super(TestPhraseTokenizer, self).__init__(*args, **kwargs)
+        self.vocabulary = ["solar", "cell", "cells", "solar_cell", "solar_cells", "efficiency",
+                           "solar_cell_efficiency", "thin", "film", "thin_film", "band", "gap_energy"]
+        self.tokenizer = PhraseTokenizer(self.vocabulary)
+
+    def test_pairs(self):
+        """Same output as the gensim Phraser previously built from the vocabulary"""
+        self.assertEqual(self.tokenizer[["solar", "cell", "efficiency"]], ["solar_cell", "efficiency"])
+        self.assertEqual(self.tokenizer[["thin", "film", "solar", "cells"]], ["thin_film", "solar_cells"])
+        self.assertEqual(self.tokenizer[["solar", "solar", "cell"]], ["solar", "solar_cell"])
+        # only pairs of input tokens are joined, phrased tokens can be joined further
+        self.assertEqual(self.tokenizer[["solar_cell", "efficiency"]], ["solar_cell_efficiency"])
+        # "gap" is not in the vocabulary, so "gap_energy" is never formed from it
+        self.assertEqual(self.tokenizer[["band", "gap", "energy"]], ["band", "gap", "energy"])
+        self.assertEqual(self.tokenizer[[]], [])
+
+    def test_batch(self):
+        sentences = [["solar", "cell"], ["thin", "film"], ["efficiency"]]
+        expected = [["solar_cell"], ["thin_film"], ["efficiency"]]
+        self.assertEqual(self.tokenizer.phrase_sentences(sentences), expected)
+        self.assertEqual(self.tokenizer[sentences], expected)
+
+    def test_longest_match(self):
+        tokenizer = PhraseTokenizer(self.vocabulary, longest_match=True)
+        self.assertEqual(tokenizer[["solar", "cell", "efficiency", "thin", "film"]],
+                         ["solar_cell_efficiency", "thin_film"])
+        self.assertEqual(tokenizer[["solar", "cells", "efficiency"]], ["solar_cells", "efficiency"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,7 +2,8 @@ from dash.dependencies import Input, Output, State
 import dash_html_components as html
 import dash_table_experiments as dt
 import numpy as np
-from matstract.models.word_embeddings import EmbeddingEngine
+from matstract.models.word_embeddings import get_embedding_engine
+from matstract.web.result_cache import get_result_cache
 
 
 def bind(app):
@@ -13,8 +14,12 @@ def bind(app):
         [State('similar_words_input', 'value')])
     def get_similar_words(_, word):
         if word is not None and word != "":
-            ee = EmbeddingEngine()
-            close_words, scores = ee.close_words(word, top_k=8)
+            ee = get_embedding_engine()
+            result_cache = get_result_cache()
+            token = ee.dp.process_sentence([word.replace(" ", "_")])[0][0]
+            close_words, scores = result_cache.get_or_compute(
+                result_cache.make_key("similar_words", [token], top_k=8),
+                lambda: ee.close_words(word, top_k=8))
             print(close_words)
             return dt.DataTable(
                 rows=[{"#": i+1,
@@ -48,23 +53,29 @@ def bind(app):
                 neg_1 != "" and \
                 pos_2 is not None and \
                 pos_2 != "":
-            ee = EmbeddingEngine()
+            ee = get_embedding_engine()
             pos_1 = ee.phraser[ee.dp.process_sentence(pos_1.split())[0]]
             neg_1 = ee.phraser[ee.dp.process_sentence(neg_1.split())[0]]
             pos_2 = ee.phraser[ee.dp.process_sentence(pos_2.split())[0]]
-            pos_1_vec = ee.get_word_vector(pos_1[0])
-            neg_1_vec = ee.get_word_vector(neg_1[0])
-            pos_2_vec = ee.get_word_vector(pos_2[0])
-            if pos_1_vec is not None and neg_1_vec is not None and pos_2_vec is not None:
-                diff_vec = pos_2_vec + pos_1_vec - neg_1_vec
-                norm_diff = diff_vec / np.linalg.norm(diff_vec, axis=0)  # unit length
-                close_words = ee.close_words(norm_diff, exclude_self=False)[0]
-                print(close_words)
-                for close_word in close_words:
-                    if close_word not in [pos_1[0], neg_1[0], pos_2[0]]:
-                        return close_word.replace("_", " ")
-            else:
-                return "?"
+
+            def analogy():
+                pos_1_vec = ee.get_word_vector(pos_1[0])
+                neg_1_vec = ee.get_word_vector(neg_1[0])
+                pos_2_vec = ee.get_word_vector(pos_2[0])
+                if pos_1_vec is not None and neg_1_vec is not None and pos_2_vec is not None:
+                    diff_vec = pos_2_vec + pos_1_vec - neg_1_vec
+                    norm_diff = diff_vec / np.linalg.norm(diff_vec, axis=0)  # unit length
+                    close_words = ee.close_words(norm_diff, exclude_self=False)[0]
+                    print(close_words)
+                    for close_word in close_words:
+                        if close_word not in [pos_1[0], neg_1[0], pos_2[0]]:
+                            return close_word.replace("_", " ")
+                else:
+                    return "?"
+
+            result_cache = get_result_cache()
+            return result_cache.get_or_compute(
+                result_cache.make_key("analogy", [pos_1[0], neg_1[0], pos_2[0]]), analogy)
         else:
             return "?"
 
@@ -1,5 +1,6 @@
 from dash.dependencies import Input, Output, State
-from matstract.models.word_embeddings import EmbeddingEngine, number_to_substring
+from matstract.models.word_embeddings import get_embedding_engine, number_to_substring
+from matstract.web.result_cache import get_result_cache
 from matstract.web.view.matsearch_app import matlist_figure
 from matstract.web.view import trends_app
 from matstract.web.view.summary_app import get_entities
@@ -17,7 +18,7 @@ def bind(app):
          State('has_elements', 'value'), State('n_has_elements', 'value')])
     def get_relevant_materials(_, search_text, n_search_text, plus_elems, minus_elems):
         if search_text is not None and search_text != "":
-            ee = EmbeddingEngine()
+            ee = get_embedding_engine()
 
             # the positive word vectors
             sentence = ee.phraser[ee.dp.process_sentence(search_text.split())[0]]
@@ -26,18 +27,26 @@ def bind(app):
             n_sentence = ee.phraser[ee.dp.process_sentence(n_search_text.split())[0]] \
                 if n_search_text is not None and len(n_search_text) > 0 else None
 
-            # finding materials sorted by similarity
-            most_similar = ee.find_similar_materials(
-                sentence=sentence,
-                n_sentence=n_sentence,
-                min_count=8,
-                use_output_emb=False if ee.dp.is_simple_formula(sentence[0]) else True)
+            def relevant_materials():
+                # finding materials sorted by similarity, filtered by elements
+                most_similar = ee.find_similar_materials(
+                    sentence=sentence,
+                    n_sentence=n_sentence,
+                    min_count=8,
+                    use_output_emb=False if ee.dp.is_simple_formula(sentence[0]) else True,
+                    top_n=65,
+                    plus_elems=plus_elems,
+                    minus_elems=minus_elems)
+                return ee.most_common_form(most_similar)
 
-            # filtering the results by elements and returning top 50
-            elem_filtered = ee.filter_by_elements(most_similar, plus_elems, minus_elems, max=65)
-
-            # display top 50 results
-            matlist = ee.most_common_form(elem_filtered)
+            # display top results
+            result_cache = get_result_cache()
+            matlist = result_cache.get_or_compute(
+                result_cache.make_key("relevant_materials", sentence,
+                                      n_sentence=n_sentence,
+                                      plus_elems=set(plus_elems or []),
+                                      minus_elems=set(minus_elems or [])),
+                relevant_materials)
             material_names, material_scores, material_counts, _ = zip(*matlist)
             return matlist_figure([number_to_substring(name) for name in material_names], material_scores, material_counts)
         else:
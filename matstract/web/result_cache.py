@@ -0,0 +1,194 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+class MemoryBackend:
+    """
+    In-process LRU store of pickled values, bounded by the number of entries and their total size
+    """
+
+    def __init__(self, max_entries=1000, max_bytes=64 * 1024 ** 2):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+            return data
+
+    def set(self, key, data):
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= len(self._entries.pop(key))
+            self._entries[key] = data
+            self._bytes += len(data)
+            while len(self._entries) > self.max_entries or (self._bytes > self.max_bytes and len(self._entries) > 1):
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class FileSystemBackend:
+    """
+    LRU store of pickled values in a directory, shared by all processes that use the same directory
+    (e.g. all gunicorn workers). Pointing it to a tmpfs such as /dev/shm keeps the entries in shared memory.
+    Recency is tracked by file modification times, which are refreshed on every read.
+    """
+
+    def __init__(self, directory, max_entries=10000, max_bytes=512 * 1024 ** 2, evict_every=50):
+        """
+        :param directory: the cache directory, created if it does not exist
+        :param max_entries: maximum number of cached results
+        :param max_bytes: maximum total size of the cached results
+        :param evict_every: the directory is scanned for eviction after this many writes from one process
+        """
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.evict_every = evict_every
+        self._writes = 0
+        if not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".pkl")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+            return data
+        except (IOError, OSError):
+            return None
+
+    def set(self, key, data):
+        # write to a temporary file first so other processes never read a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self._path(key))
+        self._writes += 1
+        if self._writes % self.evict_every == 0:
+            self.evict()
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the limits are met
+        """
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".pkl"):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue  # removed by another process
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+        total_bytes = sum(size for _, size, _ in entries)
+        n_entries = len(entries)
+        for _, size, path in entries:
+            if n_entries <= self.max_entries and total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            n_entries -= 1
+            total_bytes -= size
+
+    def __len__(self):
+        return sum(1 for name in os.listdir(self.directory) if name.endswith(".pkl"))
+
+
+class ResultCache:
+    """
+    Cache for the results of expensive queries (similar words, analogies, material search), keyed on
+    the processed query tokens and the query parameters so that different spellings of the same
+    query share one entry.
+
+    Example usage:
+    >>> cache = ResultCache(MemoryBackend(max_entries=500))
+    >>> key = cache.make_key("similar_words", ["thermoelectric"], top_k=8)
+    >>> result = cache.get_or_compute(key, lambda: ee.close_words("thermoelectric"))
+    >>> cache.stats()
+    {'hits': 0, 'misses': 1, 'entries': 1}
+
+    The hit and miss counters are per process; the entries are shared if the backend is.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(namespace, tokens, **params):
+        """
+        Builds a cache key
+        :param namespace: name of the query type, e.g. "similar_words"
+        :param tokens: the processed (and phrased) query tokens
+        :param params: other parameters that change the result, e.g. element filters; pass unordered
+        parameters as sets so that their order does not matter
+        :return: a hex digest
+        """
+        normalized_params = sorted((name, sorted(value) if isinstance(value, (set, frozenset)) else value)
+                                   for name, value in params.items())
+        description = repr((namespace, list(tokens) if tokens is not None else None, normalized_params))
+        return hashlib.sha1(description.encode("utf-8")).hexdigest()
+
+    def get(self, key, default=None):
+        data = self.backend.get(key)
+        if data is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return pickle.loads(data)
+
+    def set(self, key, value):
+        self.backend.set(key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+
+    def get_or_compute(self, key, compute):
+        """
+        Returns the cached result for the key, or computes, caches and returns it
+        :param key: a key from make_key
+        :param compute: function without arguments that computes the result
+        :return: the result
+        """
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = compute()
+            self.set(key, value)
+        return value
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.backend)}
+
+
+_result_cache = None
+
+
+def get_result_cache():
+    """
+    Returns the result cache shared by the callbacks of this process. If the MATSTRACT_RESULT_CACHE_DIR
+    environment variable is set, entries are stored in that directory and shared by all workers,
+    otherwise they are kept in process memory.
+    """
+    global _result_cache
+    if _result_cache is None:
+        directory = os.environ.get("MATSTRACT_RESULT_CACHE_DIR")
+        _result_cache = ResultCache(FileSystemBackend(directory) if directory else MemoryBackend())
+    return _result_cache
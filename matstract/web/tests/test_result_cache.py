@@ -0,0 +1,78 @@
+import os
+import tempfile
+import unittest
+from matstract.web.result_cache import MemoryBackend, FileSystemBackend, ResultCache
+
+
+class TestMemoryBackend(unittest.TestCase):
+    def test_max_entries(self):
+        backend = MemoryBackend(max_entries=2)
+        backend.set("a", b"1")
+        backend.set("b", b"2")
+        backend.set("c", b"3")
+        self.assertEqual(len(backend), 2)
+        self.assertIsNone(backend.get("a"))
+        self.assertEqual(backend.get("c"), b"3")
+
+    def test_max_bytes(self):
+        backend = MemoryBackend(max_entries=10, max_bytes=10)
+        backend.set("a", b"x" * 4)
+        backend.set("b", b"x" * 4)
+        backend.set("c", b"x" * 4)
+        self.assertEqual(len(backend), 2)
+        self.assertIsNone(backend.get("a"))
+        # a single entry larger than max_bytes is still kept
+        backend.set("d", b"x" * 20)
+        self.assertEqual(len(backend), 1)
+        self.assertEqual(backend.get("d"), b"x" * 20)
+
+    def test_get_updates_recency(self):
+        backend = MemoryBackend(max_entries=2)
+        backend.set("a", b"1")
+        backend.set("b", b"2")
+        backend.get("a")
+        backend.set("c", b"3")
+        self.assertEqual(backend.get("a"), b"1")
+        self.assertIsNone(backend.get("b"))
+
+
+class TestFileSystemBackend(unittest.TestCase):
+    def test_round_trip_and_evict(self):
+        with tempfile.TemporaryDirectory() as directory:
+            backend = FileSystemBackend(directory, max_entries=2, evict_every=1000)
+            for i, key in enumerate(["a", "b", "c"]):
+                backend.set(key, key.encode("utf-8"))
+                # explicit modification times, the file system resolution may be coarse
+                os.utime(backend._path(key), (i, i))
+            self.assertEqual(len(backend), 3)
+            self.assertIsNone(backend.get("missing"))
+            self.assertEqual(backend.get("a"), b"a")  # now the most recently used
+            backend.evict()
+            self.assertEqual(len(backend), 2)
+            self.assertIsNone(backend.get("b"))
+            self.assertEqual(backend.get("a"), b"a")
+            self.assertEqual(backend.get("c"), b"c")
+
+
+class TestResultCache(unittest.TestCase):
+    def test_make_key(self):
+        key = ResultCache.make_key("relevant_materials", ["thermoelectric"], plus_elems={"Bi", "Te", "Sb"},
+                                   minus_elems=frozenset(["Pb", "Se"]), top_n=65)
+        self.assertEqual(key, ResultCache.make_key("relevant_materials", ["thermoelectric"], top_n=65,
+                                                   minus_elems={"Se", "Pb"},
+                                                   plus_elems=frozenset(["Sb", "Te", "Bi"])))
+        self.assertNotEqual(key, ResultCache.make_key("relevant_materials", ["thermoelectric"],
+                                                      plus_elems={"Bi", "Te"}, minus_elems={"Pb", "Se"}, top_n=65))
+        self.assertNotEqual(key, ResultCache.make_key("similar_words", ["thermoelectric"],
+                                                      plus_elems={"Bi", "Te", "Sb"}, minus_elems={"Pb", "Se"},
+                                                      top_n=65))
+
+    def test_get_or_compute(self):
+        cache = ResultCache(MemoryBackend())
+        key = cache.make_key("similar_words", ["oxide"], top_k=8)
+        calls = []
+        for _ in range(2):
+            value = cache.get_or_compute(key, lambda: calls.append(1) or (["oxides"], [0.9]))
+        self.assertEqual(value, (["oxides"], [0.9]))
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(cache.stats(), {"hits": 1, "misses": 1, "entries": 1})
@@ -50,15 +50,20 @@ def highlight_multiple_materials(body, materials):
     return body
 
 
-def to_highlight(names_list, material):
+def to_highlight(names_list, material, material_hash=None):
     parser = parsing.SimpleParser()
+    if material_hash is None:
+        material_hash = parser.composition_hash(material)
     for name in names_list:
-        if parser.matgen_parser(name) == parser.matgen_parser(material):
+        if parser.composition_hash(name) == material_hash:
             return material
 
 
 def sort_df(test_df, materials):
-    test_df['to_highlight'] = test_df['chem_mentions'].apply(to_highlight, material=materials)
+    # the query material is parsed once, rows only compare composition hashes
+    material_hash = parsing.SimpleParser().composition_hash(materials)
+    test_df['to_highlight'] = test_df['chem_mentions'].apply(to_highlight, material=materials,
+                                                             material_hash=material_hash)
     test_df['count'] = test_df.apply(lambda x: x['abstract'].count(x['to_highlight']), axis=1)
     test_df.sort_values(by='count', axis=0, ascending=False, inplace=True)
     return test_df
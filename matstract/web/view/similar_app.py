@@ -73,16 +73,20 @@ def find_similar(abstract="", max_results=100):
     return ids
 
 
-def to_highlight(names_list, material):
+def to_highlight(names_list, material, material_hash=None):
     parser = parsing.SimpleParser()
-    names = []
+    if material_hash is None:
+        material_hash = parser.composition_hash(material)
     for name in names_list:
-        if 'names' in name.keys() and parser.matgen_parser(name['names'][0]) == parser.matgen_parser(material):
+        if 'names' in name.keys() and parser.composition_hash(name['names'][0]) == material_hash:
             return name['names'][0]
 
 
 def sort_df(test_df, materials):
-    test_df['to_highlight'] = test_df['chem_mentions'].apply(to_highlight, material=materials)
+    # the query material is parsed once, rows only compare composition hashes
+    material_hash = parsing.SimpleParser().composition_hash(materials)
+    test_df['to_highlight'] = test_df['chem_mentions'].apply(to_highlight, material=materials,
+                                                             material_hash=material_hash)
     test_df['count'] = test_df.apply(lambda x: x['abstract'].count(x['to_highlight']), axis=1)
     test_df.sort_values(by='count', axis=0, ascending=False, inplace=True)
     return test_df